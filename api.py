@@ -0,0 +1,237 @@
+#----------------------------------------------------------------------------#
+# JSON API, version 1.
+#
+#   GET /api/v1/venues?city=&state=&genre=&fields=id,name&after=&per_page=
+#   GET /api/v1/venues/<id>?fields=
+#   GET /api/v1/artists ... /api/v1/artists/<id>    (same parameters)
+#   GET /api/v1/shows?venue_id=&artist_id=&city=&state=&fields=&after=
+#   POST /api/v1/shows/availability  {"slots": [{"venue_id", "artist_id",
+#                                               "start_time", "duration"}]}
+#
+# `fields` narrows the SELECT itself, so unrequested columns and joins are
+# never read. `id` is always returned; `genres` costs one grouped query per
+# page. Show counts are the materialized counters (see counters.py). Lists page by keyset like the HTML
+# listings and link the next page in `next`.
+#----------------------------------------------------------------------------#
+
+import json
+from datetime import datetime, timedelta
+
+from flask import Blueprint, abort, current_app, request, url_for
+from werkzeug.exceptions import HTTPException
+
+from database import read_only
+from scheduling import DEFAULT_DURATION, MAX_DURATION, find_conflicts
+from pagination import keyset_page
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def json_response(value, status=200):
+    return current_app.response_class(dumps(value), status=status, mimetype='application/json')
+
+
+# The app's own 404 and 500 handlers render HTML and, being registered by
+# code, win over a class handler here; so the codes are listed explicitly.
+@api_v1.errorhandler(400)
+@api_v1.errorhandler(404)
+@api_v1.errorhandler(500)
+@api_v1.errorhandler(HTTPException)
+def http_error(error):
+    return json_response({'error': error.description}, error.code)
+
+
+def requested_fields(available, default):
+    if 'fields' not in request.args:
+        return list(default)
+    fields = [name.strip() for name in request.args['fields'].split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        abort(400, 'Unknown field(s): %s' % ', '.join(unknown))
+    return ['id'] + [name for name in fields if name != 'id']
+
+
+def next_link(next_cursor, **kwargs):
+    if next_cursor is None:
+        return None
+    args = request.args.to_dict()
+    args.update(kwargs, after=next_cursor)
+    return url_for(request.endpoint, **args)
+
+
+#  Venues and artists
+#  ----------------------------------------------------------------
+
+def profile_columns(model):
+    names = ['id', 'name', 'city', 'state', 'address', 'latitude', 'longitude', 'phone', 'image_link',
+             'image_link_ok', 'facebook_link', 'website', 'seeking_talent', 'seeking_venue', 'seeking_description',
+             'upcoming_shows_count', 'past_shows_count']
+    return {name: getattr(model, name) for name in names if hasattr(model, name)}
+
+
+def profile_rows(model, association_owner_id, owner_id=None):
+    from helpers import filter_by_genre
+    from models import db, Genre
+
+    columns = profile_columns(model)
+    fields = requested_fields(list(columns) + ['genres'], list(columns) + ['genres'])
+    selected = [name for name in fields if name in columns]
+    query = db.session.query(*(columns[name].label(name) for name in selected))
+
+    if owner_id is not None:
+        row = query.filter(model.id == owner_id).first()
+        if row is None:
+            abort(404, 'No such %s.' % model.__name__.lower())
+        rows, next_cursor = [row], None
+    else:
+        for name in ('city', 'state'):
+            if request.args.get(name):
+                query = query.filter(columns[name] == request.args[name])
+        if request.args.get('genre'):
+            query = filter_by_genre(query, model.id, association_owner_id, request.args['genre'])
+        rows, next_cursor = keyset_page(query, (model.id,), key=lambda row: (row.id,))
+
+    data = [dict(zip(selected, row)) for row in rows]
+    ids = [item['id'] for item in data]
+    if 'genres' in fields:
+        association = association_owner_id.table
+        genres = {id: [] for id in ids}
+        if ids:
+            for id, name in db.session.query(association_owner_id, Genre.name).join(
+                Genre, Genre.id == association.c.genre_id
+            ).filter(association_owner_id.in_(ids)).order_by(Genre.name):
+                genres[id].append(name)
+        for item in data:
+            item['genres'] = genres[item['id']]
+    return data, next_cursor
+
+
+@api_v1.route('/venues')
+@read_only
+def venues():
+    from models import Venue, venue_genres
+    data, next_cursor = profile_rows(Venue, venue_genres.c.venue_id)
+    return json_response({'data': data, 'next': next_link(next_cursor)})
+
+
+@api_v1.route('/venues/<int:venue_id>')
+@read_only
+def venue(venue_id):
+    from models import Venue, venue_genres
+    data, _ = profile_rows(Venue, venue_genres.c.venue_id, venue_id)
+    return json_response({'data': data[0]})
+
+
+@api_v1.route('/artists')
+@read_only
+def artists():
+    from models import Artist, artist_genres
+    data, next_cursor = profile_rows(Artist, artist_genres.c.artist_id)
+    return json_response({'data': data, 'next': next_link(next_cursor)})
+
+
+@api_v1.route('/artists/<int:artist_id>')
+@read_only
+def artist(artist_id):
+    from models import Artist, artist_genres
+    data, _ = profile_rows(Artist, artist_genres.c.artist_id, artist_id)
+    return json_response({'data': data[0]})
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api_v1.route('/shows')
+@read_only
+def shows():
+    from models import db, Show, Venue, Artist
+
+    columns = {
+        'id': Show.id,
+        'start_time': Show.start_time,
+        'end_time': Show.end_time,
+        'venue_id': Show.venue_id,
+        'venue_name': Venue.name,
+        'artist_id': Show.artist_id,
+        'artist_name': Artist.name,
+        'artist_image_link': Artist.image_link,
+    }
+    fields = requested_fields(columns, columns)
+    # start_time is the sort key, so it is read even when not returned.
+    selected = fields + ([] if 'start_time' in fields else ['start_time'])
+    query = db.session.query(*(columns[name].label(name) for name in selected)).select_from(Show)
+    if 'venue_name' in selected or request.args.get('city') or request.args.get('state'):
+        query = query.join(Venue, Venue.id == Show.venue_id)
+    if 'artist_name' in selected or 'artist_image_link' in selected:
+        query = query.join(Artist, Artist.id == Show.artist_id)
+    for name in ('venue_id', 'artist_id'):
+        if request.args.get(name):
+            id = request.args.get(name, type=int)
+            if id is None:
+                abort(400, '%s must be an integer.' % name)
+            query = query.filter(columns[name] == id)
+    for name in ('city', 'state'):
+        if request.args.get(name):
+            query = query.filter(getattr(Venue, name) == request.args[name])
+
+    rows, next_cursor = keyset_page(query, (Show.start_time, Show.id),
+                                    key=lambda row: (row.start_time, row.id))
+    data = [{name: getattr(row, name) for name in fields} for row in rows]
+    return json_response({'data': data, 'next': next_link(next_cursor)})
+
+
+def parse_slot(slot):
+    try:
+        venue_id, artist_id = int(slot['venue_id']), int(slot['artist_id'])
+        start = datetime.fromisoformat(slot['start_time'])
+        if start.tzinfo is not None:
+            # Shows are stored in naive local time; see shows.date_range().
+            start = start.astimezone().replace(tzinfo=None)
+        duration = timedelta(minutes=int(slot.get('duration', DEFAULT_DURATION)))
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not timedelta(0) < duration <= MAX_DURATION:
+        return None
+    return venue_id, artist_id, start, start + duration
+
+
+@api_v1.route('/shows/availability', methods=['POST'])
+@read_only
+def availability():
+    # Checks a batch of proposed shows against the booked ones and each other
+    # in a single query; the answer lists the clashes of every slot in order.
+    from models import db, Show
+
+    body = request.get_json(silent=True)
+    slots = body.get('slots') if isinstance(body, dict) else None
+    if not isinstance(slots, list):
+        abort(400, 'Expected {"slots": [...]}.')
+    limit = current_app.config['AVAILABILITY_MAX_SLOTS']
+    if len(slots) > limit:
+        abort(400, 'At most %d slots per request.' % limit)
+    parsed = [parse_slot(slot) if isinstance(slot, dict) else None for slot in slots]
+    invalid = [index for index, slot in enumerate(parsed) if slot is None]
+    if invalid:
+        abort(400, 'Invalid slot(s) at index %s.' % ', '.join(map(str, invalid)))
+
+    conflicts = find_conflicts(db.session, Show, parsed)
+    return json_response({'data': [
+        {'available': not clashes, 'conflicts': clashes} for clashes in conflicts
+    ]})
@@ -0,0 +1,134 @@
+#----------------------------------------------------------------------------#
+# Production logging.
+#
+# Request threads only put records on a bounded in-memory queue; a single
+# QueueListener thread formats them and does the file writes and rotation.
+# When the disk falls behind and the queue fills up, new records are dropped
+# and counted instead of making requests wait. A forked worker, which has the
+# queue but not the listener thread, starts its own; all of them write to the
+# one LOG_FILE, so with several workers leave rotation to logrotate
+# (LOG_MAX_BYTES = 0): each process would rotate the file on its own.
+#----------------------------------------------------------------------------#
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s]: %(message)s [in %(pathname)s:%(lineno)d]'
+
+
+class RequestIdFilter(logging.Filter):
+    # Handler filters run in the thread that logs, while the request is live.
+
+    def filter(self, record):
+        record.request_id = g.get('request_id', '-') if has_request_context() else '-'
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+
+    def __init__(self, queue):
+        super(DroppingQueueHandler, self).__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only merge the arguments into the message here; formatting, the
+        # traceback included, is left to the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage(),
+            'path': record.pathname,
+            'line': record.lineno,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def file_handler(app):
+    path = app.config.get('LOG_FILE', 'error.log')
+    when = app.config.get('LOG_ROTATE_WHEN')
+    backups = app.config.get('LOG_BACKUP_COUNT', 5)
+    if when:
+        handler = TimedRotatingFileHandler(path, when=when, backupCount=backups, encoding='utf-8')
+    else:
+        handler = RotatingFileHandler(path, maxBytes=app.config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+                                      backupCount=backups, encoding='utf-8')
+    if app.config.get('LOG_FORMAT', 'text') == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def start_listener(handler, target):
+    listener = QueueListener(handler.queue, target, respect_handler_level=True)
+    listener.start()
+    pid = os.getpid()
+    # A forked child must not wait on its parent's thread at exit.
+    atexit.register(lambda: os.getpid() == pid and listener.stop())
+
+
+def init_logging(app, loggers=('fyyur',)):
+    # Returns the queue handler; its `dropped` counts records lost to a full
+    # queue.
+    level = app.config.get('LOG_LEVEL', 'INFO')
+    handler = DroppingQueueHandler(queue.Queue(app.config.get('LOG_QUEUE_SIZE', 10000)))
+    handler.addFilter(RequestIdFilter())
+    handler.setLevel(level)
+    target = file_handler(app)
+    start_listener(handler, target)
+
+    def after_fork():
+        # The parent's listener may have held the queue's lock at the fork.
+        handler.queue = queue.Queue(handler.queue.maxsize)
+        start_listener(handler, target)
+
+    os.register_at_fork(after_in_child=after_fork)
+
+    # Flask's own handler writes to stderr on the request thread.
+    app.logger.removeHandler(default_handler)
+    for logger in [app.logger] + [logging.getLogger(name) for name in loggers]:
+        logger.setLevel(level)
+        logger.addHandler(handler)
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+    @app.after_request
+    def echo_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
+    return handler
@@ -0,0 +1,212 @@
+#----------------------------------------------------------------------------#
+# Artist pages.
+#
+# Like the venue pages, these import their form classes on first use.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+
+from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, url_for
+
+from conditional import conditional
+from database import read_only
+from extensions import view_cache
+from helpers import (detail_validators, filter_by_genre, genre_facet, genre_names, genres_named,
+                     listing_validators, match_profile, partition_shows, queue_image_check, queue_match_refresh,
+                     ranked_matches, search_response, show_calendar)
+from models import db, Artist, Show, Venue, artist_genres, artist_matches, artist_search
+from pagination import keyset_page
+
+artist_pages = Blueprint('artists', __name__)
+
+
+def fill_artist(artist, form):
+    artist.name = form.name.data
+    artist.city = form.city.data
+    artist.state = form.state.data
+    artist.phone = form.phone.data
+    if artist.image_link != form.image_link.data:
+        artist.image_link_ok = None
+    artist.image_link = form.image_link.data
+    artist.facebook_link = form.facebook_link.data
+    artist.genres = genres_named(form.genres.data)
+    artist.website = form.website_link.data
+    artist.seeking_venue = form.seeking_venue.data
+    artist.seeking_description = form.seeking_description.data
+    artist.updated_at = datetime.utcnow()
+
+
+#  Listing
+#  ----------------------------------------------------------------
+
+@artist_pages.route('/artists')
+@read_only
+@conditional(lambda: listing_validators(Artist))
+@view_cache.cached
+def artists():
+    query = db.session.query(Artist.id, Artist.name)
+    genre = request.args.get('genre')
+    if genre:
+        query = filter_by_genre(query, Artist.id, artist_genres.c.artist_id, genre)
+    rows, next_cursor = keyset_page(query, (Artist.id,), key=lambda row: (row.id,))
+    # New artists always sort last, so only the final page needs their tag.
+    view_cache.tag('genres:artists', *('artist:%d' % row.id for row in rows))
+    if next_cursor is None:
+        view_cache.tag('artists:tail')
+    data = [{"id": id, "name": name} for id, name in rows]
+    genres = genre_facet(artist_genres, artist_genres.c.artist_id)
+    return render_template('pages/artists.html', artists=data, genres=genres, next_cursor=next_cursor)
+
+
+@artist_pages.route('/artists/search', methods=['POST'])
+@read_only
+def search_artists():
+    # case-insensitive partial match, ranked and paginated; see search.py
+    response = search_response(artist_search, Artist)
+    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+
+
+@artist_pages.route('/artists/<int:artist_id>')
+@read_only
+@conditional(lambda artist_id: detail_validators(Artist, artist_id, Show.artist_id, Venue, Show.venue_id,
+                                                  (artist_matches.c.artist_id, artist_matches.c.venue_id)))
+@view_cache.cached
+def show_artist(artist_id):
+    # shows the artist page with the given artist_id
+    now = datetime.now()
+    artist = Artist.query.options(db.joinedload(Artist.genres)).filter(Artist.id == artist_id).first()
+    if artist is None:
+        abort(404)
+    past_shows, upcoming_shows = partition_shows(Show.artist_id, artist_id, Show.venue, now)
+    view_cache.tag('artist:%d' % artist_id, *('venue:%d' % show.venue_id for show in past_shows + upcoming_shows))
+    matches = ranked_matches(artist_matches, artist_matches.c.artist_id, Venue, artist_matches.c.venue_id, artist_id)
+    view_cache.tag(*('venue:%d' % id for id, _, _ in matches))
+
+    def venue_show(show):
+        return {
+            "venue_id": show.venue_id,
+            "venue_name": show.venue.name,
+            "venue_image_link": show.venue.image_link,
+            "start_time": show.start_time,
+        }
+
+    data = {
+        "id": artist.id,
+        "name": artist.name,
+        "genres": genre_names(artist.genres),
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "website": artist.website,
+        "facebook_link": artist.facebook_link,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+        "image_link": artist.image_link,
+        "past_shows": [venue_show(show) for show in past_shows],
+        "upcoming_shows": [venue_show(show) for show in upcoming_shows],
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
+        "matches": [{
+            "venue_id": id,
+            "venue_name": name,
+            "venue_image_link": image_link,
+        } for id, name, image_link in matches],
+    }
+    return render_template('pages/show_artist.html', artist=data)
+
+
+@artist_pages.route('/artists/<int:artist_id>/calendar.ics')
+@read_only
+@conditional(lambda artist_id: detail_validators(Artist, artist_id, Show.artist_id, Venue, Show.venue_id))
+def artist_calendar(artist_id):
+    # upcoming shows as an iCalendar feed for calendar apps to subscribe to;
+    # their polls mostly end in a 304 from the validators
+    name = db.session.query(Artist.name).filter(Artist.id == artist_id).scalar()
+    if name is None:
+        abort(404)
+    return show_calendar('Upcoming shows by %s' % name, Show.artist_id, artist_id)
+
+
+#  Create Artist
+#  ----------------------------------------------------------------
+
+@artist_pages.route('/artists/create', methods=['GET'])
+def create_artist_form():
+    from forms import ArtistForm
+    form = ArtistForm()
+    return render_template('forms/new_artist.html', form=form)
+
+
+@artist_pages.route('/artists/create', methods=['POST'])
+def create_artist_submission():
+    # called upon submitting the new artist listing form
+    from forms import ArtistForm
+    form = ArtistForm(request.form)
+    if not form.validate():
+        flash('An error occurred. Artist ' + request.form.get('name', '') + ' could not be listed.')
+        return render_template('forms/new_artist.html', form=form)
+    error = False
+    try:
+        artist = Artist()
+        fill_artist(artist, form)
+        db.session.add(artist)
+        db.session.commit()
+        view_cache.invalidate('artists:tail', 'genres:artists')
+        queue_image_check('artist', artist)
+        if artist.seeking_venue:
+            queue_match_refresh('artist', artist.id, artist.updated_at.isoformat())
+    except Exception:
+        error = True
+        db.session.rollback()
+        current_app.logger.exception('Could not create artist')
+    finally:
+        db.session.close()
+    if error:
+        flash('An error occurred. Artist ' + form.name.data + ' could not be listed.')
+    else:
+        flash('Artist ' + form.name.data + ' was successfully listed!')
+    return render_template('pages/home.html')
+
+
+#  Update
+#  ----------------------------------------------------------------
+
+@artist_pages.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+    from forms import ArtistForm
+    artist = Artist.query.get_or_404(artist_id)
+    form = ArtistForm(obj=artist)
+    form.genres.data = genre_names(artist.genres)
+    form.website_link.data = artist.website
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+
+@artist_pages.route('/artists/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+    from forms import ArtistForm
+    artist = Artist.query.get_or_404(artist_id)
+    form = ArtistForm(request.form)
+    if not form.validate():
+        flash('An error occurred. Artist ' + artist.name + ' could not be updated.')
+        return render_template('forms/edit_artist.html', form=form, artist=artist)
+    genres = genre_names(artist.genres)
+    image_link = artist.image_link
+    profile = match_profile(artist, artist.seeking_venue)
+    try:
+        fill_artist(artist, form)
+        db.session.commit()
+        view_cache.invalidate('artist:%d' % artist_id)
+        if genre_names(artist.genres) != genres:
+            view_cache.invalidate('genres:artists')
+        if artist.image_link != image_link:
+            queue_image_check('artist', artist)
+        if match_profile(artist, artist.seeking_venue) != profile:
+            queue_match_refresh('artist', artist_id, artist.updated_at.isoformat())
+        flash('Artist ' + form.name.data + ' was successfully updated!')
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Could not update artist %s', artist_id)
+        flash('An error occurred. Artist ' + form.name.data + ' could not be updated.')
+    finally:
+        db.session.close()
+    return redirect(url_for('.show_artist', artist_id=artist_id))
@@ -0,0 +1,182 @@
+#----------------------------------------------------------------------------#
+# Static asset pipeline.
+#
+#   flask fyyur assets
+#
+# Concatenates and minifies the CSS and JS bundles below and copies every
+# other file under static/ too. All outputs go to static/dist/ with a content
+# hash in the name, plus .gz (and .br when the brotli package is installed)
+# siblings for text files. static/dist/manifest.json maps the source names to
+# the hashed ones. Templates ask for asset_url('img/x.jpg') and
+# asset_urls('main.css'): before a build they return the plain /static/
+# sources, after one the hashed files. Those are served from /static/dist/
+# with an immutable one-year Cache-Control and the best precompressed variant
+# the client accepts.
+#
+# Bundles stay directly under static/dist/ so the relative url(../fonts/...)
+# references inside the CSS still resolve.
+#----------------------------------------------------------------------------#
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import abort, current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+from commands import fyyur_cli
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+BUNDLES = {
+    'main.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+                 'css/main.responsive.css', 'css/main.quickfix.css'],
+    # Loaded synchronously in <head>.
+    'head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    # Deferred, after jQuery at the end of <body>.
+    'main.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+
+DIST = 'dist'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.eot', '.ttf', '.otf')
+ONE_YEAR = 365 * 24 * 3600
+
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    # Without rjsmin the sources are only concatenated; the large ones are
+    # shipped minified already.
+    return rjsmin.jsmin(source) if rjsmin is not None else source
+
+
+def fingerprint(name, content):
+    root, ext = os.path.splitext(name)
+    return '%s.%s%s' % (root, hashlib.sha256(content).hexdigest()[:12], ext)
+
+
+def write_output(dist_dir, name, content):
+    path = os.path.join(dist_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    if name.endswith(COMPRESSIBLE):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(content, 9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(content, quality=11))
+
+
+def build(static_dir):
+    # Writes static/dist and returns the manifest. Outputs of earlier builds
+    # are left in place: pages rendered before a deploy, cached or already in
+    # a browser, still reference them.
+    dist_dir = os.path.join(static_dir, DIST)
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest = {}
+
+    for bundle, sources in sorted(BUNDLES.items()):
+        parts = []
+        for source in sources:
+            with open(os.path.join(static_dir, source), encoding='utf-8') as f:
+                parts.append(f.read())
+        if bundle.endswith('.css'):
+            content = '\n'.join(minify_css(part) for part in parts)
+        else:
+            content = ';\n'.join(minify_js(part) for part in parts)
+        content = content.encode('utf-8')
+        manifest[bundle] = fingerprint(bundle, content)
+        write_output(dist_dir, manifest[bundle], content)
+
+    for directory, dirnames, filenames in os.walk(static_dir):
+        if directory == static_dir:
+            dirnames.remove(DIST)
+        for filename in filenames:
+            name = os.path.relpath(os.path.join(directory, filename), static_dir).replace(os.sep, '/')
+            with open(os.path.join(directory, filename), 'rb') as f:
+                content = f.read()
+            manifest[name] = fingerprint(name, content)
+            write_output(dist_dir, manifest[name], content)
+
+    with open(os.path.join(dist_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class Assets(object):
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.dist_dir = os.path.join(app.static_folder, DIST)
+        try:
+            with open(os.path.join(self.dist_dir, 'manifest.json')) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+        app.add_url_rule('/static/dist/<path:filename>', 'assets', self.serve)
+        app.jinja_env.globals.update(asset_url=self.url, asset_urls=self.urls)
+
+    def url(self, name):
+        if name in self.manifest:
+            return url_for('assets', filename=self.manifest[name])
+        return url_for('static', filename=name)
+
+    def urls(self, bundle):
+        if bundle in self.manifest:
+            return [self.url(bundle)]
+        return [url_for('static', filename=source) for source in BUNDLES[bundle]]
+
+    def serve(self, filename):
+        if filename.endswith(('.gz', '.br')) or filename == 'manifest.json':
+            abort(404)
+        path = safe_join(self.dist_dir, filename)
+        if path is None:
+            abort(404)
+        variant, encoding = filename, None
+        for suffix, coding in (('.br', 'br'), ('.gz', 'gzip')):
+            if request.accept_encodings[coding] > 0 and os.path.isfile(path + suffix):
+                variant, encoding = filename + suffix, coding
+                break
+        response = send_from_directory(
+            self.dist_dir, variant,
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            etag=os.path.basename(variant), max_age=ONE_YEAR)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+@fyyur_cli.command('assets')
+def assets_command():
+    """Bundle, fingerprint and precompress the static assets."""
+    from extensions import view_cache
+    manifest = build(current_app.static_folder)
+    view_cache.clear()
+    click.echo('Wrote %d assets to %s' % (len(manifest), os.path.join(current_app.static_folder, DIST)))
+    if brotli is None:
+        click.echo('brotli is not installed; only .gz variants were written.')
@@ -0,0 +1,296 @@
+#----------------------------------------------------------------------------#
+# Route benchmarks.
+#
+#   flask fyyur bench [--requests 200] [--out bench.json] [--baseline FILE]
+#                     [--save-baseline] [--only 'venues*'] [--no-cache]
+#
+# Sends every page and API route (listings, detail pages, searches, forms,
+# creates and edits) through the Flask test client, so the numbers cover the
+# app and its queries without a server or network in between. Each scenario
+# gets a few warm-up requests, then --requests timed ones; the results are
+# throughput and p50/p95/p99 latency per scenario, written as JSON. Given a
+# baseline from an earlier run, the command fails when a scenario's p50 or
+# p95 grew, or its throughput dropped, by more than BENCH_TOLERANCE (and by
+# at least BENCH_FLOOR_MS, below which timings are noise).
+#
+# Creates and edits write to the database: run it against a scratch database
+# filled by `flask fyyur generate`. Request parameters are drawn from a seeded
+# random stream, so two runs against the same data send the same requests.
+#----------------------------------------------------------------------------#
+
+import fnmatch
+import json
+import platform
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import pass_script_info
+
+from commands import fyyur_cli, to_formdata
+
+
+class Scenario(object):
+
+    def __init__(self, name, method, path, data=None, json=None, writes=False):
+        # `path`, `data` and `json` are functions of (rng, context) for the
+        # parts that vary per request.
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.json = json
+        self.writes = writes
+
+    def request(self, rng, context):
+        kwargs = {'method': self.method}
+        if self.data is not None:
+            kwargs['data'] = to_formdata(self.data(rng, context))
+        if self.json is not None:
+            kwargs['json'] = self.json(rng, context)
+        return self.path(rng, context), kwargs
+
+
+def constant(value):
+    return lambda rng, context: value
+
+
+def pick(kind, template):
+    return lambda rng, context: template % rng.choice(context[kind])
+
+
+def search_term(rng, context):
+    from datagen import ADJECTIVES, BAND_NOUNS, PLACE_NOUNS
+    return {'search_term': rng.choice(ADJECTIVES + PLACE_NOUNS + BAND_NOUNS)[:rng.randint(3, 6)]}
+
+
+def profile(kind):
+    def data(rng, context):
+        row = getattr(context['generator'], kind)(rng, 0)
+        row['name'] = 'Bench ' + row['name']
+        return {key: value for key, value in row.items() if key != 'id'}
+    return data
+
+
+def show(rng, context):
+    # Far-future slots, one per request, so no booking is ever refused.
+    context['slot'] += 1
+    start = context['future'] + timedelta(hours=4 * context['slot'])
+    return {
+        'venue_id': rng.choice(context['venues']),
+        'artist_id': rng.choice(context['artists']),
+        'start_time': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'duration': 120,
+    }
+
+
+def availability(rng, context):
+    start = datetime.now() + timedelta(days=rng.randint(-30, 30))
+    return {'slots': [{
+        'venue_id': rng.choice(context['venues']),
+        'artist_id': rng.choice(context['artists']),
+        'start_time': (start + timedelta(hours=3 * index)).isoformat(),
+    } for index in range(10)]}
+
+
+def nearby(rng, context):
+    from datagen import PLACES
+    state, _, cities = rng.choice(PLACES)
+    return '/venues/nearby?city=%s&state=%s&radius=%d' % (rng.choice(cities), state, rng.choice((5, 25, 100)))
+
+
+def date_range(rng, context):
+    start = datetime.now().date() + timedelta(days=rng.randint(-60, 60))
+    return '/shows?from=%s&to=%s' % (start, start + timedelta(days=rng.randint(0, 6)))
+
+
+def genre(rng, context):
+    from choices import GENRE_CHOICES
+    return rng.choice(GENRE_CHOICES)[0]
+
+
+# Reads first, so the writes do not change what they measure.
+SCENARIOS = (
+    Scenario('index', 'GET', constant('/')),
+    Scenario('venues', 'GET', constant('/venues')),
+    Scenario('venues.genre', 'GET', lambda rng, context: '/venues?genre=%s' % genre(rng, context)),
+    Scenario('venue', 'GET', pick('venues', '/venues/%d')),
+    Scenario('venue.calendar', 'GET', pick('venues', '/venues/%d/calendar.ics')),
+    Scenario('venues.search', 'POST', constant('/venues/search'), data=search_term),
+    Scenario('venues.nearby', 'GET', nearby),
+    Scenario('venue.create_form', 'GET', constant('/venues/create')),
+    Scenario('venue.edit_form', 'GET', pick('venues', '/venues/%d/edit')),
+    Scenario('artists', 'GET', constant('/artists')),
+    Scenario('artists.genre', 'GET', lambda rng, context: '/artists?genre=%s' % genre(rng, context)),
+    Scenario('artist', 'GET', pick('artists', '/artists/%d')),
+    Scenario('artist.calendar', 'GET', pick('artists', '/artists/%d/calendar.ics')),
+    Scenario('artists.search', 'POST', constant('/artists/search'), data=search_term),
+    Scenario('artist.create_form', 'GET', constant('/artists/create')),
+    Scenario('artist.edit_form', 'GET', pick('artists', '/artists/%d/edit')),
+    Scenario('shows', 'GET', constant('/shows')),
+    Scenario('shows.range', 'GET', date_range),
+    Scenario('show.create_form', 'GET', constant('/shows/create')),
+    Scenario('api.venues', 'GET', constant('/api/v1/venues')),
+    Scenario('api.venue', 'GET', pick('venues', '/api/v1/venues/%d')),
+    Scenario('api.artists', 'GET', constant('/api/v1/artists')),
+    Scenario('api.artist', 'GET', pick('artists', '/api/v1/artists/%d')),
+    Scenario('api.shows', 'GET', constant('/api/v1/shows')),
+    Scenario('api.availability', 'POST', constant('/api/v1/shows/availability'), json=availability),
+    Scenario('venue.create', 'POST', constant('/venues/create'), data=profile('venue'), writes=True),
+    Scenario('venue.edit', 'POST', pick('venues', '/venues/%d/edit'), data=profile('venue'), writes=True),
+    Scenario('artist.create', 'POST', constant('/artists/create'), data=profile('artist'), writes=True),
+    Scenario('artist.edit', 'POST', pick('artists', '/artists/%d/edit'), data=profile('artist'), writes=True),
+    Scenario('show.create', 'POST', constant('/shows/create'), data=show, writes=True),
+)
+
+
+def sample_ids(db, model, size=10000):
+    # Up to `size` ids spread evenly over the table, in a stable order.
+    count = db.session.query(db.func.count(model.id)).scalar()
+    stride = max(count // size, 1)
+    return [id for id, in db.session.query(model.id).filter(model.id % stride == 0).order_by(model.id).limit(size)]
+
+
+def percentile(ordered, fraction):
+    # Nearest rank.
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(timings, errors):
+    ordered = sorted(timings)
+    total = sum(ordered)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'throughput': round(len(ordered) / total, 1) if total else None,
+        'mean_ms': round(statistics.mean(ordered) * 1000, 3),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+    }
+
+
+def run(client, scenario, rng, context, requests, warmup):
+    timings, errors = [], 0
+    for number in range(warmup + requests):
+        path, kwargs = scenario.request(rng, context)
+        started = time.perf_counter()
+        response = client.open(path, **kwargs)
+        body = response.get_data()
+        elapsed = time.perf_counter() - started
+        # Failed submissions re-render their form with a 200.
+        if response.status_code >= 400 or (scenario.writes and b'An error occurred' in body):
+            errors += 1
+        if number >= warmup:
+            timings.append(elapsed)
+    return summarize(timings, errors)
+
+
+def compare(results, baseline, tolerance, floor_ms):
+    # One line per regressed metric of the scenarios both runs have.
+    regressions = []
+    for name, now in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if now[metric] > before[metric] * (1 + tolerance) and now[metric] - before[metric] >= floor_ms:
+                regressions.append('%s %s: %.2fms -> %.2fms' % (name, metric, before[metric], now[metric]))
+        if before['throughput'] and now['throughput'] and now['throughput'] * (1 + tolerance) < before['throughput'] \
+                and 1000 / now['throughput'] - 1000 / before['throughput'] >= floor_ms:
+            regressions.append('%s throughput: %.1f/s -> %.1f/s' % (name, before['throughput'], now['throughput']))
+    return regressions
+
+
+@fyyur_cli.command('bench', with_appcontext=False)
+@click.option('--requests', default=200, show_default=True, help='Timed requests per scenario.')
+@click.option('--warmup', default=5, show_default=True, help='Untimed requests per scenario first.')
+@click.option('--only', multiple=True, help='Scenario name pattern, e.g. "venue*"; repeatable.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--no-cache', is_flag=True, help='Measure with the view cache off.')
+@click.option('--out', type=click.Path(dir_okay=False, writable=True), help='Write the results as JSON.')
+@click.option('--baseline', type=click.Path(dir_okay=False), help='Defaults to BENCH_BASELINE.')
+@click.option('--save-baseline', is_flag=True, help='Store the results as the new baseline.')
+@click.option('--tolerance', type=float, help='Allowed slowdown, e.g. 0.2; defaults to BENCH_TOLERANCE.')
+@pass_script_info
+def bench_command(info, requests, warmup, only, seed, no_cache, out, baseline, save_baseline, tolerance):
+    """Benchmark the routes and compare them against a baseline."""
+    from cache import NullCache
+    from datagen import Generator
+    from extensions import jobs, view_cache
+    from jobs import MemoryQueue
+    from models import db, Artist, Show, Venue
+    # Built here rather than pushed by the command: each test client request
+    # needs its own application context, as it gets in a server.
+    app = info.load_app()
+    config = app.config
+    baseline = baseline or config['BENCH_BASELINE']
+    tolerance = config['BENCH_TOLERANCE'] if tolerance is None else tolerance
+
+    # Forms are posted without a CSRF token, and jobs queued by the writes
+    # stay in memory instead of reaching the real queue and the network.
+    config['WTF_CSRF_ENABLED'] = False
+    jobs.backend, jobs.threads = MemoryQueue(config.get('JOB_LEASE', 300)), 0
+    if no_cache:
+        view_cache.backend = NullCache()
+    scenarios = [scenario for scenario in SCENARIOS
+                 if not only or any(fnmatch.fnmatchcase(scenario.name, pattern) for pattern in only)]
+    if not scenarios:
+        raise click.ClickException('No scenario matches %s.' % ', '.join(only))
+
+    with app.app_context():
+        context = {
+            'venues': sample_ids(db, Venue),
+            'artists': sample_ids(db, Artist),
+            'generator': Generator(seed),
+            # Past every booked show, including those of earlier runs.
+            'future': max(db.session.query(db.func.max(Show.end_time)).scalar() or datetime.now(),
+                          datetime.now() + timedelta(days=3650)).replace(minute=0, second=0, microsecond=0),
+            'slot': 0,
+        }
+        rows = {'venues': db.session.query(db.func.count(Venue.id)).scalar(),
+                'artists': db.session.query(db.func.count(Artist.id)).scalar()}
+        dialect = db.engine.dialect.name
+    if not context['venues'] or not context['artists']:
+        raise click.ClickException('Nothing to benchmark; add data with `flask fyyur generate` first.')
+
+    results = {
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': platform.python_version(),
+        'database': dialect,
+        'rows': rows,
+        'view_cache': 'null' if no_cache else config.get('VIEW_CACHE_BACKEND', 'lru'),
+        'requests': requests,
+        'scenarios': {},
+    }
+    client = app.test_client()
+    for scenario in scenarios:
+        rng = random.Random('%s:%s' % (seed, scenario.name))
+        result = run(client, scenario, rng, context, requests, warmup)
+        results['scenarios'][scenario.name] = result
+        click.echo('%-20s %8.1f/s  p50 %8.2fms  p95 %8.2fms  p99 %8.2fms%s' % (
+            scenario.name, result['throughput'] or 0, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            '  %d errors' % result['errors'] if result['errors'] else ''))
+
+    if out:
+        with open(out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if save_baseline:
+        with open(baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        click.echo('Saved the baseline to %s.' % baseline, err=True)
+        return
+
+    failed = ['%s: %d errors' % (name, result['errors'])
+              for name, result in results['scenarios'].items() if result['errors']]
+    try:
+        with open(baseline) as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        click.echo('No baseline at %s; nothing to compare against.' % baseline, err=True)
+    else:
+        failed += compare(results, stored, tolerance, config['BENCH_FLOOR_MS'])
+    if failed:
+        raise click.ClickException('Regressions:\n  ' + '\n  '.join(failed))
@@ -0,0 +1,244 @@
+#----------------------------------------------------------------------------#
+# View cache.
+#
+# Rendered HTML of the read views is cached under the route plus its query
+# arguments. Each entry also records the tags of the rows it displayed
+# ('venue:3', 'artist:7', 'area:CA:San Francisco', ...). Writers invalidate
+# tags, not keys: invalidating a tag gives it a fresh token, and every entry
+# rendered under the old token stops matching. That works the same for the
+# in-process LRU backend and the filesystem backend shared across workers.
+#----------------------------------------------------------------------------#
+
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from flask import Response, g, request, session
+
+
+class LRUCache(object):
+    # In-process cache bounded by entry count; least recently used goes first.
+
+    def __init__(self, max_entries=1024, default_timeout=300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.time():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        with self._lock:
+            self._entries[key] = (time.time() + timeout if timeout else 0, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileSystemCache(object):
+    # One pickle per key under `directory`, so every worker on the host shares
+    # the same entries. Reads bump the file's mtime, which makes pruning by
+    # mtime an approximate LRU.
+
+    def __init__(self, directory, max_entries=4096, default_timeout=300, prune_every=64):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self.prune_every = prune_every
+        self.evictions = 0
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires and expires < time.time():
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = time.time() + timeout if timeout else 0
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            self._remove(tmp)
+            return
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self._prune()
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            self._remove(os.path.join(self.directory, name))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return
+        entries.sort()
+        for _, path in entries[:excess]:
+            self._remove(path)
+            self.evictions += 1
+
+
+class NullCache(object):
+    evictions = 0
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class ViewCache(object):
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('VIEW_CACHE_BACKEND', 'lru')
+        timeout = app.config.get('VIEW_CACHE_TIMEOUT', 300)
+        max_entries = app.config.get('VIEW_CACHE_MAX_ENTRIES', 1024)
+        if kind == 'lru':
+            self.backend = LRUCache(max_entries, timeout)
+        elif kind == 'filesystem':
+            self.backend = FileSystemCache(app.config['VIEW_CACHE_DIR'], max_entries, timeout)
+        elif kind == 'null':
+            self.backend = NullCache()
+        else:
+            raise ValueError('Unknown VIEW_CACHE_BACKEND %r' % kind)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.backend.evictions}
+
+    #  Tags
+    #  ----------------------------------------------------------------
+
+    def tag(self, *tags):
+        # Called from inside a cached view for every row the page displays.
+        if 'cache_tags' in g:
+            g.cache_tags.update(tags)
+
+    def invalidate(self, *tags):
+        token = '%f:%s' % (time.time(), uuid.uuid4().hex)
+        for tag in tags:
+            self.backend.set('tag:' + tag, token, timeout=0)
+
+    def _tokens(self, tags):
+        return {tag: self.backend.get('tag:' + tag) for tag in tags}
+
+    #  Views
+    #  ----------------------------------------------------------------
+
+    def cached(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pages carrying a flashed message are personal; skip the cache.
+            if request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+            key = 'view:' + request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+            entry = self.backend.get(key)
+            if entry is not None:
+                tokens, body = entry
+                if self._tokens(tokens) == tokens:
+                    self.hits += 1
+                    response = Response(body, mimetype='text/html')
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+            self.misses += 1
+            started = time.time()
+            g.cache_tags = set()
+            rv = view(*args, **kwargs)
+            if isinstance(rv, str):
+                self._store(key, g.cache_tags, rv, started)
+                rv = Response(rv, mimetype='text/html')
+                rv.headers['X-Cache'] = 'MISS'
+            return rv
+        return wrapper
+
+    def _store(self, key, tags, body, started):
+        tokens = self._tokens(tags)
+        for tag, token in tokens.items():
+            if token is None:
+                token = tokens[tag] = '0:' + uuid.uuid4().hex
+                self.backend.set('tag:' + tag, token, timeout=0)
+            elif float(token.split(':', 1)[0]) >= started:
+                # Invalidated while this page was rendering; it may be stale.
+                return
+        self.backend.set(key, (tokens, body))
@@ -0,0 +1,177 @@
+#----------------------------------------------------------------------------#
+# Choice lists shared by the forms.
+#
+# States and genres are enums; each gets one (value, label) tuple for the
+# fields and one frozenset for validation, built once at import. ChoiceField
+# and MultipleChoiceField validate by set membership instead of scanning the
+# choices, and render their <option> list from markup built once per choice
+# list and locale: a request only decides which options are selected.
+#----------------------------------------------------------------------------#
+
+from enum import Enum
+from functools import lru_cache
+
+from markupsafe import Markup, escape
+from wtforms import SelectField, SelectMultipleField
+from wtforms.widgets import Select, html_params
+
+
+class State(str, Enum):
+    AL = 'AL'
+    AK = 'AK'
+    AZ = 'AZ'
+    AR = 'AR'
+    CA = 'CA'
+    CO = 'CO'
+    CT = 'CT'
+    DE = 'DE'
+    DC = 'DC'
+    FL = 'FL'
+    GA = 'GA'
+    HI = 'HI'
+    ID = 'ID'
+    IL = 'IL'
+    IN = 'IN'
+    IA = 'IA'
+    KS = 'KS'
+    KY = 'KY'
+    LA = 'LA'
+    ME = 'ME'
+    MT = 'MT'
+    NE = 'NE'
+    NV = 'NV'
+    NH = 'NH'
+    NJ = 'NJ'
+    NM = 'NM'
+    NY = 'NY'
+    NC = 'NC'
+    ND = 'ND'
+    OH = 'OH'
+    OK = 'OK'
+    OR = 'OR'
+    MD = 'MD'
+    MA = 'MA'
+    MI = 'MI'
+    MN = 'MN'
+    MS = 'MS'
+    MO = 'MO'
+    PA = 'PA'
+    RI = 'RI'
+    SC = 'SC'
+    SD = 'SD'
+    TN = 'TN'
+    TX = 'TX'
+    UT = 'UT'
+    VT = 'VT'
+    VA = 'VA'
+    WA = 'WA'
+    WV = 'WV'
+    WI = 'WI'
+    WY = 'WY'
+
+
+class Genre(str, Enum):
+    ALTERNATIVE = 'Alternative'
+    BLUES = 'Blues'
+    CLASSICAL = 'Classical'
+    COUNTRY = 'Country'
+    ELECTRONIC = 'Electronic'
+    FOLK = 'Folk'
+    FUNK = 'Funk'
+    HIP_HOP = 'Hip-Hop'
+    HEAVY_METAL = 'Heavy Metal'
+    INSTRUMENTAL = 'Instrumental'
+    JAZZ = 'Jazz'
+    MUSICAL_THEATRE = 'Musical Theatre'
+    POP = 'Pop'
+    PUNK = 'Punk'
+    R_AND_B = 'R&B'
+    REGGAE = 'Reggae'
+    ROCK_N_ROLL = 'Rock n Roll'
+    SOUL = 'Soul'
+    OTHER = 'Other'
+
+
+def choices_of(enum):
+    return tuple((member.value, member.value) for member in enum)
+
+
+STATE_CHOICES = choices_of(State)
+GENRE_CHOICES = choices_of(Genre)
+
+
+@lru_cache(maxsize=None)
+def choice_values(choices):
+    return frozenset(value for value, _ in choices)
+
+
+#  Rendering
+#  ----------------------------------------------------------------
+
+@lru_cache(maxsize=64)
+def option_markup(choices, locale):
+    # Per choice: (value, <option> markup, selected <option> markup), and the
+    # whole list with nothing selected. Labels are the enum values in every
+    # locale for now; the key keeps translated lists apart once there are any.
+    options = tuple(
+        (value,
+         '<option %s>%s</option>' % (html_params(value=value), escape(label)),
+         '<option %s>%s</option>' % (html_params(value=value, selected=True), escape(label)))
+        for value, label in choices
+    )
+    return options, ''.join(plain for _, plain, _ in options)
+
+
+class CachedSelect(Select):
+
+    def __call__(self, field, locale='en', **kwargs):
+        kwargs.setdefault('id', field.id)
+        if self.multiple:
+            kwargs['multiple'] = True
+        if 'required' not in kwargs and 'required' in getattr(field, 'flags', []):
+            kwargs['required'] = True
+        options, unselected = option_markup(field.choices, locale)
+        selected = field.selected_values()
+        if selected:
+            body = ''.join(chosen if value in selected else plain for value, plain, chosen in options)
+        else:
+            body = unselected
+        return Markup('<select %s>%s</select>' % (html_params(name=field.name, **kwargs), body))
+
+
+#  Fields
+#  ----------------------------------------------------------------
+
+class ChoiceField(SelectField):
+    # A SelectField over one of the shared choice tuples. The tuple is kept
+    # as is rather than copied into a list for every form.
+    widget = CachedSelect()
+
+    def __init__(self, label=None, validators=None, choices=(), **kwargs):
+        super(ChoiceField, self).__init__(label, validators, **kwargs)
+        self.choices = choices
+        self.values = choice_values(choices)
+
+    def selected_values(self):
+        return (self.data,) if self.data is not None else ()
+
+    def pre_validate(self, form):
+        if self.data not in self.values:
+            raise ValueError(self.gettext('Not a valid choice'))
+
+
+class MultipleChoiceField(SelectMultipleField):
+    widget = CachedSelect(multiple=True)
+
+    def __init__(self, label=None, validators=None, choices=(), **kwargs):
+        super(MultipleChoiceField, self).__init__(label, validators, **kwargs)
+        self.choices = choices
+        self.values = choice_values(choices)
+
+    def selected_values(self):
+        return frozenset(self.data or ())
+
+    def pre_validate(self, form):
+        for value in self.data or ():
+            if value not in self.values:
+                raise ValueError(self.gettext("'%(value)s' is not a valid choice for this field") % dict(value=value))
@@ -0,0 +1,482 @@
+#----------------------------------------------------------------------------#
+# Bulk import/export CLI.
+#
+#   flask fyyur import venues venues.csv [--dry-run] [--resume]
+#   flask fyyur export shows shows.jsonl
+#
+# Files are CSV or JSON lines (picked by extension unless --format is given)
+# with the same field names as the forms, and every row goes through the same
+# WTForms validation as the HTML submissions. Valid rows are inserted with
+# executemany in chunks, one commit per chunk; after each commit the number of
+# consumed input rows is written to a checkpoint file so an interrupted
+# import can be picked up again with --resume.
+#----------------------------------------------------------------------------#
+
+import csv
+import itertools
+import json
+import os
+import time
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur data management commands.')
+
+
+def clear_view_cache():
+    # For the commands that write around the ORM events. A per-process cache
+    # can only be cleared here, in the command's own process.
+    from extensions import view_cache
+    view_cache.clear()
+    if current_app.config['VIEW_CACHE_BACKEND'] == 'lru':
+        click.echo("Warning: VIEW_CACHE_BACKEND 'lru' is per process; restart the web processes to drop "
+                   "their cached pages.", err=True)
+
+
+KINDS = ('venues', 'artists', 'shows')
+
+FIELDS = {
+    'venues': ('id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+               'website_link', 'genres', 'seeking_talent', 'seeking_description'),
+    'artists': ('id', 'name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+                'website_link', 'genres', 'seeking_venue', 'seeking_description'),
+    'shows': ('id', 'venue_id', 'artist_id', 'start_time', 'duration'),
+}
+
+SHOW_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def file_format(path, format):
+    if format:
+        return format
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+#  Reading
+#  ----------------------------------------------------------------
+
+def read_rows(f, format):
+    if format == 'csv':
+        for row in csv.DictReader(f):
+            if row.get('genres') is not None:
+                row['genres'] = [name for name in row['genres'].split(',') if name]
+            yield row
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def to_formdata(row):
+    formdata = MultiDict()
+    for key, value in row.items():
+        if value is None or value is False or value == '':
+            continue
+        if isinstance(value, list):
+            for item in value:
+                formdata.add(key, str(item))
+        elif value is True:
+            formdata.add(key, 'y')
+        else:
+            formdata.add(key, str(value))
+    return formdata
+
+
+def row_id(row):
+    value = row.get('id')
+    return int(value) if value not in (None, '') else None
+
+
+class Checkpoint(object):
+
+    def __init__(self, path, source, kind):
+        self.path = path
+        stat = os.stat(source)
+        self.identity = {'source': os.path.abspath(source), 'kind': kind, 'size': stat.st_size}
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if any(state.get(key) != value for key, value in self.identity.items()):
+            raise click.ClickException('Checkpoint %s belongs to a different import.' % self.path)
+        return state['rows']
+
+    def save(self, rows):
+        state = dict(self.identity, rows=rows)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+#  Importers
+#  ----------------------------------------------------------------
+
+class Importer(object):
+    # Turns validated form data into insert mappings and writes one chunk at
+    # a time.
+
+    def __init__(self, db, form):
+        self.db = db
+        self.form = form
+        # Explicit ids seen so far in this run.
+        self.ids = set()
+
+    def validate(self, row):
+        self.form.process(to_formdata(row))
+        errors = {} if self.form.validate() else dict(self.form.errors)
+        try:
+            row_id(row)
+        except (TypeError, ValueError):
+            errors['id'] = ['Not a whole number: %r.' % row.get('id')]
+        if errors:
+            return None, errors
+        return self.mapping(row, self.form), None
+
+    def check_ids(self, mappings):
+        # Explicit ids already in the table, or given to an earlier row of the
+        # file, would fail the whole chunk's insert; they are rejected first.
+        ids = [mapping['id'] for mapping in mappings if mapping['id'] is not None]
+        column = self.table.c.id
+        taken = {id for id, in self.db.session.query(column).filter(column.in_(ids))} if ids else set()
+        valid, errors = [], []
+        for index, mapping in enumerate(mappings):
+            if mapping['id'] in taken or mapping['id'] in self.ids:
+                errors.append((index, {'id': ['Duplicate id %d.' % mapping['id']]}))
+                continue
+            if mapping['id'] is not None:
+                self.ids.add(mapping['id'])
+            valid.append(mapping)
+        return valid, errors
+
+    def check(self, mappings):
+        # Returns the mappings that may be inserted plus (index, error) pairs.
+        return mappings, []
+
+
+class ProfileImporter(Importer):
+    # Venues and artists: the row itself plus its genre links.
+
+    def __init__(self, db, form, model, association, owner_column):
+        super(ProfileImporter, self).__init__(db, form)
+        self.model = model
+        self.table = model.__table__
+        self.association = association
+        self.owner_column = owner_column
+        from models import Genre
+        self.genre_table = Genre.__table__
+        self.genre_ids = dict(db.session.query(Genre.name, Genre.id).all())
+
+    def genre_id(self, name):
+        if name not in self.genre_ids:
+            result = self.db.session.execute(self.genre_table.insert().values(name=name))
+            self.genre_ids[name] = result.inserted_primary_key[0]
+        return self.genre_ids[name]
+
+    def insert(self, mappings):
+        genres = [mapping.pop('genres') for mapping in mappings]
+        with_ids = [mapping for mapping in mappings if mapping['id'] is not None]
+        without_ids = [mapping for mapping in mappings if mapping['id'] is None]
+        if with_ids:
+            self.db.session.execute(self.table.insert(), with_ids)
+        if without_ids:
+            for mapping in without_ids:
+                del mapping['id']
+            self.db.session.bulk_insert_mappings(self.model, without_ids, return_defaults=True)
+        links = [
+            {self.owner_column: mapping['id'], 'genre_id': self.genre_id(name)}
+            for mapping, names in zip(mappings, genres) for name in dict.fromkeys(names)
+        ]
+        if links:
+            self.db.session.execute(self.association.insert(), links)
+
+
+class VenueImporter(ProfileImporter):
+
+    def __init__(self, db):
+        from models import Venue, venue_genres
+        from forms import VenueForm
+        super(VenueImporter, self).__init__(
+            db, VenueForm(formdata=None, meta={'csrf': False}), Venue, venue_genres, 'venue_id'
+        )
+
+    def mapping(self, row, form):
+        from geo import LOCATION_COLUMNS, locate
+        return dict(zip(LOCATION_COLUMNS, locate(form.city.data, form.state.data)), **{
+            'id': row_id(row),
+            'name': form.name.data,
+            'city': form.city.data,
+            'state': form.state.data,
+            'address': form.address.data,
+            'phone': form.phone.data,
+            'image_link': form.image_link.data,
+            'facebook_link': form.facebook_link.data,
+            'website': form.website_link.data,
+            'seeking_talent': form.seeking_talent.data,
+            'seeking_description': form.seeking_description.data,
+            'genres': form.genres.data,
+        })
+
+
+class ArtistImporter(ProfileImporter):
+
+    def __init__(self, db):
+        from models import Artist, artist_genres
+        from forms import ArtistForm
+        super(ArtistImporter, self).__init__(
+            db, ArtistForm(formdata=None, meta={'csrf': False}), Artist, artist_genres, 'artist_id'
+        )
+
+    def mapping(self, row, form):
+        return {
+            'id': row_id(row),
+            'name': form.name.data,
+            'city': form.city.data,
+            'state': form.state.data,
+            'phone': form.phone.data,
+            'image_link': form.image_link.data,
+            'facebook_link': form.facebook_link.data,
+            'website': form.website_link.data,
+            'seeking_venue': form.seeking_venue.data,
+            'seeking_description': form.seeking_description.data,
+            'genres': form.genres.data,
+        }
+
+
+class ShowImporter(Importer):
+
+    def __init__(self, db):
+        from models import Show, Venue, Artist
+        from forms import ShowForm
+        super(ShowImporter, self).__init__(db, ShowForm(formdata=None, meta={'csrf': False}))
+        self.table = Show.__table__
+        self.venue_id = Venue.id
+        self.artist_id = Artist.id
+
+    def mapping(self, row, form):
+        return {
+            'id': row_id(row),
+            'venue_id': form.venue_id.data,
+            'artist_id': form.artist_id.data,
+            'start_time': form.start_time.data,
+            'end_time': form.start_time.data + timedelta(minutes=form.duration.data),
+        }
+
+    def existing(self, column, ids):
+        return {id for id, in self.db.session.query(column).filter(column.in_(ids))}
+
+    def check(self, mappings):
+        # Foreign keys are resolved with one IN query per table per chunk.
+        venues = self.existing(self.venue_id, {m['venue_id'] for m in mappings if m['venue_id']})
+        artists = self.existing(self.artist_id, {m['artist_id'] for m in mappings if m['artist_id']})
+        valid, errors = [], []
+        for index, mapping in enumerate(mappings):
+            if mapping['venue_id'] not in venues:
+                errors.append((index, {'venue_id': ['Unknown venue %s.' % mapping['venue_id']]}))
+            elif mapping['artist_id'] not in artists:
+                errors.append((index, {'artist_id': ['Unknown artist %s.' % mapping['artist_id']]}))
+            else:
+                valid.append(mapping)
+        return valid, errors
+
+    def insert(self, mappings):
+        with_ids = [mapping for mapping in mappings if mapping['id'] is not None]
+        without_ids = [
+            {key: value for key, value in mapping.items() if key != 'id'}
+            for mapping in mappings if mapping['id'] is None
+        ]
+        for batch in (with_ids, without_ids):
+            if batch:
+                self.db.session.execute(self.table.insert(), batch)
+
+
+IMPORTERS = {
+    'venues': VenueImporter,
+    'artists': ArtistImporter,
+    'shows': ShowImporter,
+}
+
+
+def reset_sequence(db, table):
+    # Rows imported with explicit ids leave PostgreSQL's serial behind.
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text(
+            "SELECT setval(pg_get_serial_sequence('\"%s\"', 'id'), COALESCE(MAX(id), 1)) FROM \"%s\""
+            % (table, table)
+        ))
+        db.session.commit()
+
+
+@fyyur_cli.command('import')
+@click.argument('kind', type=click.Choice(KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(('csv', 'jsonl')), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=10000, show_default=True, help='Rows per insert batch and commit.')
+@click.option('--dry-run', is_flag=True, help='Validate every row without writing anything.')
+@click.option('--resume', is_flag=True, help='Skip the rows committed by an interrupted run.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), help='Defaults to PATH.checkpoint.')
+def import_command(kind, path, format, chunk_size, dry_run, resume, checkpoint):
+    """Import venues, artists or shows from a CSV or JSONL file."""
+    from models import db
+    importer = IMPORTERS[kind](db)
+    checkpoint = Checkpoint(checkpoint or path + '.checkpoint', path, kind)
+    skipped = checkpoint.load() if resume else 0
+    consumed, imported, failed = skipped, 0, 0
+    stopped = None
+    started = time.time()
+
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = enumerate(read_rows(f, file_format(path, format)), 1)
+        if skipped:
+            click.echo('Resuming after row %d.' % skipped, err=True)
+            rows = itertools.islice(rows, skipped, None)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            numbers, mappings = [], []
+            for number, row in chunk:
+                mapping, errors = importer.validate(row)
+                if errors:
+                    failed += 1
+                    click.echo('Row %d: %s' % (number, errors), err=True)
+                else:
+                    numbers.append(number)
+                    mappings.append(mapping)
+            for check in (importer.check_ids, importer.check):
+                if not mappings:
+                    break
+                mappings, errors = check(mappings)
+                for index, error in errors:
+                    failed += 1
+                    click.echo('Row %d: %s' % (numbers[index], error), err=True)
+                rejected = {index for index, _ in errors}
+                numbers = [number for index, number in enumerate(numbers) if index not in rejected]
+            if mappings:
+                if dry_run:
+                    db.session.rollback()
+                else:
+                    try:
+                        importer.insert(mappings)
+                        db.session.commit()
+                    except IntegrityError as e:
+                        # The checkpoint still ends before this chunk, so
+                        # --resume retries it once the rows are fixed.
+                        db.session.rollback()
+                        stopped = 'Rows %d to %d were not imported: %s' % (chunk[0][0], chunk[-1][0], e.orig)
+                        break
+            consumed += len(chunk)
+            imported += len(mappings)
+            if not dry_run:
+                checkpoint.save(consumed)
+            elapsed = time.time() - started
+            click.echo('%d rows read, %d %s, %d rejected (%.0f rows/s)' % (
+                consumed, imported, 'valid' if dry_run else 'imported', failed,
+                (consumed - skipped) / elapsed if elapsed else 0
+            ), err=True)
+
+    if not dry_run:
+        if stopped is None:
+            checkpoint.clear()
+        reset_sequence(db, importer.table.name)
+        # Bulk inserts bypass the ORM events that keep cached pages fresh, and
+        # those behind the show counters.
+        if kind == 'shows':
+            from models import Show, counter_watermark
+            from counters import check
+            check(db, Show, counter_watermark, fix=True)
+        else:
+            from models import artist_search, venue_search
+            index = venue_search if kind == 'venues' else artist_search
+            if not index.uses_database():
+                click.echo('Warning: running web processes search %s with the in-process index, which does '
+                           'not see imported rows; restart them.' % kind, err=True)
+        clear_view_cache()
+    if stopped:
+        raise click.ClickException(stopped)
+    if failed:
+        raise click.ClickException('%d rows were rejected.' % failed)
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+def export_rows(db, kind, batch_size):
+    from models import Venue, Artist, Show, Genre, venue_genres, artist_genres
+    if kind == 'shows':
+        query = db.session.query(
+            Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time
+        ).order_by(Show.id)
+        for id, venue_id, artist_id, start_time, end_time in query.yield_per(batch_size):
+            yield {
+                'id': id,
+                'venue_id': venue_id,
+                'artist_id': artist_id,
+                'start_time': start_time.strftime(SHOW_TIME_FORMAT),
+                'duration': int((end_time - start_time).total_seconds() // 60),
+            }
+        return
+
+    model, association, owner_column = {
+        'venues': (Venue, venue_genres, venue_genres.c.venue_id),
+        'artists': (Artist, artist_genres, artist_genres.c.artist_id),
+    }[kind]
+    # Genres are loaded once up front rather than per exported row.
+    genres = {}
+    for owner_id, name in db.session.query(owner_column, Genre.name).join(
+        Genre, Genre.id == association.c.genre_id
+    ).order_by(owner_column, Genre.name):
+        genres.setdefault(owner_id, []).append(name)
+    for entity in db.session.query(model).order_by(model.id).yield_per(batch_size):
+        row = {}
+        for field in FIELDS[kind]:
+            if field == 'genres':
+                row[field] = genres.get(entity.id, [])
+            elif field == 'website_link':
+                row[field] = entity.website
+            else:
+                row[field] = getattr(entity, field)
+        yield row
+
+
+@fyyur_cli.command('export')
+@click.argument('kind', type=click.Choice(KINDS))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', type=click.Choice(('csv', 'jsonl')), help='Defaults to the file extension.')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows fetched per round trip.')
+def export_command(kind, path, format, batch_size):
+    """Export venues, artists or shows to a CSV or JSONL file."""
+    from models import db
+    format = file_format(path, format)
+    exported = 0
+    started = time.time()
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            writer = csv.DictWriter(f, FIELDS[kind])
+            writer.writeheader()
+        for row in export_rows(db, kind, batch_size):
+            if format == 'csv':
+                for key, value in row.items():
+                    if isinstance(value, list):
+                        row[key] = ','.join(value)
+                    elif isinstance(value, bool):
+                        row[key] = 'true' if value else 'false'
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(row) + '\n')
+            exported += 1
+            if exported % batch_size == 0:
+                click.echo('%d rows exported (%.0f rows/s)' % (exported, exported / (time.time() - started)), err=True)
+    click.echo('%d rows exported to %s.' % (exported, path), err=True)
@@ -0,0 +1,62 @@
+#----------------------------------------------------------------------------#
+# Response compression.
+#
+# HTML and JSON responses of at least COMPRESS_MIN_SIZE bytes are compressed
+# with brotli, when the package is installed and the client accepts it, or
+# with gzip. Responses that are streamed, already encoded (the precompressed
+# assets) or partial are passed through untouched.
+#----------------------------------------------------------------------------#
+
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Compress(object):
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.mimetypes = set(app.config.get('COMPRESS_MIMETYPES', ('text/html', 'application/json')))
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 500)
+        self.level = app.config.get('COMPRESS_LEVEL', 6)
+        self.br_level = app.config.get('COMPRESS_BR_LEVEL', 4)
+        app.after_request(self.compress)
+
+    def encoding(self):
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br'] > 0:
+            return 'br'
+        if accepted['gzip'] > 0:
+            return 'gzip'
+        return None
+
+    def compress(self, response):
+        if (response.mimetype not in self.mimetypes or response.status_code != 200 or
+                response.direct_passthrough or response.is_streamed or
+                'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.encoding()
+        data = response.get_data()
+        if encoding is None or len(data) < self.min_size:
+            return response
+        if encoding == 'br':
+            data = brotli.compress(data, quality=self.br_level)
+        else:
+            data = gzip.compress(data, self.level)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes differ from the identity ones, so a strong
+        # validator must not be shared between them.
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,78 @@
+#----------------------------------------------------------------------------#
+# Conditional GET for rendered pages.
+#
+# A view decorated with @conditional(validators) first calls
+# validators(**view_args). That runs one cheap aggregate query for the counts
+# and latest update times of the rows the page displays and returns
+# (etag values, last modified), or None to skip. If the client's
+# If-None-Match or If-Modified-Since still matches, the response is a 304
+# and the view, its queries and its template never run. Otherwise the
+# rendered page goes out with a weak ETag and Last-Modified, and with
+# Cache-Control: no-cache so the browser revalidates on every view.
+#
+# The ETag also covers the templates and the asset manifest, so a deploy
+# that changes the markup changes every tag.
+#----------------------------------------------------------------------------#
+
+import functools
+import hashlib
+import os
+
+from flask import current_app, make_response, request, session
+from werkzeug.http import is_resource_modified
+
+
+def _digest_tree(digest, path):
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        return
+    for directory, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            digest.update(filename.encode('utf-8'))
+            with open(os.path.join(directory, filename), 'rb') as f:
+                digest.update(f.read())
+
+
+def markup_version(app):
+    if 'markup_version' not in app.extensions:
+        digest = hashlib.sha1()
+        for path in (os.path.join(app.root_path, app.template_folder),
+                     os.path.join(app.static_folder, 'dist', 'manifest.json')):
+            if os.path.exists(path):
+                _digest_tree(digest, path)
+        app.extensions['markup_version'] = digest.hexdigest()[:12]
+    return app.extensions['markup_version']
+
+
+def make_etag(values):
+    raw = repr((markup_version(current_app), request.full_path, values))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def conditional(validators):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # A page carrying a flashed message is a one-off; never validate it.
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return view(*args, **kwargs)
+            result = validators(**kwargs)
+            if result is None:
+                return view(*args, **kwargs)
+            values, last_modified = result
+            etag = make_etag(values)
+            if not is_resource_modified(request.environ, etag='W/"%s"' % etag, last_modified=last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -1,13 +1,202 @@
 import os
+from flask.helpers import get_debug_flag
 SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+# Debug mode, from FLASK_ENV=development or FLASK_DEBUG=1 as Flask reads them;
+# off unless asked for, so a production server never runs with it.
+DEBUG = get_debug_flag()
 
-# Connect to the database
+# Connect to the database. Hosting platforms still hand out postgres:// URLs,
+# which SQLAlchemy 1.4 no longer accepts.
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://localhost:5432/fyyur')
+if SQLALCHEMY_DATABASE_URI.startswith('postgres://'):
+    SQLALCHEMY_DATABASE_URI = 'postgresql://' + SQLALCHEMY_DATABASE_URI[len('postgres://'):]
 
+SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
+# Connection pool, sized per worker process: each worker holds up to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so keep workers times that under
+# the server's max_connections. Connections are recycled before idle timeouts
+# on the server or a proxy drop them, and pre-ping replaces dead ones before
+# a request sees the error. DB_STATEMENT_TIMEOUT (milliseconds, 0 = off) caps
+# any single statement on PostgreSQL; on SQLite it is how long a writer waits
+# for the lock.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') not in ('0', 'false', 'no')
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 5000))
+
+if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'connect_args': {'timeout': DB_STATEMENT_TIMEOUT / 1000.0 or 5},
+    }
+else:
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT and SQLALCHEMY_DATABASE_URI.startswith('postgresql'):
+        SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {
+            'options': '-c statement_timeout=%d' % DB_STATEMENT_TIMEOUT,
+        }
+
+# Read replica. When DATABASE_REPLICA_URL is set, views marked @read_only run
+# their queries against it; writes, and reads right after a write from the
+# same browser, stay on the primary. The replica bind gets the same pool
+# settings as the primary.
+SQLALCHEMY_BINDS = {}
+if os.environ.get('DATABASE_REPLICA_URL'):
+    SQLALCHEMY_BINDS['replica'] = os.environ['DATABASE_REPLICA_URL'].replace('postgres://', 'postgresql://', 1)
+
+# Applied to every new SQLite connection (development and tests). WAL lets the
+# readers carry on while a writer commits; NORMAL sync is safe under WAL.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+
+# Name search: 'auto' uses the pg_trgm index on PostgreSQL and the in-process
+# trigram index everywhere else; 'database' or 'memory' force one of them.
+SEARCH_BACKEND = 'auto'
+SEARCH_RESULTS_PER_PAGE = 20
+
+# /venues/nearby (geo.py): radius in miles when none is given, the largest one
+# accepted, and how many of the nearest venues are listed.
+NEARBY_DEFAULT_RADIUS = 25
+NEARBY_MAX_RADIUS = 500
+NEARBY_RESULTS = 50
+
+# Keyset-paginated listings (/venues, /artists, /shows); ?per_page= is capped
+# at LISTING_MAX_PAGE_SIZE. Streamed /shows?stream=1 exports fetch
+# STREAM_YIELD_PER rows per round trip from a server-side cursor.
+LISTING_PAGE_SIZE = 50
+LISTING_MAX_PAGE_SIZE = 500
+STREAM_YIELD_PER = 1000
+
+# Rendered read views: 'lru' (per process), 'filesystem' (shared by every
+# worker on the host through VIEW_CACHE_DIR) or 'null' to disable. A write
+# only invalidates the cache of the process that made it, so any deployment
+# with several processes (`flask fyyur serve` with more than one worker, or
+# `flask fyyur worker` next to the web server) needs 'filesystem' or 'null'.
+VIEW_CACHE_BACKEND = os.environ.get('VIEW_CACHE_BACKEND', 'lru')
+VIEW_CACHE_TIMEOUT = 300
+VIEW_CACHE_MAX_ENTRIES = 2048
+VIEW_CACHE_DIR = os.path.join(basedir, '.cache', 'views')
+
+# Instrumentation (metrics.py). Request latency histograms per endpoint are
+# served at /metrics; statements slower than SLOW_QUERY_MS are logged to the
+# 'fyyur.slow_query' logger. SERVER_TIMING adds the SQL/template/total split
+# to every response for the browser's network panel.
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 200))
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') not in ('0', 'false', 'no')
+
+# Logging outside debug mode (applog.py). Records go through a queue of
+# LOG_QUEUE_SIZE to a background writer; overflow is dropped and counted in
+# /metrics. Files rotate at LOG_MAX_BYTES, or on LOG_ROTATE_WHEN ('midnight',
+# 'H', ...) when that is set. LOG_FORMAT 'json' writes one object per line.
+LOG_FILE = os.environ.get('LOG_FILE', 'error.log')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_WHEN = os.environ.get('LOG_ROTATE_WHEN')
+LOG_BACKUP_COUNT = 5
+LOG_QUEUE_SIZE = 10000
+
+# Response compression (compression.py): HTML and JSON bodies of at least
+# COMPRESS_MIN_SIZE bytes, brotli when installed and accepted, else gzip.
+COMPRESS_MIMETYPES = ('text/html', 'application/json')
+COMPRESS_MIN_SIZE = 500
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL', 4))
+
+# POST /api/v1/shows/availability checks up to this many proposed slots in one
+# query; each slot adds eight bind parameters.
+AVAILABILITY_MAX_SLOTS = 500
+
+# `flask fyyur startup` (startup.py) fails when building the app in a fresh
+# interpreter imports for longer than this, in milliseconds as reported by
+# `python -X importtime`.
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 750))
+
+# Background jobs (jobs.py). JOB_QUEUE_BACKEND 'sqlite' keeps the queue in
+# JOB_QUEUE_PATH, shared by every process on the host and kept across
+# restarts; 'memory' keeps it per process. `flask fyyur serve` runs
+# JOB_WORKER_THREADS job threads in a job process next to its workers, and the
+# development server in the web process; set it to 0 to leave jobs to `flask
+# fyyur worker` on the same host. A failing job is retried up to
+# JOB_MAX_ATTEMPTS times, first after JOB_RETRY_DELAY seconds and then twice
+# as long each time, at most JOB_RETRY_MAX_DELAY. Finished jobs, and with them
+# their idempotency keys, are kept for JOB_RETENTION seconds. The worker
+# command and the serve command's job process also queue each job of
+# JOB_SCHEDULE every so many seconds.
+JOB_QUEUE_BACKEND = os.environ.get('JOB_QUEUE_BACKEND', 'sqlite')
+JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH', os.path.join(basedir, '.cache', 'jobs.db'))
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 2))
+JOB_POLL_INTERVAL = 1.0
+JOB_LEASE = 300
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 5
+JOB_RETRY_MAX_DELAY = 3600
+JOB_RETENTION = 24 * 3600
+JOB_SCHEDULE = {'counters.rollover': 60, 'matches.rebuild': 24 * 3600}
+
+# Match recommendations (matches.py). Venues seeking talent and artists
+# seeking a venue each get their MATCH_RESULTS best matches, scored as the
+# MATCH_WEIGHTS-weighted sum of genre overlap, same city or state, and past
+# shows together. The matches.rebuild job of JOB_SCHEDULE recomputes them all.
+MATCH_RESULTS = 6
+MATCH_WEIGHTS = {'genre': 0.6, 'place': 0.3, 'history': 0.1}
+
+# The images.check job (tasks.py) gives up on an image link after this many
+# seconds and retries later.
+IMAGE_CHECK_TIMEOUT = 5
+
+# Image proxy (thumbnails.py). /img/<kind>/<id>/<size> serves venue and artist
+# image links scaled down to fit the IMAGE_SIZES boxes, in pixels, from a
+# cache under IMAGE_CACHE_DIR of at most IMAGE_CACHE_MAX_BYTES. A source that
+# could not be fetched is not tried again for IMAGE_RETRY_AFTER seconds, and
+# a request with an outdated ?v= version is cached for IMAGE_MAX_AGE only.
+# IMAGE_HTTP_CLIENT replaces the urllib client, e.g. for a stub server.
+IMAGE_SIZES = {'tile': (360, 240), 'hero': (720, 500)}
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(basedir, '.cache', 'images'))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+IMAGE_FETCH_TIMEOUT = 10
+IMAGE_FETCH_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_RETRY_AFTER = 300
+IMAGE_MAX_AGE = 300
+IMAGE_HTTP_CLIENT = None
+
+# Production server (server.py). `flask fyyur serve` listens on SERVER_BIND
+# and forks SERVER_WORKERS workers, 0 meaning two per CPU plus one. It refuses
+# to start in debug mode, or with several workers and the 'lru'
+# VIEW_CACHE_BACKEND. Each worker holds one database connection at a time, and
+# the job process one per job thread (see JOB_WORKER_THREADS). A worker is
+# replaced after SERVER_MAX_REQUESTS requests (0 = never) plus up to
+# SERVER_MAX_REQUESTS_JITTER, so they do not all restart at once. Clients that
+# go quiet for SERVER_TIMEOUT seconds are dropped, and on shutdown or reload
+# workers get SERVER_GRACEFUL_TIMEOUT seconds to finish their request. PORT
+# and WEB_CONCURRENCY are what Heroku sets.
+SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:%s' % os.environ.get('PORT', 8000))
+SERVER_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 0))
+SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 1000))
+SERVER_MAX_REQUESTS_JITTER = 100
+SERVER_TIMEOUT = 30
+SERVER_GRACEFUL_TIMEOUT = 30
+SERVER_ACCESS_LOG = os.environ.get('SERVER_ACCESS_LOG', '0') not in ('0', 'false', 'no')
+
+# `flask fyyur bench` (bench.py) compares its results with BENCH_BASELINE and
+# fails when a route's p50 or p95 latency grew, or its throughput fell, by
+# more than BENCH_TOLERANCE, unless by less than BENCH_FLOOR_MS.
+BENCH_BASELINE = os.environ.get('BENCH_BASELINE', os.path.join(basedir, 'bench-baseline.json'))
+BENCH_TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', 0.25))
+BENCH_FLOOR_MS = 1.0
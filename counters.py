@@ -0,0 +1,159 @@
+#----------------------------------------------------------------------------#
+# Materialized show counters.
+#
+# Venue and Artist carry upcoming_shows_count and past_shows_count, so
+# listings and search results read them instead of counting Show rows. The
+# split is taken at a single watermark, counter_watermark.rolled_over_at,
+# rather than at "now":
+#
+#   - inserting or deleting a Show adjusts its venue's and artist's counters
+#     in the same transaction, on the side of the watermark it falls;
+#   - `flask fyyur counters rollover` (run it every minute or so) moves the
+#     shows that started since the last run from upcoming to past, advances
+#     the watermark and invalidates the cached pages of the venues and
+#     artists it touched;
+#   - `flask fyyur counters check [--fix]` recounts from Show and reports or
+#     repairs any drift, e.g. after bulk inserts that bypass the ORM.
+#
+# Both writers lock the watermark row (shared for show writes, exclusive for
+# the roll-over), so a show cannot be counted against a watermark that moves
+# under it.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+
+import click
+from sqlalchemy import bindparam, event, func, select
+
+from commands import clear_view_cache, fyyur_cli
+
+
+def owners(show):
+    # (owner table, Show foreign key) for each counted side of a show.
+    venue, artist = show.venue.property.mapper.class_, show.artist.property.mapper.class_
+    return ((venue.__table__, show.__table__.c.venue_id), (artist.__table__, show.__table__.c.artist_id))
+
+
+def adjust_statement(table, counter):
+    # Leaves updated_at alone: a counter moving is not an edit of the row.
+    return table.update().where(table.c.id == bindparam('owner_id')).values({
+        counter: table.c[counter] + bindparam('delta'),
+        'updated_at': table.c.updated_at,
+    })
+
+
+def watch_shows(show, watermark):
+    # Keeps the counters in step with ORM inserts and deletes of `show`.
+    sides = owners(show)
+
+    def adjust(connection, target, delta):
+        rolled_over_at = connection.execute(
+            select(watermark.c.rolled_over_at).where(watermark.c.id == 1).with_for_update(read=True)
+        ).scalar()
+        counter = 'upcoming_shows_count' if target.start_time > rolled_over_at else 'past_shows_count'
+        for table, column in sides:
+            connection.execute(adjust_statement(table, counter),
+                               {'owner_id': getattr(target, column.name), 'delta': delta})
+
+    @event.listens_for(show, 'after_insert')
+    def show_inserted(mapper, connection, target):
+        adjust(connection, target, 1)
+
+    @event.listens_for(show, 'after_delete')
+    def show_deleted(mapper, connection, target):
+        adjust(connection, target, -1)
+
+
+def roll_over(db, show, watermark, now=None):
+    # Moves the shows that started in (last watermark, now] to past and drops
+    # the cached pages of their venues and artists. Returns the number of
+    # shows moved.
+    from extensions import view_cache
+    now = now or datetime.now()
+    rolled_over_at = db.session.execute(
+        select(watermark.c.rolled_over_at).where(watermark.c.id == 1).with_for_update()
+    ).scalar()
+    if now <= rolled_over_at:
+        db.session.rollback()
+        return 0
+    started = (show.start_time > rolled_over_at) & (show.start_time <= now)
+    moved, tags = 0, []
+    for table, column in owners(show):
+        rows = db.session.query(column, func.count()).filter(started).group_by(column).all()
+        if rows:
+            db.session.execute(table.update().where(table.c.id == bindparam('owner_id')).values({
+                'upcoming_shows_count': table.c.upcoming_shows_count - bindparam('moved'),
+                'past_shows_count': table.c.past_shows_count + bindparam('moved'),
+                'updated_at': table.c.updated_at,
+            }), [{'owner_id': owner_id, 'moved': count} for owner_id, count in rows])
+        # Every show has one owner on each side, so both sides count the same.
+        moved = sum(count for _, count in rows)
+        tags.extend('%s:%d' % (table.name.lower(), owner_id) for owner_id, _ in rows)
+    db.session.execute(watermark.update().where(watermark.c.id == 1).values(rolled_over_at=now))
+    db.session.commit()
+    if tags:
+        view_cache.invalidate(*tags)
+    return moved
+
+
+def expected_counts(show, watermark, table, column):
+    # The counters recomputed from Show, as correlated subqueries per owner.
+    rolled_over_at = select(watermark.c.rolled_over_at).where(watermark.c.id == 1).scalar_subquery()
+    shows = select(func.count()).select_from(show.__table__).where(column == table.c.id)
+    return (
+        shows.where(show.start_time > rolled_over_at).scalar_subquery(),
+        shows.where(show.start_time <= rolled_over_at).scalar_subquery(),
+    )
+
+
+def check(db, show, watermark, fix=False):
+    # Returns [(table name, id, stored, expected)] for every owner whose
+    # counters disagree with Show; with fix=True they are corrected.
+    mismatches = []
+    for table, column in owners(show):
+        upcoming, past = expected_counts(show, watermark, table, column)
+        query = select(table.c.id, table.c.upcoming_shows_count, table.c.past_shows_count,
+                       upcoming.label('upcoming'), past.label('past'))
+        for id, stored_upcoming, stored_past, expected_upcoming, expected_past in db.session.execute(query):
+            if (stored_upcoming, stored_past) != (expected_upcoming, expected_past):
+                mismatches.append((table.name, id, (stored_upcoming, stored_past),
+                                   (expected_upcoming, expected_past)))
+        if fix:
+            db.session.execute(table.update().values({
+                'upcoming_shows_count': upcoming,
+                'past_shows_count': past,
+                'updated_at': table.c.updated_at,
+            }))
+    if fix:
+        db.session.commit()
+    return mismatches
+
+
+@fyyur_cli.group('counters')
+def counters_cli():
+    """Maintain the materialized upcoming/past show counters."""
+
+
+@counters_cli.command('rollover')
+def rollover_command():
+    """Move shows that have started from upcoming to past."""
+    from models import db, Show, counter_watermark
+    click.echo('%d shows rolled over.' % roll_over(db, Show, counter_watermark))
+
+
+@counters_cli.command('check')
+@click.option('--fix', is_flag=True, help='Rewrite the counters from the Show table.')
+def check_command(fix):
+    """Verify the counters against the Show table."""
+    from models import db, Show, counter_watermark
+    mismatches = check(db, Show, counter_watermark, fix=fix)
+    for table, id, stored, expected in mismatches:
+        click.echo('%s %d: stored upcoming/past %d/%d, expected %d/%d' % ((table, id) + stored + expected),
+                   err=True)
+    if mismatches and fix:
+        clear_view_cache()
+        click.echo('Fixed %d rows.' % len(mismatches))
+    elif mismatches:
+        raise click.ClickException('%d rows have drifted; run with --fix.' % len(mismatches))
+    else:
+        click.echo('Counters are consistent.')
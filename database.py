@@ -0,0 +1,57 @@
+#----------------------------------------------------------------------------#
+# Database engine setup.
+#
+# A Flask-SQLAlchemy subclass that applies the SQLite pragmas from config.py
+# to every new connection and, when a 'replica' bind is configured, sends the
+# queries of views marked @read_only to it. Everything else, and any session
+# that is flushing, stays on the primary.
+#----------------------------------------------------------------------------#
+
+import functools
+
+from flask import g, has_app_context, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        if (not self._flushing and has_app_context() and g.get('read_only') and
+                'replica' in (self.app.config.get('SQLALCHEMY_BINDS') or {})):
+            return get_state(self.app).db.get_engine(self.app, bind='replica')
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def init_app(self, app):
+        self.sqlite_pragmas = app.config.get('SQLITE_PRAGMAS', {})
+        super(RoutingSQLAlchemy, self).init_app(app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super(RoutingSQLAlchemy, self).create_engine(sa_url, engine_opts)
+        if engine.dialect.name == 'sqlite' and self.sqlite_pragmas:
+            pragmas = self.sqlite_pragmas
+
+            @event.listens_for(engine, 'connect')
+            def set_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for name, value in pragmas.items():
+                    cursor.execute('PRAGMA %s = %s' % (name, value))
+                cursor.close()
+        return engine
+
+
+def read_only(view):
+    # Lets the view's queries go to the read replica. A pending flash means the
+    # user has just written something, so that request reads its own write
+    # from the primary instead of a possibly lagging replica.
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = '_flashes' not in session
+        return view(*args, **kwargs)
+    return wrapper
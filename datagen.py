@@ -0,0 +1,347 @@
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#
+#   flask fyyur generate --scale 100k [--seed 0] [--anchor 2024-01-01] [--clear]
+#
+# Fills the database with made-up venues, artists and shows for load tests
+# and benchmarks (see bench.py). The same seed, counts and anchor date always
+# give the same rows. States and cities are weighted roughly by population,
+# genres follow the form choices with the popular ones more common, and a few
+# venues and artists get most of the shows, as in real listings. Shows run
+# from two years before the anchor to one year after it, in evening slots that
+# never double-book a venue or an artist.
+#----------------------------------------------------------------------------#
+
+import itertools
+import random
+from bisect import bisect
+from datetime import date, datetime, time, timedelta
+
+import click
+
+from commands import clear_view_cache, fyyur_cli, reset_sequence
+from geo import LOCATION_COLUMNS, locate
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1M': 1000000}
+
+# (state, population in millions, cities)
+PLACES = (
+    ('AL', 5.0, ('Birmingham', 'Montgomery', 'Huntsville')),
+    ('AK', 0.7, ('Anchorage', 'Fairbanks')),
+    ('AZ', 7.2, ('Phoenix', 'Tucson', 'Mesa')),
+    ('AR', 3.0, ('Little Rock', 'Fayetteville')),
+    ('CA', 39.2, ('Los Angeles', 'San Francisco', 'San Diego', 'San Jose', 'Oakland', 'Sacramento')),
+    ('CO', 5.8, ('Denver', 'Boulder', 'Colorado Springs')),
+    ('CT', 3.6, ('Hartford', 'New Haven')),
+    ('DE', 1.0, ('Wilmington', 'Dover')),
+    ('DC', 0.7, ('Washington',)),
+    ('FL', 21.8, ('Miami', 'Orlando', 'Tampa', 'Jacksonville')),
+    ('GA', 10.8, ('Atlanta', 'Athens', 'Savannah')),
+    ('HI', 1.4, ('Honolulu',)),
+    ('ID', 1.9, ('Boise',)),
+    ('IL', 12.7, ('Chicago', 'Springfield', 'Peoria')),
+    ('IN', 6.8, ('Indianapolis', 'Bloomington')),
+    ('IA', 3.2, ('Des Moines', 'Iowa City')),
+    ('KS', 2.9, ('Wichita', 'Lawrence')),
+    ('KY', 4.5, ('Louisville', 'Lexington')),
+    ('LA', 4.6, ('New Orleans', 'Baton Rouge')),
+    ('ME', 1.4, ('Portland',)),
+    ('MT', 1.1, ('Missoula', 'Billings')),
+    ('NE', 2.0, ('Omaha', 'Lincoln')),
+    ('NV', 3.2, ('Las Vegas', 'Reno')),
+    ('NH', 1.4, ('Manchester', 'Portsmouth')),
+    ('NJ', 9.3, ('Newark', 'Jersey City', 'Asbury Park')),
+    ('NM', 2.1, ('Albuquerque', 'Santa Fe')),
+    ('NY', 19.6, ('New York', 'Brooklyn', 'Buffalo', 'Rochester')),
+    ('NC', 10.7, ('Charlotte', 'Raleigh', 'Asheville')),
+    ('ND', 0.8, ('Fargo',)),
+    ('OH', 11.8, ('Columbus', 'Cleveland', 'Cincinnati')),
+    ('OK', 4.0, ('Oklahoma City', 'Tulsa')),
+    ('OR', 4.2, ('Portland', 'Eugene')),
+    ('MD', 6.2, ('Baltimore', 'Annapolis')),
+    ('MA', 7.0, ('Boston', 'Cambridge', 'Worcester')),
+    ('MI', 10.0, ('Detroit', 'Ann Arbor', 'Grand Rapids')),
+    ('MN', 5.7, ('Minneapolis', 'Saint Paul', 'Duluth')),
+    ('MS', 2.9, ('Jackson', 'Oxford')),
+    ('MO', 6.2, ('St. Louis', 'Kansas City')),
+    ('PA', 13.0, ('Philadelphia', 'Pittsburgh')),
+    ('RI', 1.1, ('Providence',)),
+    ('SC', 5.4, ('Charleston', 'Columbia')),
+    ('SD', 0.9, ('Sioux Falls',)),
+    ('TN', 7.1, ('Nashville', 'Memphis', 'Knoxville')),
+    ('TX', 30.5, ('Austin', 'Houston', 'Dallas', 'San Antonio', 'El Paso')),
+    ('UT', 3.4, ('Salt Lake City', 'Provo')),
+    ('VT', 0.6, ('Burlington',)),
+    ('VA', 8.7, ('Richmond', 'Norfolk', 'Charlottesville')),
+    ('WA', 7.8, ('Seattle', 'Spokane', 'Tacoma')),
+    ('WV', 1.8, ('Charleston', 'Morgantown')),
+    ('WI', 5.9, ('Milwaukee', 'Madison')),
+    ('WY', 0.6, ('Cheyenne', 'Laramie')),
+)
+
+# Relative weight of each genre of GENRE_CHOICES; unlisted ones weigh 1.
+GENRE_WEIGHTS = {
+    'Rock n Roll': 8, 'Pop': 7, 'Hip-Hop': 6, 'Alternative': 5, 'Electronic': 5, 'Jazz': 4,
+    'R&B': 4, 'Country': 4, 'Folk': 3, 'Punk': 3, 'Soul': 3, 'Blues': 3, 'Heavy Metal': 3,
+    'Classical': 2, 'Reggae': 2, 'Funk': 2,
+}
+
+ADJECTIVES = ('Blue', 'Velvet', 'Golden', 'Electric', 'Midnight', 'Silver', 'Crimson', 'Hidden', 'Wild',
+              'Lucky', 'Broken', 'Neon', 'Royal', 'Rusty', 'Little', 'Grand', 'Howling', 'Painted')
+PLACE_NOUNS = ('Room', 'Hall', 'Lounge', 'Tavern', 'Garage', 'Theatre', 'Ballroom', 'Cellar', 'Saloon',
+               'Warehouse', 'Club', 'Stage', 'Social', 'Parlor')
+BAND_NOUNS = ('Foxes', 'Rivers', 'Engines', 'Ghosts', 'Wolves', 'Lanterns', 'Sparrows', 'Mirrors',
+              'Horses', 'Pilots', 'Tigers', 'Strangers', 'Saints', 'Echoes')
+FIRST_NAMES = ('Ava', 'Ben', 'Carla', 'Dev', 'Elena', 'Felix', 'Grace', 'Hugo', 'Iris', 'Jonah', 'Kai',
+               'Lena', 'Marco', 'Nina', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tariq')
+LAST_NAMES = ('Adams', 'Brooks', 'Castillo', 'Diaz', 'Ellis', 'Fischer', 'Garcia', 'Haddad', 'Ito',
+              'Jensen', 'Kowalski', 'Lee', 'Moreau', 'Nakamura', 'Okafor', 'Park', 'Reyes', 'Silva')
+STREETS = ('Main St', 'Market St', 'Broadway', 'Oak Ave', 'Pine St', 'Elm St', 'Mission St',
+           'Valencia St', 'Maple Ave', 'Sunset Blvd', '2nd Ave', 'Water St')
+
+# Evening slots, three hours apart; a show ends before the next one starts.
+SLOT_HOURS = (17, 20, 23)
+SLOT_LENGTH = 180
+DURATIONS = (60, 90, 120, 150, 180)
+PAST_DAYS, UPCOMING_DAYS = 730, 365
+
+
+class WeightedChoice(object):
+    # random.choices() with the cumulative weights worked out once, so a pick
+    # among a million weights costs one bisect.
+
+    def __init__(self, items, weights):
+        self.items = items
+        self.cumulative = list(itertools.accumulate(weights))
+        self.total = self.cumulative[-1]
+
+    def __call__(self, rng):
+        return self.items[bisect(self.cumulative, rng.random() * self.total)]
+
+
+def zipf_weights(count, exponent=1.0):
+    return [1.0 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+class Generator(object):
+    # Builds the rows in the import file format (commands.FIELDS), ids and all.
+
+    def __init__(self, seed=0, anchor=None):
+        from choices import GENRE_CHOICES
+        self.seed = seed
+        self.anchor = anchor or date.today()
+        self.places = WeightedChoice(PLACES, [population for _, population, _ in PLACES])
+        genres = [value for value, _ in GENRE_CHOICES]
+        self.genres = WeightedChoice(genres, [GENRE_WEIGHTS.get(genre, 1) for genre in genres])
+
+    def rng(self, stream):
+        # One random stream per kind of row, so adding artists does not
+        # change the venues generated for the same seed.
+        return random.Random('%s:%s' % (self.seed, stream))
+
+    def place(self, rng):
+        state, _, cities = self.places(rng)
+        # The first city of a state is its biggest scene.
+        return state, cities[min(int(rng.expovariate(1.2)), len(cities) - 1)]
+
+    def genre_list(self, rng):
+        picked = []
+        for _ in range(rng.choice((1, 1, 2, 2, 3))):
+            genre = self.genres(rng)
+            if genre not in picked:
+                picked.append(genre)
+        return picked
+
+    def profile(self, rng, id, name):
+        state, city = self.place(rng)
+        slug = '%s-%d' % (''.join(ch for ch in name.lower() if ch.isalnum()), id)
+        return {
+            'id': id,
+            'name': name,
+            'city': city,
+            'state': state,
+            'phone': '%03d-%03d-%04d' % (rng.randint(201, 989), rng.randint(200, 999), rng.randint(0, 9999)),
+            'image_link': 'https://images.unsplash.com/photo-%d?w=600' % rng.randint(10 ** 9, 10 ** 10),
+            'facebook_link': 'https://www.facebook.com/%s' % slug,
+            'website_link': 'https://www.%s.com' % slug if rng.random() < 0.6 else None,
+            'genres': self.genre_list(rng),
+            'seeking_description': None,
+        }
+
+    def venue(self, rng, id):
+        row = self.profile(rng, id, '%s %s %s' % (
+            rng.choice(('The', 'The', 'Club')), rng.choice(ADJECTIVES), rng.choice(PLACE_NOUNS)))
+        row['address'] = '%d %s' % (rng.randint(1, 2999), rng.choice(STREETS))
+        row['seeking_talent'] = rng.random() < 0.3
+        if row['seeking_talent']:
+            row['seeking_description'] = 'Looking for %s acts on weekends.' % ' and '.join(row['genres'])
+        return row
+
+    def artist(self, rng, id):
+        if rng.random() < 0.4:
+            name = '%s %s' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+        else:
+            name = 'The %s %s' % (rng.choice(ADJECTIVES), rng.choice(BAND_NOUNS))
+        row = self.profile(rng, id, name)
+        row['seeking_venue'] = rng.random() < 0.4
+        if row['seeking_venue']:
+            row['seeking_description'] = 'Booking %s shows in %s.' % (row['genres'][0], row['city'])
+        return row
+
+    def venues(self, first_id, count):
+        rng = self.rng('venues:%d' % first_id)
+        for id in range(first_id, first_id + count):
+            yield self.venue(rng, id)
+
+    def artists(self, first_id, count):
+        rng = self.rng('artists:%d' % first_id)
+        for id in range(first_id, first_id + count):
+            yield self.artist(rng, id)
+
+    def shows(self, first_id, count, venue_ids, artist_ids):
+        # Spreads the shows evenly over the slots between PAST_DAYS before and
+        # UPCOMING_DAYS after the anchor. Within a slot every venue and artist
+        # appears at most once, which is all it takes to never double-book.
+        rng = self.rng('shows:%d' % first_id)
+        # Popularity should not follow the id order.
+        by_popularity = list(venue_ids), list(artist_ids)
+        for ids in by_popularity:
+            rng.shuffle(ids)
+        venues = WeightedChoice(by_popularity[0], zipf_weights(len(venue_ids), 0.8))
+        artists = WeightedChoice(by_popularity[1], zipf_weights(len(artist_ids), 0.8))
+        slots = (PAST_DAYS + UPCOMING_DAYS) * len(SLOT_HOURS)
+        per_slot = -(-count // slots)
+        if per_slot > min(len(venue_ids), len(artist_ids)):
+            raise click.ClickException('%d shows need more venues and artists than that.' % count)
+        first_day = datetime.combine(self.anchor, time()) - timedelta(days=PAST_DAYS)
+        booked_venues, booked_artists, current = set(), set(), None
+        for number in range(count):
+            slot = number * slots // count
+            if slot != current:
+                booked_venues, booked_artists, current = set(), set(), slot
+                start = first_day + timedelta(days=slot // len(SLOT_HOURS), hours=SLOT_HOURS[slot % len(SLOT_HOURS)])
+            venue_id = venues(rng)
+            while venue_id in booked_venues:
+                venue_id = rng.choice(venue_ids)
+            artist_id = artists(rng)
+            while artist_id in booked_artists:
+                artist_id = rng.choice(artist_ids)
+            booked_venues.add(venue_id)
+            booked_artists.add(artist_id)
+            offset = rng.choice((0, 0, 30))
+            yield {
+                'id': first_id + number,
+                'venue_id': venue_id,
+                'artist_id': artist_id,
+                'start_time': start + timedelta(minutes=offset),
+                'duration': rng.choice([minutes for minutes in DURATIONS if offset + minutes <= SLOT_LENGTH]),
+            }
+
+
+#  Writing
+#  ----------------------------------------------------------------
+
+def profile_mapping(row):
+    mapping = {key: value for key, value in row.items() if key not in ('genres', 'website_link')}
+    mapping['website'] = row['website_link']
+    if 'address' in row:
+        # A venue, placed like one created through the form.
+        mapping.update(zip(LOCATION_COLUMNS, locate(row['city'], row['state'])))
+    return mapping
+
+
+def next_id(db, model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def insert_profiles(db, model, association, owner_column, rows, genre_ids, chunk_size):
+    inserted = 0
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return inserted
+        db.session.execute(model.__table__.insert(), [profile_mapping(row) for row in chunk])
+        db.session.execute(association.insert(), [
+            {owner_column: row['id'], 'genre_id': genre_ids[name]} for row in chunk for name in row['genres']
+        ])
+        db.session.commit()
+        inserted += len(chunk)
+
+
+def insert_shows(db, rows, chunk_size):
+    from models import Show
+    inserted = 0
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return inserted
+        db.session.execute(Show.__table__.insert(), [{
+            'id': row['id'],
+            'venue_id': row['venue_id'],
+            'artist_id': row['artist_id'],
+            'start_time': row['start_time'],
+            'end_time': row['start_time'] + timedelta(minutes=row['duration']),
+        } for row in chunk])
+        db.session.commit()
+        inserted += len(chunk)
+
+
+def genre_ids(db):
+    from choices import GENRE_CHOICES
+    from models import Genre
+    ids = dict(db.session.query(Genre.name, Genre.id).all())
+    for name, _ in GENRE_CHOICES:
+        if name not in ids:
+            ids[name] = db.session.execute(Genre.__table__.insert().values(name=name)).inserted_primary_key[0]
+    db.session.commit()
+    return ids
+
+
+def clear(db):
+    from models import Artist, Show, Venue, artist_genres, venue_genres
+    for table in (Show.__table__, venue_genres, artist_genres, Venue.__table__, Artist.__table__):
+        db.session.execute(table.delete())
+    db.session.commit()
+
+
+@fyyur_cli.command('generate')
+@click.option('--scale', type=click.Choice(sorted(SCALES)), default='1k', show_default=True,
+              help='Venues, artists and shows to add, each.')
+@click.option('--venues', type=int, help='Overrides --scale for venues.')
+@click.option('--artists', type=int, help='Overrides --scale for artists.')
+@click.option('--shows', type=int, help='Overrides --scale for shows.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--anchor', type=click.DateTime(('%Y-%m-%d',)), help='Date the shows are spread around; defaults to today.')
+@click.option('--clear', 'clear_first', is_flag=True, help='Delete every venue, artist and show first.')
+@click.option('--chunk-size', default=10000, show_default=True, help='Rows per insert batch and commit.')
+def generate_command(scale, venues, artists, shows, seed, anchor, clear_first, chunk_size):
+    """Add deterministic synthetic venues, artists and shows."""
+    from models import db, Artist, Show, Venue, artist_genres, counter_watermark, venue_genres
+    from counters import check
+    count = SCALES[scale]
+    venues, artists, shows = (count if value is None else value for value in (venues, artists, shows))
+    if clear_first:
+        click.confirm('Delete every venue, artist and show in %s?' % db.engine.url.database, abort=True)
+        clear(db)
+    generator = Generator(seed, anchor.date() if anchor else None)
+    genres = genre_ids(db)
+
+    first_venue, first_artist = next_id(db, Venue), next_id(db, Artist)
+    click.echo('%d venues' % insert_profiles(db, Venue, venue_genres, 'venue_id', generator.venues(first_venue, venues),
+                                             genres, chunk_size), err=True)
+    click.echo('%d artists' % insert_profiles(db, Artist, artist_genres, 'artist_id', generator.artists(first_artist, artists),
+                                              genres, chunk_size), err=True)
+    if shows:
+        # Shows go to the generated venues and artists only.
+        if not venues or not artists:
+            raise click.ClickException('Shows need generated venues and artists.')
+        rows = generator.shows(next_id(db, Show), shows, list(range(first_venue, first_venue + venues)),
+                               list(range(first_artist, first_artist + artists)))
+        click.echo('%d shows' % insert_shows(db, rows, chunk_size), err=True)
+
+    for table in ('Venue', 'Artist', 'Show'):
+        reset_sequence(db, table)
+    # Like an import, the inserts bypass the ORM events behind the show
+    # counters and the cached pages.
+    check(db, Show, counter_watermark, fix=True)
+    clear_view_cache()
@@ -0,0 +1,32 @@
+#----------------------------------------------------------------------------#
+# Extensions.
+#
+# Created unbound here and attached to an application by create_app() in
+# app.py, so models, blueprints and commands can import them without
+# importing (and building) the application itself.
+#----------------------------------------------------------------------------#
+
+from assets import Assets
+from cache import ViewCache
+from compression import Compress
+from database import RoutingSQLAlchemy
+from jobs import Jobs
+from metrics import Metrics
+from thumbnails import Thumbnails
+
+db = RoutingSQLAlchemy()
+view_cache = ViewCache()
+assets = Assets()
+compress = Compress()
+metrics = Metrics()
+jobs = Jobs()
+thumbnails = Thumbnails()
+
+metrics.gauge('fyyur_view_cache_hits', 'View cache hits in this process.', lambda: view_cache.hits)
+metrics.gauge('fyyur_view_cache_misses', 'View cache misses in this process.', lambda: view_cache.misses)
+metrics.gauge('fyyur_view_cache_evictions', 'View cache evictions.', lambda: view_cache.backend.evictions)
+metrics.gauge('fyyur_image_cache_hits', 'Thumbnails served from the image cache in this process.', lambda: thumbnails.hits)
+metrics.gauge('fyyur_image_cache_misses', 'Thumbnails fetched or refused in this process.', lambda: thumbnails.misses)
+metrics.gauge('fyyur_image_cache_evictions', 'Images evicted from the image cache by this process.', lambda: thumbnails.cache.evictions)
+metrics.gauge('fyyur_jobs_queued', 'Background jobs waiting to run.', lambda: jobs.backend.count('queued'))
+metrics.gauge('fyyur_jobs_failed', 'Background jobs that ran out of attempts.', lambda: jobs.backend.count('failed'))
@@ -0,0 +1,77 @@
+#----------------------------------------------------------------------------#
+# Date formatting.
+#
+# Backs the `datetime` and `datetimes` Jinja filters. Show tiles repeat the
+# same handful of start times, so the work is cached at every level: babel
+# patterns and locales are compiled once per (format, locale), and the
+# formatted strings themselves are kept in a bounded memo. Listings format
+# all their start times in one call to format_datetimes.
+#
+# babel and dateutil are imported on the first miss rather than at startup;
+# only the show and detail pages format dates.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+from functools import lru_cache
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+# babel's own named formats combine separate date and time patterns, so those
+# are passed through rather than compiled here.
+BABEL_FORMATS = ('long', 'short')
+
+
+def to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    text = value.strip()
+    try:
+        # fromisoformat only learned the 'Z' suffix in Python 3.11.
+        return datetime.fromisoformat(text[:-1] + '+00:00' if text.endswith('Z') else text)
+    except ValueError:
+        import dateutil.parser
+        return dateutil.parser.parse(text)
+
+
+@lru_cache(maxsize=64)
+def compiled_pattern(format, locale):
+    from babel.core import Locale
+    from babel.dates import parse_pattern
+    return parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    # Aware datetimes at the same instant compare equal, so the zone is part
+    # of the memo key: 12:00+00:00 and 13:00+01:00 read differently.
+    return memoized_format(value, getattr(value, 'tzinfo', None), format, locale)
+
+
+def format_datetimes(values, format='medium', locale='en'):
+    # Formats a whole list of show times at once; repeated values in the list
+    # are formatted only once.
+    formatted = {}
+    result = []
+    for value in values:
+        key = value, getattr(value, 'tzinfo', None)
+        if key not in formatted:
+            formatted[key] = format_datetime(value, format, locale)
+        result.append(formatted[key])
+    return result
+
+
+@lru_cache(maxsize=8192)
+def memoized_format(value, tzinfo, format, locale):
+    from babel.dates import UTC, format_datetime as babel_format_datetime
+    date = to_datetime(value)
+    if format in BABEL_FORMATS:
+        return babel_format_datetime(date, format, locale=locale)
+    # As in babel.dates.format_datetime without a tzinfo: naive values are
+    # taken as UTC and aware ones keep their own offset, so both paths agree.
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=UTC)
+    pattern, locale = compiled_pattern(format, locale)
+    return pattern.apply(date, locale)
+
@@ -0,0 +1,225 @@
+#----------------------------------------------------------------------------#
+# Venue locations.
+#
+#   flask fyyur geocode [--all]
+#
+# Venues are placed at the centroid of their city, looked up offline in
+# data/city_centroids.csv; cities missing from it stay unplaced. Each placed
+# venue also stores its grid cell: the globe cut into CELL_DEGREES squares,
+# numbered row by row from the south-west. A radius search covers the
+# circle's bounding box with one run of consecutive cells per row, so the
+# (geocell, latitude, longitude) index reads only the venues of those few
+# cells, wherever they are; the latitude/longitude bounds then trim the
+# cells' overhang in the same query. The exact haversine distances of what is
+# left are computed in one pass, vectorized with numpy when it is installed,
+# per distinct point rather than per venue.
+#----------------------------------------------------------------------------#
+
+import csv
+import math
+import os
+from functools import lru_cache
+
+import click
+
+from commands import fyyur_cli
+
+CENTROIDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'city_centroids.csv')
+LOCATION_COLUMNS = ('latitude', 'longitude', 'geocell')
+
+CELL_DEGREES = 0.25
+COLUMNS = int(360 / CELL_DEGREES)
+ROWS = int(180 / CELL_DEGREES)
+EARTH_RADIUS_MILES = 3958.8
+
+
+def place_key(city, state):
+    # 'St. Louis', 'st louis' and 'Saint Louis' are one place.
+    words = (city or '').replace('.', ' ').lower().split()
+    if words and words[0] == 'saint':
+        words[0] = 'st'
+    return (state or '').strip().upper(), ' '.join(words)
+
+
+@lru_cache(maxsize=None)
+def centroids():
+    with open(CENTROIDS, newline='', encoding='utf-8') as f:
+        return {
+            place_key(row['city'], row['state']): (float(row['latitude']), float(row['longitude']))
+            for row in csv.DictReader(f)
+        }
+
+
+def cell(latitude, longitude):
+    row = min(int((latitude + 90) // CELL_DEGREES), ROWS - 1)
+    column = int((longitude + 180) // CELL_DEGREES) % COLUMNS
+    return row * COLUMNS + column
+
+
+def locate(city, state):
+    # (latitude, longitude, geocell) of a city, or Nones when it is unknown.
+    point = centroids().get(place_key(city, state))
+    if point is None:
+        return None, None, None
+    return point + (cell(*point),)
+
+
+#  Radius search
+#  ----------------------------------------------------------------
+
+def bounding_box(latitude, longitude, radius):
+    # (south, north, west, east) around a circle of `radius` miles; west and
+    # east may run past the antimeridian.
+    spread = math.degrees(radius / EARTH_RADIUS_MILES)
+    south, north = max(latitude - spread, -90.0), min(latitude + spread, 90.0)
+    if south == -90.0 or north == 90.0:
+        return south, north, -180.0, 180.0
+    # The widest part of the circle is at the latitude farthest from the
+    # equator, not at its centre.
+    widest = max(abs(south), abs(north))
+    width = math.degrees(radius / (EARTH_RADIUS_MILES * math.cos(math.radians(widest))))
+    if width >= 180:
+        return south, north, -180.0, 180.0
+    return south, north, longitude - width, longitude + width
+
+
+def cell_ranges(south, north, west, east):
+    # Inclusive runs of cell numbers covering the box, one or two per row.
+    if west < -180:
+        spans = [(west + 360, 180.0), (-180.0, east)]
+    elif east > 180:
+        spans = [(west, 180.0), (-180.0, east - 360)]
+    else:
+        spans = [(west, east)]
+    first_row = int((south + 90) // CELL_DEGREES)
+    last_row = min(int((north + 90) // CELL_DEGREES), ROWS - 1)
+    ranges = []
+    for row in range(first_row, last_row + 1):
+        for low, high in spans:
+            first = min(int((low + 180) // CELL_DEGREES), COLUMNS - 1)
+            last = min(int((high + 180) // CELL_DEGREES), COLUMNS - 1)
+            ranges.append((row * COLUMNS + first, row * COLUMNS + last))
+    return ranges
+
+
+@lru_cache(maxsize=None)
+def load_numpy():
+    # Optional, and too slow an import to pay for in every web worker that
+    # never runs a nearby search.
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def haversine(latitude, longitude, latitudes, longitudes):
+    # Miles from one point to each of the others.
+    numpy = load_numpy()
+    if numpy is not None:
+        lat1, lng1 = numpy.radians(latitude), numpy.radians(longitude)
+        lat2 = numpy.radians(numpy.asarray(latitudes, dtype=float))
+        lng2 = numpy.radians(numpy.asarray(longitudes, dtype=float))
+        a = numpy.sin((lat2 - lat1) / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lng2 - lng1) / 2) ** 2
+        return (2 * EARTH_RADIUS_MILES * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))).tolist()
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    cos_lat1, sin, cos, radians = math.cos(lat1), math.sin, math.cos, math.radians
+    distances = []
+    for lat2, lng2 in zip(latitudes, longitudes):
+        lat2 = radians(lat2)
+        a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((radians(lng2) - lng1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(min(a, 1.0))))
+    return distances
+
+
+def nearest(db, model, latitude, longitude, radius, limit):
+    # (count within the radius, [(id, miles)] of the `limit` nearest). Venues
+    # of a city share its point, so the box is read as points with their
+    # venue counts; distances are worked out per point, and ids are fetched
+    # for the nearest points only: all of them but the last hold fewer than
+    # `limit` venues, and the last one is read up to the limit.
+    south, north, west, east = bounding_box(latitude, longitude, radius)
+    if west < -180:
+        longitude_bounds = db.or_(model.longitude >= west + 360, model.longitude <= east)
+    elif east > 180:
+        longitude_bounds = db.or_(model.longitude >= west, model.longitude <= east - 360)
+    else:
+        longitude_bounds = model.longitude.between(west, east)
+    # A point has one cell; grouping by the cell as well would let SQLite
+    # walk the whole index for its order instead of searching the ranges.
+    points = db.session.query(
+        db.func.min(model.geocell), model.latitude, model.longitude, db.func.count(model.id)
+    ).filter(
+        db.or_(*(model.geocell.between(first, last) for first, last in cell_ranges(south, north, west, east))),
+        model.latitude.between(south, north),
+        longitude_bounds,
+    ).group_by(model.latitude, model.longitude).all()
+    if not points:
+        return 0, []
+    cells, latitudes, longitudes, counts = zip(*points)
+    within = sorted(
+        (miles, point) for miles, point in zip(haversine(latitude, longitude, latitudes, longitudes), points)
+        if miles <= radius
+    )
+    nearby, needed = [], limit
+    for miles, point in within:
+        if needed <= 0:
+            break
+        nearby.append((miles, point))
+        needed -= point[3]
+
+    def at(point):
+        return db.and_(model.geocell == point[0], model.latitude == point[1], model.longitude == point[2])
+
+    matches = []
+    if len(nearby) > 1:
+        distances = {point[:3]: miles for miles, point in nearby[:-1]}
+        rows = db.session.query(model.id, model.geocell, model.latitude, model.longitude).filter(
+            db.or_(*(at(point) for _, point in nearby[:-1]))
+        ).all()
+        matches = sorted((distances[tuple(row[1:])], row.id) for row in rows)
+    if nearby:
+        miles, point = nearby[-1]
+        rows = db.session.query(model.id).filter(at(point)).order_by(model.id).limit(limit - len(matches))
+        matches.extend((miles, id) for id, in rows)
+    return sum(point[3] for _, point in within), [(id, miles) for miles, id in matches]
+
+
+#  Backfill
+#  ----------------------------------------------------------------
+
+@fyyur_cli.command('geocode')
+@click.option('--all', 'everything', is_flag=True, help='Place every venue again, not only unplaced ones.')
+@click.option('--chunk-size', default=10000, show_default=True, help='Venues per batch and commit.')
+def geocode_command(everything, chunk_size):
+    """Place venues at their city's centroid for the nearby search."""
+    from models import db, Venue
+    table = Venue.__table__
+    placed = unknown = 0
+    last_id = 0
+    while True:
+        query = db.session.query(Venue.id, Venue.city, Venue.state).filter(Venue.id > last_id)
+        if not everything:
+            query = query.filter(Venue.latitude.is_(None))
+        rows = query.order_by(Venue.id).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        updates = []
+        for id, city, state in rows:
+            location = locate(city, state)
+            if location[0] is None:
+                unknown += 1
+            else:
+                placed += 1
+            # --all also clears venues whose city is no longer known.
+            if location[0] is not None or everything:
+                updates.append(dict(zip(LOCATION_COLUMNS, location), venue_id=id))
+        if updates:
+            # Not an edit of the venue, so updated_at stays.
+            db.session.execute(table.update().where(table.c.id == db.bindparam('venue_id')).values(
+                latitude=db.bindparam('latitude'), longitude=db.bindparam('longitude'),
+                geocell=db.bindparam('geocell'), updated_at=table.c.updated_at,
+            ), updates)
+            db.session.commit()
+    click.echo('%d venues placed; %d are in cities missing from %s.' % (placed, unknown, CENTROIDS))
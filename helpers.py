@@ -0,0 +1,237 @@
+#----------------------------------------------------------------------------#
+# Helpers shared by the venue, artist and show pages.
+#----------------------------------------------------------------------------#
+
+import hashlib
+from datetime import datetime, timezone
+
+from flask import Response, current_app, request, stream_with_context, url_for
+
+from extensions import jobs
+from ical import calendar
+from models import db, Artist, Genre, Show, Venue, counter_watermark
+
+
+def genre_names(genres):
+    return [genre.name for genre in genres]
+
+
+def genres_named(names):
+    # Genre rows for the submitted names, creating any that do not exist yet.
+    names = list(dict.fromkeys(names))
+    genres = Genre.query.filter(Genre.name.in_(names)).all() if names else []
+    found = set(genre_names(genres))
+    return genres + [Genre(name=name) for name in names if name not in found]
+
+
+def genre_facet(association, column):
+    # (genre, count) for every genre in use, in one grouped query.
+    return db.session.query(Genre.name, db.func.count(column)).join(
+        association, association.c.genre_id == Genre.id
+    ).group_by(Genre.id, Genre.name).order_by(Genre.name).all()
+
+
+def filter_by_genre(query, owner_id, association_owner_id, genre):
+    # Resolves the genre through its unique name, then walks the association
+    # table's (genre_id, owner id) index.
+    association = association_owner_id.table
+    return query.join(association, association_owner_id == owner_id).join(
+        Genre, Genre.id == association.c.genre_id
+    ).filter(Genre.name == genre)
+
+
+def queue_image_check(kind, owner):
+    # Checks a new or changed image link in the background; see tasks.py. The
+    # key makes a resubmitted form queue the check only once.
+    if owner.image_link:
+        digest = hashlib.sha1(owner.image_link.encode('utf-8')).hexdigest()[:16]
+        jobs.enqueue('images.check', key='images.check:%s:%d:%s' % (kind, owner.id, digest),
+                     kind=kind, id=owner.id, link=owner.image_link)
+
+
+def queue_match_refresh(kind, owner_id, version):
+    # Recomputes the match lists around a venue or artist whose genres, place
+    # or seeking flag changed, or that has a new past show; see matches.py.
+    # `version` names the change, so a resubmitted form queues it once.
+    jobs.enqueue('matches.refresh', key='matches.refresh:%s:%d:%s' % (kind, owner_id, version),
+                 kind=kind, id=owner_id)
+
+
+def match_profile(owner, seeking):
+    # What the match scores of a venue or artist depend on.
+    return genre_names(owner.genres), owner.city, owner.state, seeking
+
+
+def ranked_matches(table, owner_column, counterpart, counterpart_column, owner_id):
+    # The stored match list of a venue or artist, best first, read through
+    # the (owner, rank) primary key.
+    return db.session.query(counterpart.id, counterpart.name, counterpart.image_link).join(
+        table, counterpart_column == counterpart.id
+    ).filter(owner_column == owner_id).order_by(table.c.rank).all()
+
+
+def upcoming_show_counts(model, ids):
+    # The materialized upcoming counts for a page of venue or artist ids.
+    if not ids:
+        return {}
+    return dict(db.session.query(model.id, model.upcoming_shows_count).filter(model.id.in_(ids)).all())
+
+
+def partition_shows(column, owner_id, counterpart, now):
+    # One statement for every show of a venue or artist, with the counterpart
+    # joined in and the past/upcoming split computed by the database.
+    rows = db.session.query(Show, Show.start_time > now).options(
+        db.joinedload(counterpart)
+    ).filter(column == owner_id).order_by(Show.start_time, Show.id).all()
+    past_shows, upcoming_shows = [], []
+    for show, is_upcoming in rows:
+        (upcoming_shows if is_upcoming else past_shows).append(show)
+    return past_shows, upcoming_shows
+
+
+#  Conditional GET validators
+#  ----------------------------------------------------------------
+
+def page_validators(*values):
+    # Conditional GET validators for values read by one aggregate query: the
+    # values make up the ETag and the latest datetime among them is the page's
+    # Last-Modified.
+    stamps = [value for value in values if isinstance(value, datetime)]
+    return values, max(stamps) if stamps else None
+
+
+def table_aggregates(*models):
+    # Row count and latest update of whole tables, as scalar subqueries. The
+    # count catches deletions, which leave no update time behind.
+    columns = []
+    for model in models:
+        columns.append(db.session.query(db.func.count(model.id)).scalar_subquery())
+        columns.append(db.session.query(db.func.max(model.updated_at)).scalar_subquery())
+    return columns
+
+
+def table_validators(*models):
+    # Validators for the listing pages of whole tables.
+    return page_validators(*db.session.query(*table_aggregates(*models)).one())
+
+
+def listing_validators(model):
+    # The venue and artist listings carry each row's upcoming show count,
+    # which moves without touching the row (see counters.py). Besides the
+    # table's own aggregates: the latest show written catches bookings, the
+    # sum of the counters catches deletions, and the start of the latest show
+    # counted as past catches roll-overs that moved any (the watermark itself
+    # advances on every run). Counting Show would read every show instead.
+    # Start times are local, updated_at is UTC.
+    rolled_over_at = db.session.query(counter_watermark.c.rolled_over_at).filter(
+        counter_watermark.c.id == 1
+    ).scalar_subquery()
+    columns = table_aggregates(model) + [
+        db.session.query(db.func.max(Show.updated_at)).scalar_subquery(),
+        db.session.query(db.func.sum(model.upcoming_shows_count)).scalar_subquery(),
+        db.session.query(db.func.max(Show.start_time)).filter(Show.start_time <= rolled_over_at).scalar_subquery(),
+    ]
+    *values, latest_past = db.session.query(*columns).one()
+    if latest_past is not None:
+        latest_past = latest_past.astimezone(timezone.utc).replace(tzinfo=None)
+    return page_validators(*values, latest_past)
+
+
+def detail_validators(owner, owner_id, column, counterpart, counterpart_column, matches=None):
+    # Validators for a venue or artist page or feed: the row itself, its shows
+    # and the counterparts they show, plus the start time of its most recent
+    # past show, since a show moving from upcoming to past changes the page
+    # without any row being updated. `matches` is the (owner, counterpart)
+    # column pair of its match table, for pages that show its list too. Start
+    # times are local, updated_at is UTC.
+    now = datetime.now()
+    match_stamps = []
+    if matches is not None:
+        match_owner, match_counterpart = matches
+        listed = db.aliased(counterpart)
+        match_stamps = [
+            db.session.query(db.func.max(stamp)).select_from(match_owner.table).join(
+                listed, listed.id == match_counterpart
+            ).filter(match_owner == owner_id).scalar_subquery()
+            for stamp in (match_owner.table.c.updated_at, listed.updated_at)
+        ]
+    row = db.session.query(
+        owner.updated_at,
+        db.func.count(Show.id),
+        db.func.max(Show.updated_at),
+        db.func.max(counterpart.updated_at),
+        db.func.max(db.case([(Show.start_time <= now, Show.start_time)])),
+        *match_stamps
+    ).outerjoin(Show, column == owner.id).outerjoin(
+        counterpart, counterpart.id == counterpart_column
+    ).filter(owner.id == owner_id).group_by(owner.id, owner.updated_at).first()
+    if row is None:
+        return None
+    *values, latest_past = row[:5]
+    if latest_past is not None:
+        latest_past = latest_past.astimezone(timezone.utc).replace(tzinfo=None)
+    return page_validators(*values, latest_past, *row[5:])
+
+
+#  Rendering
+#  ----------------------------------------------------------------
+
+def stream_template(template_name, **context):
+    # Renders a template chunk by chunk; pair it with stream_with_context and a
+    # lazily evaluated iterable so the full result set is never held in memory.
+    current_app.update_template_context(context)
+    return current_app.jinja_env.get_template(template_name).generate(context)
+
+
+def search_response(index, model):
+    per_page = current_app.config['SEARCH_RESULTS_PER_PAGE']
+    page = request.form.get('page', 1, type=int)
+    count, matches = index.search(request.form.get('search_term', ''), page, per_page)
+    upcoming = upcoming_show_counts(model, [id for id, _ in matches])
+    return {
+        "count": count,
+        "page": page,
+        "pages": (count + per_page - 1) // per_page,
+        "data": [{
+            "id": id,
+            "name": name,
+            "num_upcoming_shows": upcoming.get(id, 0),
+        } for id, name in matches]
+    }
+
+
+#  Calendar feeds
+#  ----------------------------------------------------------------
+
+def show_calendar(name, column, owner_id):
+    # The upcoming shows of a venue or artist as an iCalendar feed, read in
+    # start order from the (owner, start_time) index and streamed as it goes.
+    rows = db.session.query(
+        Show.id, Show.start_time, Show.end_time, Show.updated_at, Show.venue_id, Venue.name,
+        Venue.address, Venue.city, Venue.state, Show.artist_id, Artist.name,
+    ).select_from(Show).join(Show.venue).join(Show.artist).filter(
+        column == owner_id, Show.start_time > datetime.now()
+    ).order_by(Show.start_time, Show.id).yield_per(current_app.config['STREAM_YIELD_PER'])
+    host = request.host.split(':')[0]
+    # Each event links to the page of the other side of the show.
+    by_venue = column is Show.venue_id
+
+    def events():
+        for (id, start_time, end_time, updated_at, venue_id, venue_name,
+             address, city, state, artist_id, artist_name) in rows:
+            link = (url_for('artists.show_artist', artist_id=artist_id, _external=True) if by_venue
+                    else url_for('venues.show_venue', venue_id=venue_id, _external=True))
+            yield {
+                'UID': 'show-%d@%s' % (id, host),
+                # updated_at is kept in UTC.
+                'DTSTAMP': updated_at.replace(tzinfo=timezone.utc),
+                'DTSTART': start_time,
+                'DTEND': end_time,
+                'SUMMARY': '%s at %s' % (artist_name, venue_name),
+                'LOCATION': ', '.join(part for part in (venue_name, address, city, state) if part),
+                'URL': link,
+            }
+
+    response = Response(stream_with_context(calendar(name, events())), mimetype='text/calendar')
+    response.headers['Content-Disposition'] = 'inline; filename="calendar.ics"'
+    return response
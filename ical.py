@@ -0,0 +1,69 @@
+#----------------------------------------------------------------------------#
+# iCalendar (RFC 5545) writer.
+#
+#   Response(stream_with_context(calendar('Shows at The Musical Hop', events)),
+#            mimetype='text/calendar')
+#
+# calendar() yields the feed in chunks of about CHUNK_BYTES while it reads
+# `events`, an iterable of dicts of VEVENT properties, so a feed of any
+# length streams straight from a database cursor. Lines are escaped and
+# folded at 75 octets as the RFC asks. Datetimes with a tzinfo are written in
+# UTC; naive ones, like show times, are written as floating local times.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime, timezone
+
+CHUNK_BYTES = 8192
+PRODUCT = '-//Fyyur//Show calendar//EN'
+
+
+def escape(text):
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def value(item):
+    if isinstance(item, datetime):
+        if item.tzinfo is not None:
+            return item.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        return item.strftime('%Y%m%dT%H%M%S')
+    return escape(item)
+
+
+def fold(line):
+    # Splits a content line into 75-octet pieces, continued with a leading
+    # space, never inside a UTF-8 sequence.
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    pieces, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        pieces.append(data[start:end].decode('utf-8'))
+        start, limit = end, 74
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def content_line(name, item):
+    return fold('%s:%s' % (name, value(item)))
+
+
+def calendar(name, events):
+    parts = [content_line(key, item) for key, item in (
+        ('BEGIN', 'VCALENDAR'), ('VERSION', '2.0'), ('PRODID', PRODUCT), ('CALSCALE', 'GREGORIAN'),
+        ('METHOD', 'PUBLISH'), ('X-WR-CALNAME', name),
+    )]
+    size = sum(map(len, parts))
+    for event in events:
+        lines = ['BEGIN:VEVENT\r\n']
+        lines.extend(content_line(key, item) for key, item in event.items() if item is not None)
+        lines.append('END:VEVENT\r\n')
+        parts.extend(lines)
+        size += sum(map(len, lines))
+        if size >= CHUNK_BYTES:
+            yield ''.join(parts)
+            parts, size = [], 0
+    parts.append('END:VCALENDAR\r\n')
+    yield ''.join(parts)
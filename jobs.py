@@ -0,0 +1,419 @@
+#----------------------------------------------------------------------------#
+# Background jobs.
+#
+#   jobs.enqueue('images.check', key='images.check:venue:3:...', kind='venue', id=3)
+#   flask fyyur worker [--threads 4] [--burst]
+#
+# Request handlers enqueue their slow side effects after the row commits and
+# return; worker threads run them. The queue backend is pluggable:
+#
+#   - 'sqlite' (default) keeps jobs in a SQLite file, so they survive a
+#     restart and every process on the host shares them;
+#   - 'memory' keeps them in the process and loses them on exit.
+#
+# The development server runs JOB_WORKER_THREADS threads, started on its
+# first enqueue (so after any fork). `flask fyyur worker` runs a dedicated
+# pool and also enqueues the periodic jobs of JOB_SCHEDULE; `flask fyyur
+# serve` forks one such process next to its workers (see server.py), so the
+# queue and the view cache files are on the host that reads them.
+#
+# A job that raises is retried with exponential backoff until it has been
+# tried JOB_MAX_ATTEMPTS times. A job enqueued with an idempotency key is only
+# queued once while a job with that key is pending, running or finished less
+# than JOB_RETENTION seconds ago. A claimed job is leased for JOB_LEASE
+# seconds; if its worker dies, another one picks it up after that, so jobs
+# must be safe to run twice.
+#----------------------------------------------------------------------------#
+
+import heapq
+import importlib
+import itertools
+import json
+import logging
+import os
+import random
+import signal
+import sqlite3
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+import click
+from flask import current_app
+
+from commands import fyyur_cli
+
+log = logging.getLogger('fyyur.jobs')
+
+Job = namedtuple('Job', 'id name payload attempts max_attempts')
+
+
+def backoff(attempts, base, cap):
+    # base, 2 * base, 4 * base, ... up to cap, with up to 10% jitter so jobs
+    # that failed together do not all come back together.
+    delay = min(base * 2 ** (attempts - 1), cap)
+    return delay * (1 + random.random() / 10)
+
+
+#  Backends
+#  ----------------------------------------------------------------
+
+class SQLiteQueue(object):
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            key TEXT UNIQUE,
+            state TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_at REAL NOT NULL,
+            leased_until REAL,
+            finished_at REAL,
+            error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ix_jobs_state_run_at ON jobs (state, run_at);
+    '''
+
+    def __init__(self, path, lease=300):
+        self.path = path
+        self.lease = lease
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # A throwaway connection, so a process that forks after this holds
+        # no open handle.
+        connection = sqlite3.connect(path, timeout=30)
+        try:
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.executescript(self.SCHEMA)
+        finally:
+            connection.close()
+
+    def _connection(self):
+        # One connection per thread and process; autocommit unless a
+        # transaction is opened explicitly.
+        cached = getattr(self._local, 'connection', None)
+        if cached is None or cached[0] != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA synchronous = NORMAL')
+            self._local.connection = cached = (os.getpid(), connection)
+        return cached[1]
+
+    def put(self, name, payload, key=None, delay=0, max_attempts=5):
+        # Returns False when `key` is already taken.
+        cursor = self._connection().execute(
+            'INSERT OR IGNORE INTO jobs (name, payload, key, max_attempts, run_at) VALUES (?, ?, ?, ?, ?)',
+            (name, json.dumps(payload), key, max_attempts, time.time() + delay)
+        )
+        return cursor.rowcount == 1
+
+    def claim(self):
+        # The oldest due job, or one whose worker let its lease run out.
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                "SELECT id, name, payload, attempts, max_attempts FROM jobs "
+                "WHERE (state = 'queued' AND run_at <= ?) OR (state = 'running' AND leased_until < ?) "
+                "ORDER BY run_at LIMIT 1", (now, now)
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET state = 'running', attempts = attempts + 1, leased_until = ? WHERE id = ?",
+                    (now + self.lease, row[0])
+                )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        id, name, payload, attempts, max_attempts = row
+        return Job(id, name, json.loads(payload), attempts + 1, max_attempts)
+
+    def complete(self, id):
+        self._connection().execute(
+            "UPDATE jobs SET state = 'done', leased_until = NULL, finished_at = ?, error = NULL WHERE id = ?",
+            (time.time(), id)
+        )
+
+    def retry(self, id, error, delay):
+        self._connection().execute(
+            "UPDATE jobs SET state = 'queued', leased_until = NULL, run_at = ?, error = ? WHERE id = ?",
+            (time.time() + delay, error, id)
+        )
+
+    def fail(self, id, error):
+        self._connection().execute(
+            "UPDATE jobs SET state = 'failed', leased_until = NULL, finished_at = ?, error = ? WHERE id = ?",
+            (time.time(), error, id)
+        )
+
+    def prune(self, retention):
+        # Forgets finished jobs, failed ones included, and frees their keys.
+        self._connection().execute(
+            "DELETE FROM jobs WHERE state IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - retention,)
+        )
+
+    def count(self, state):
+        return self._connection().execute('SELECT count(*) FROM jobs WHERE state = ?', (state,)).fetchone()[0]
+
+
+class MemoryQueue(object):
+
+    def __init__(self, lease=300):
+        self.lease = lease
+        self._jobs = {}
+        self._due = []
+        self._keys = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def put(self, name, payload, key=None, delay=0, max_attempts=5):
+        with self._lock:
+            if key is not None and key in self._keys:
+                return False
+            id = next(self._ids)
+            self._jobs[id] = {'name': name, 'payload': payload, 'key': key, 'state': 'queued',
+                              'attempts': 0, 'max_attempts': max_attempts, 'finished_at': None}
+            if key is not None:
+                self._keys[key] = id
+            heapq.heappush(self._due, (time.time() + delay, id))
+            return True
+
+    def claim(self):
+        with self._lock:
+            now = time.time()
+            if not self._due or self._due[0][0] > now:
+                return None
+            _, id = heapq.heappop(self._due)
+            job = self._jobs[id]
+            job['state'] = 'running'
+            job['attempts'] += 1
+            # No lease to expire: the queue dies with the process that runs it.
+            return Job(id, job['name'], job['payload'], job['attempts'], job['max_attempts'])
+
+    def complete(self, id):
+        with self._lock:
+            self._jobs[id].update(state='done', finished_at=time.time())
+
+    def retry(self, id, error, delay):
+        with self._lock:
+            self._jobs[id].update(state='queued', error=error)
+            heapq.heappush(self._due, (time.time() + delay, id))
+
+    def fail(self, id, error):
+        with self._lock:
+            self._jobs[id].update(state='failed', finished_at=time.time(), error=error)
+
+    def prune(self, retention):
+        with self._lock:
+            horizon = time.time() - retention
+            for id, job in list(self._jobs.items()):
+                if job['finished_at'] is not None and job['finished_at'] < horizon:
+                    del self._jobs[id]
+                    if job['key'] is not None:
+                        del self._keys[job['key']]
+
+    def count(self, state):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['state'] == state)
+
+
+#  Workers
+#  ----------------------------------------------------------------
+
+class Worker(object):
+    # A pool of threads claiming and running jobs until stopped.
+
+    def __init__(self, app, jobs, threads):
+        self.app = app
+        self.jobs = jobs
+        self.threads = threads
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self._threads = []
+        self._pruned_at = 0
+        self._prune_lock = threading.Lock()
+
+    def start(self):
+        self.jobs.load_tasks()
+        for number in range(self.threads):
+            thread = threading.Thread(target=self._run, name='fyyur-job-%d' % number, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        # Lets running jobs finish; queued ones stay queued.
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                ran = self.run_one()
+            except Exception:
+                log.exception('Job worker error')
+                ran = False
+            if not ran:
+                self._prune()
+                self.wakeup.wait(self.jobs.poll_interval)
+                self.wakeup.clear()
+
+    def run_one(self):
+        # Claims and runs one job; returns False when none was due.
+        try:
+            job = self.jobs.backend.claim()
+        except sqlite3.Error:
+            log.exception('Could not claim a job')
+            return False
+        if job is None:
+            return False
+        handler = self.jobs.handlers.get(job.name)
+        try:
+            if handler is None:
+                raise LookupError('No task named %r' % job.name)
+            with self.app.app_context():
+                handler(**job.payload)
+        except Exception:
+            error = traceback.format_exc()
+            if job.attempts >= job.max_attempts or handler is None:
+                log.error('Job %s %s failed for good after %d attempts:\n%s', job.id, job.name, job.attempts, error)
+                self.jobs.backend.fail(job.id, error)
+            else:
+                delay = backoff(job.attempts, self.jobs.retry_delay, self.jobs.retry_max_delay)
+                log.warning('Job %s %s failed (attempt %d), retrying in %.0fs:\n%s',
+                            job.id, job.name, job.attempts, delay, error)
+                self.jobs.backend.retry(job.id, error, delay)
+        else:
+            self.jobs.backend.complete(job.id)
+        return True
+
+    def _prune(self):
+        with self._prune_lock:
+            if time.time() - self._pruned_at < 600:
+                return
+            self._pruned_at = time.time()
+        try:
+            self.jobs.backend.prune(self.jobs.retention)
+        except sqlite3.Error:
+            log.exception('Could not prune finished jobs')
+
+
+class Jobs(object):
+
+    def __init__(self, app=None):
+        self.handlers = {}
+        self.backend = None
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('JOB_QUEUE_BACKEND', 'sqlite')
+        lease = app.config.get('JOB_LEASE', 300)
+        if kind == 'sqlite':
+            self.backend = SQLiteQueue(app.config['JOB_QUEUE_PATH'], lease)
+        elif kind == 'memory':
+            self.backend = MemoryQueue(lease)
+        else:
+            raise ValueError('Unknown JOB_QUEUE_BACKEND %r' % kind)
+        self.app = app
+        self.threads = app.config.get('JOB_WORKER_THREADS', 2)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 1.0)
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 5)
+        self.retry_delay = app.config.get('JOB_RETRY_DELAY', 5)
+        self.retry_max_delay = app.config.get('JOB_RETRY_MAX_DELAY', 3600)
+        self.retention = app.config.get('JOB_RETENTION', 24 * 3600)
+        self.schedule = app.config.get('JOB_SCHEDULE', {})
+        self.modules = app.config.get('JOB_MODULES', ('tasks',))
+        app.extensions['fyyur_jobs'] = self
+
+    def task(self, name):
+        # Registers the decorated function as the handler of jobs named `name`;
+        # it is called with the job's payload as keyword arguments.
+        def decorator(function):
+            self.handlers[name] = function
+            return function
+        return decorator
+
+    def load_tasks(self):
+        for module in self.modules:
+            importlib.import_module(module)
+
+    def enqueue(self, name, key=None, delay=0, max_attempts=None, **payload):
+        # Returns whether the job was queued. The row that asked for it has
+        # already committed, so a queue that cannot be written to is logged,
+        # not raised.
+        try:
+            queued = self.backend.put(name, payload, key, delay, max_attempts or self.max_attempts)
+        except sqlite3.Error:
+            log.exception('Could not enqueue %s %r', name, payload)
+            return False
+        if queued and self.threads:
+            self._local_worker().wakeup.set()
+        return queued
+
+    def _local_worker(self):
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._worker = Worker(self.app, self, self.threads)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+            return self._worker
+
+
+#  Command
+#  ----------------------------------------------------------------
+
+@fyyur_cli.command('worker')
+@click.option('--threads', type=int, help='Defaults to JOB_WORKER_THREADS, at least 1.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+def worker_command(threads, burst):
+    """Run background jobs until interrupted."""
+    jobs = current_app.extensions['fyyur_jobs']
+    worker = Worker(current_app._get_current_object(), jobs, max(threads or jobs.threads, 1))
+    if burst:
+        jobs.load_tasks()
+        ran = 0
+        while worker.run_one():
+            ran += 1
+        click.echo('Ran %d jobs.' % ran)
+        return
+
+    click.echo('Running jobs with %d threads.' % worker.threads, err=True)
+    run_schedule(jobs, worker)
+    click.echo('Stopping; waiting for running jobs.', err=True)
+    worker.stop()
+
+
+def run_schedule(jobs, worker):
+    # Starts `worker` and queues the jobs of JOB_SCHEDULE until SIGTERM or
+    # Ctrl-C; the caller then stops the worker.
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stopping.set())
+    worker.start()
+    try:
+        while not worker.stopping.is_set():
+            # Periodic jobs get one key per interval, so however many workers
+            # run the schedule, each run is queued once.
+            now = time.time()
+            for name, interval in jobs.schedule.items():
+                try:
+                    if jobs.backend.put(name, {}, '%s@%d' % (name, now // interval), 0, jobs.max_attempts):
+                        worker.wakeup.set()
+                except sqlite3.Error:
+                    log.exception('Could not enqueue %s', name)
+            worker.stopping.wait(1)
+    except KeyboardInterrupt:
+        pass
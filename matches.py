@@ -0,0 +1,322 @@
+#----------------------------------------------------------------------------#
+# Artist-venue match recommendations.
+#
+#   flask fyyur matches
+#   jobs.enqueue('matches.refresh', kind='venue', id=3)
+#
+# Venues seeking talent are matched with artists seeking a venue, and the
+# other way round. A pair's score is the MATCH_WEIGHTS-weighted sum of
+#
+#   - genre: the cosine similarity of their genre sets;
+#   - place: 1 in the same city, 0.5 in the same state;
+#   - history: 1 - 2 ** -n for the n past shows the pair has played together.
+#
+# The MATCH_RESULTS best matches of every venue and artist are stored, ranked,
+# in venue_matches and artist_matches, which the detail pages read by primary
+# key. Scoring is vectorized: each side's genres are scattered from the
+# association rows into one normalized row per venue or artist, so a block
+# of owners is scored against every candidate with one matrix product, and
+# place and history are added as whole-array operations. NumPy does this; it
+# is in requirements.txt, and the Python loop that runs the same sums without
+# it is only fit for small databases.
+#
+# The matches.rebuild job (see JOB_SCHEDULE) recomputes everything, which
+# also picks up shows that have moved into the past. After a profile or a
+# past show changes, matches.refresh recomputes the owner's own list and
+# the lists of the counterparts it was in or now scores high enough for;
+# scores are symmetric, so one row of scores tells which those are, and
+# most of those lists only need the owner merged in or out. It loads only
+# the profiles that share a genre, a state or past shows with the ones it
+# scores, since no other can score above zero against them.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+
+import click
+from flask import current_app
+
+from commands import fyyur_cli
+from extensions import view_cache
+from geo import load_numpy, place_key
+from models import db, Artist, Show, Venue, artist_genres, artist_matches, venue_genres, venue_matches
+
+# Score cells per block: owners per block times candidates. Blocks also
+# take at most 500 owners, the ids of one IN (...) list.
+BLOCK_CELLS = 4 * 1024 * 1024
+
+MATCH_TABLES = {'venue': venue_matches, 'artist': artist_matches}
+
+
+def describe(kind):
+    # (model, genre association, its owner column, seeking flag, show column).
+    if kind == 'venue':
+        return Venue, venue_genres, venue_genres.c.venue_id, Venue.seeking_talent, Show.venue_id
+    return Artist, artist_genres, artist_genres.c.artist_id, Artist.seeking_venue, Show.artist_id
+
+
+def other(kind):
+    return 'artist' if kind == 'venue' else 'venue'
+
+
+class Side(object):
+    # The venues or artists open to matches, as parallel lists by id; all of
+    # them, or those of `ids` when given.
+
+    def __init__(self, kind, places, ids=None):
+        model, association, owner_column, seeking, self.show_column = describe(kind)
+        self.table, self.column, self.counterpart = MATCH_TABLES[kind], kind + '_id', other(kind) + '_id'
+        self.kind = kind
+        rows = db.session.query(model.id, model.city, model.state).filter(seeking.is_(True))
+        genre_rows = db.session.query(owner_column, association.c.genre_id).join(
+            model, model.id == owner_column
+        ).filter(seeking.is_(True))
+        if ids is None:
+            rows, genre_rows = rows.order_by(model.id).all(), genre_rows.all()
+        else:
+            ids = sorted(ids)
+            chunks = [ids[start:start + 500] for start in range(0, len(ids), 500)]
+            rows = [row for chunk in chunks for row in rows.filter(model.id.in_(chunk)).order_by(model.id)]
+            genre_rows = [row for chunk in chunks for row in genre_rows.filter(owner_column.in_(chunk))]
+        self.ids = [row.id for row in rows]
+        self.position = {id: position for position, id in enumerate(self.ids)}
+        # Place codes are shared by both sides; a city code implies its state.
+        self.regions = [place_key(None, row.state) for row in rows]
+        self.cities = [places.setdefault(place_key(row.city, row.state), len(places)) for row in rows]
+        self.states = [places.setdefault(region, len(places)) for region in self.regions]
+        self.genres = [[] for _ in rows]
+        for id, genre_id in genre_rows:
+            self.genres[self.position[id]].append(genre_id)
+        self._arrays = None
+
+    @classmethod
+    def around(cls, kind, others, places, now):
+        # The venues or artists that can score above zero against any of
+        # `others`: those sharing a genre or a state with one of them, or
+        # with past shows together. Every other one scores zero, so it is on
+        # none of their lists and they are on none of its.
+        model, association, owner_column, seeking, show_column = describe(kind)
+        ids = set()
+        genre_ids = sorted({genre_id for genres in others.genres for genre_id in genres})
+        for start in range(0, len(genre_ids), 500):
+            ids.update(id for id, in db.session.query(owner_column).join(model, model.id == owner_column).filter(
+                seeking.is_(True), association.c.genre_id.in_(genre_ids[start:start + 500])
+            ).distinct())
+        # Normalized as place_key() does.
+        state = db.func.upper(db.func.trim(db.func.coalesce(model.state, '')))
+        regions = sorted({region[0] for region in others.regions})
+        for start in range(0, len(regions), 500):
+            ids.update(id for id, in db.session.query(model.id).filter(
+                seeking.is_(True), state.in_(regions[start:start + 500])
+            ))
+        for start in range(0, len(others.ids), 500):
+            ids.update(id for id, in db.session.query(show_column).filter(
+                others.show_column.in_(others.ids[start:start + 500]), Show.start_time <= now
+            ).distinct())
+        return cls(kind, places, ids)
+
+    def arrays(self, numpy, width):
+        # (genre matrix, city codes, state codes); the genre rows have unit
+        # length, so their dot products are cosine similarities.
+        if self._arrays is None:
+            matrix = numpy.zeros((len(self.ids), width), dtype=numpy.float32)
+            rows = [position for position, genres in enumerate(self.genres) for _ in genres]
+            columns = [genre_id for genres in self.genres for genre_id in genres]
+            matrix[rows, columns] = 1
+            norms = numpy.sqrt(matrix.sum(axis=1, keepdims=True))
+            numpy.divide(matrix, norms, out=matrix, where=norms > 0)
+            self._arrays = matrix, numpy.array(self.cities), numpy.array(self.states)
+        return self._arrays
+
+
+def past_pairs(owners, candidates, rows, now):
+    # (owner position, candidate position, past shows) for the owner rows.
+    ids = [owners.ids[row] for row in rows]
+    pairs = db.session.query(owners.show_column, candidates.show_column, db.func.count(Show.id)).filter(
+        owners.show_column.in_(ids), Show.start_time <= now
+    ).group_by(owners.show_column, candidates.show_column)
+    return [(owners.position[owner_id], candidates.position[candidate_id], count)
+            for owner_id, candidate_id, count in pairs if candidate_id in candidates.position]
+
+
+def score(owners, rows, candidates, weights, now):
+    # The score of every candidate for each of the owner rows: an array of
+    # shape (len(rows), len(candidates)), or a list of lists without NumPy.
+    pairs = past_pairs(owners, candidates, rows, now)
+    numpy = load_numpy()
+    if numpy is not None:
+        width = max([genre_id for genres in owners.genres + candidates.genres for genre_id in genres] or [0]) + 1
+        owner_genres, owner_cities, owner_states = owners.arrays(numpy, width)
+        genres, cities, states = candidates.arrays(numpy, width)
+        rows = numpy.asarray(rows)
+        scores = weights['genre'] * (owner_genres[rows] @ genres.T)
+        scores += weights['place'] / 2 * (owner_states[rows, None] == states)
+        scores += weights['place'] / 2 * (owner_cities[rows, None] == cities)
+        if pairs:
+            block_rows = {row: index for index, row in enumerate(rows.tolist())}
+            owner_positions, candidate_positions, counts = zip(*pairs)
+            scores[[block_rows[position] for position in owner_positions], list(candidate_positions)] += (
+                weights['history'] * (1 - 0.5 ** numpy.asarray(counts, dtype=numpy.float32)))
+        return scores
+    history = {(owner, candidate): count for owner, candidate, count in pairs}
+    candidate_genres = [set(genres) for genres in candidates.genres]
+    result = []
+    for row in rows:
+        genres, city, state = set(owners.genres[row]), owners.cities[row], owners.states[row]
+        scores = []
+        for position, other in enumerate(candidate_genres):
+            value = 0.0
+            if genres and other:
+                value += weights['genre'] * len(genres & other) / (len(genres) * len(other)) ** 0.5
+            value += weights['place'] / 2 * ((state == candidates.states[position]) + (city == candidates.cities[position]))
+            count = history.get((row, position))
+            if count:
+                value += weights['history'] * (1 - 0.5 ** count)
+            scores.append(value)
+        result.append(scores)
+    return result
+
+
+def best(scores, candidates, limit):
+    # [(candidate id, score)] of the `limit` best scores above zero in each
+    # row, best first; ties go to the older candidate.
+    numpy = load_numpy()
+    if numpy is not None:
+        if not len(candidates.ids):
+            return [[] for _ in range(len(scores))]
+        count = min(limit, scores.shape[1])
+        # The count-th best score of each row; all candidates tied with it
+        # are kept until sorted by position, which is id order.
+        bars = -numpy.partition(-scores, count - 1, axis=1)[:, count - 1]
+        result = []
+        for row, bar in zip(scores, bars):
+            columns = numpy.flatnonzero((row >= bar) & (row > 0))
+            values = row[columns]
+            order = numpy.lexsort((columns, -values))[:count]
+            result.append([(candidates.ids[column], value)
+                           for column, value in zip(columns[order].tolist(), values[order].tolist())])
+        return result
+    return [
+        [(candidates.ids[position], value) for value, position in
+         sorted(((value, position) for position, value in enumerate(row) if value > 0),
+                key=lambda pair: (-pair[0], pair[1]))[:limit]]
+        for row in scores
+    ]
+
+
+def store(owners, results):
+    # Replaces the lists of the owners in `results` ({owner id: [(candidate
+    # id, score)]}) that changed; returns their ids.
+    table = owners.table
+    owner_column, candidate_column = table.c[owners.column], table.c[owners.counterpart]
+    ids = list(results)
+    stored = {id: [] for id in ids}
+    for start in range(0, len(ids), 500):
+        rows = db.session.query(owner_column, candidate_column, table.c.score).filter(
+            owner_column.in_(ids[start:start + 500])
+        ).order_by(owner_column, table.c.rank)
+        for owner_id, candidate_id, value in rows:
+            stored[owner_id].append((candidate_id, value))
+    now = datetime.utcnow()
+    changed = [id for id in ids if stored[id] != [(candidate_id, round(value, 6)) for candidate_id, value in results[id]]]
+    for start in range(0, len(changed), 500):
+        chunk = changed[start:start + 500]
+        db.session.execute(table.delete().where(owner_column.in_(chunk)))
+        inserts = [{owners.column: id, 'rank': rank, owners.counterpart: candidate_id,
+                    'score': round(value, 6), 'updated_at': now}
+                   for id in chunk for rank, (candidate_id, value) in enumerate(results[id], 1)]
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+    return changed
+
+
+def recompute(owners, candidates, rows, config, now):
+    # Scores the owner rows in blocks and stores their new lists.
+    per_block = min(max(1, BLOCK_CELLS // max(len(candidates.ids), 1)), 500)
+    changed = []
+    for start in range(0, len(rows), per_block):
+        block = rows[start:start + per_block]
+        lists = best(score(owners, block, candidates, config['MATCH_WEIGHTS'], now), candidates, config['MATCH_RESULTS'])
+        changed.extend(store(owners, {owners.ids[row]: matches for row, matches in zip(block, lists)}))
+    return changed
+
+
+def invalidate(kind, ids):
+    if ids:
+        view_cache.invalidate(*('%s:%d' % (kind, id) for id in ids))
+
+
+def rebuild():
+    # Recomputes every list; returns the number that changed.
+    config, now, places = current_app.config, datetime.now(), {}
+    venues, artists = Side('venue', places), Side('artist', places)
+    changed = 0
+    for owners, candidates in ((venues, artists), (artists, venues)):
+        # Owners no longer open to matches lose their lists.
+        table, column = owners.table, owners.table.c[owners.column]
+        stale = [id for id, in db.session.query(column).distinct() if id not in owners.position]
+        for start in range(0, len(stale), 500):
+            db.session.execute(table.delete().where(column.in_(stale[start:start + 500])))
+        ids = recompute(owners, candidates, list(range(len(owners.ids))), config, now) + stale
+        db.session.commit()
+        invalidate(owners.kind, ids)
+        changed += len(ids)
+    return changed
+
+
+def refresh(kind, id):
+    # Brings the lists up to date after venue or artist `id` changed: its own
+    # list, and the lists of counterparts it was in or now belongs in. Only
+    # pairs with `id` changed score, so each counterpart is scored against
+    # as few profiles as settle its list; see Side.around().
+    config, now, places = current_app.config, datetime.now(), {}
+    limit = config['MATCH_RESULTS']
+    owners = Side(kind, places, [id])
+    table = MATCH_TABLES[other(kind)]
+    column, counterpart_column = table.c[other(kind) + '_id'], table.c[kind + '_id']
+    listed = set(counterpart_id for counterpart_id, in db.session.query(column).filter(counterpart_column == id))
+    # Scores are symmetric: what `id` scores on each counterpart's list.
+    scored = {}
+    if id in owners.position:
+        candidates = Side.around(other(kind), owners, places, now)
+        scores = score(owners, [0], candidates, config['MATCH_WEIGHTS'], now)
+        changed = store(owners, {id: best(scores, candidates, limit)[0]})
+        scored = {candidates.ids[position]: round(float(value), 6)
+                  for position, value in enumerate(scores[0]) if value > 0}
+    else:
+        changed = store(owners, {id: []})
+
+    ids = sorted(listed.union(scored))
+    held = {counterpart_id: [] for counterpart_id in ids}
+    for start in range(0, len(ids), 500):
+        rows = db.session.query(column, counterpart_column, table.c.score).filter(
+            column.in_(ids[start:start + 500])
+        ).order_by(column, table.c.rank)
+        for counterpart_id, owner_id, value in rows:
+            held[counterpart_id].append((owner_id, value))
+    # A list that `id` stays on, enters or was not full without is the best
+    # of its stored owners and `id`. One full without `id` after it fell or
+    # left needs whoever was next in line, so it is scored against all around.
+    # Full lists that `id` is not on and scores below are left alone.
+    reopened, kept = [], []
+    for counterpart_id, stored in held.items():
+        before, after = dict(stored).get(id), scored.get(counterpart_id)
+        if before is not None and len(stored) >= limit and (after is None or after < before):
+            reopened.append(counterpart_id)
+        elif before is not None or len(stored) < limit or after >= stored[-1][1]:
+            kept.append(counterpart_id)
+    counterparts = Side(other(kind), places, reopened)
+    changed_counterparts = recompute(counterparts, Side.around(kind, counterparts, places, now),
+                                     list(range(len(counterparts.ids))), config, now)
+    counterparts = Side(other(kind), places, kept)
+    pool = Side(kind, places, {owner_id for counterpart_id in kept for owner_id, _ in held[counterpart_id]} | {id})
+    changed_counterparts += recompute(counterparts, pool, list(range(len(counterparts.ids))), config, now)
+    db.session.commit()
+    invalidate(kind, changed)
+    invalidate(other(kind), changed_counterparts)
+    return len(changed) + len(changed_counterparts)
+
+
+@fyyur_cli.command('matches')
+def matches_command():
+    """Recompute the match recommendations of every venue and artist."""
+    click.echo('%d match lists changed.' % rebuild())
@@ -0,0 +1,187 @@
+#----------------------------------------------------------------------------#
+# Request instrumentation.
+#
+# Every request records its wall time, the time and number of SQL statements
+# it ran (cursor events on every engine, replica included) and the time spent
+# rendering templates. Wall times feed a latency histogram per endpoint that
+# /metrics serves in the Prometheus text format, statements slower than
+# SLOW_QUERY_MS are logged with the view that issued them, and with
+# SERVER_TIMING on the breakdown is echoed in a Server-Timing header.
+#
+# Streamed responses are measured up to the point the view returns, not to
+# the last byte sent.
+#
+# The histograms live in the process that recorded them. Under `flask fyyur
+# serve` with several workers, each scrape of /metrics is answered by one of
+# them and reports only its share of the requests, and a worker's counts
+# start over when SERVER_MAX_REQUESTS replaces it. Compare rates across
+# scrapes, not totals, or run --workers 1 where exact totals matter.
+#----------------------------------------------------------------------------#
+
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import (Response, before_render_template, current_app, g, has_request_context, request,
+                   template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_log = logging.getLogger('fyyur.slow_query')
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(object):
+
+    def __init__(self, app=None):
+        self.collectors = []
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.sql_seconds = defaultdict(float)
+        self.sql_queries = defaultdict(int)
+        self.template_seconds = defaultdict(float)
+        self.slow_queries = defaultdict(int)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.buckets = sorted(app.config.get('METRICS_BUCKETS', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)))
+        self.slow_query_ms = app.config.get('SLOW_QUERY_MS', 200)
+        self.server_timing = app.config.get('SERVER_TIMING', False)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.extensions['fyyur_metrics'] = self
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+    def gauge(self, name, help, collect):
+        # `collect` is called on every scrape and returns the current value.
+        self.collectors.append((name, help, collect))
+
+    #  Request hooks
+    #  ----------------------------------------------------------------
+
+    def _before_request(self):
+        g.timing = {'start': time.perf_counter(), 'sql': 0.0, 'queries': 0, 'template': 0.0}
+
+    def _before_render(self, sender, template, context, **extra):
+        if 'timing' in g:
+            g.timing['render_start'] = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        timing = g.get('timing')
+        if timing and 'render_start' in timing:
+            timing['template'] += time.perf_counter() - timing.pop('render_start')
+
+    def _after_request(self, response):
+        timing = g.pop('timing', None)
+        if timing is None or request.endpoint == 'metrics':
+            return response
+        total = time.perf_counter() - timing['start']
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = Histogram(self.buckets)
+            histogram.observe(total)
+            self.sql_seconds[endpoint] += timing['sql']
+            self.sql_queries[endpoint] += timing['queries']
+            self.template_seconds[endpoint] += timing['template']
+        if self.server_timing:
+            response.headers['Server-Timing'] = (
+                'sql;dur=%.1f;desc="%d queries", tpl;dur=%.1f, total;dur=%.1f' % (
+                    timing['sql'] * 1000, timing['queries'], timing['template'] * 1000, total * 1000))
+        return response
+
+    def record_slow_query(self, statement, seconds):
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            self.slow_queries[endpoint] += 1
+        slow_query_log.warning('slow query %.1fms in %s: %s', seconds * 1000, endpoint,
+                               ' '.join(statement.split())[:1000])
+
+    #  Exposition
+    #  ----------------------------------------------------------------
+
+    def view(self):
+        return Response(self.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines.append('# HELP fyyur_request_duration_seconds Request wall time by endpoint.')
+            lines.append('# TYPE fyyur_request_duration_seconds histogram')
+            for endpoint, histogram in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append('fyyur_request_duration_seconds_bucket{endpoint="%s",le="%s"} %d'
+                                 % (endpoint, _number(bound), cumulative))
+                lines.append('fyyur_request_duration_seconds_bucket{endpoint="%s",le="+Inf"} %d'
+                             % (endpoint, histogram.count))
+                lines.append('fyyur_request_duration_seconds_sum{endpoint="%s"} %s'
+                             % (endpoint, _number(histogram.sum)))
+                lines.append('fyyur_request_duration_seconds_count{endpoint="%s"} %d'
+                             % (endpoint, histogram.count))
+            _counter(lines, 'fyyur_sql_seconds_total', 'Time spent in SQL statements.', self.sql_seconds)
+            _counter(lines, 'fyyur_sql_queries_total', 'SQL statements executed.', self.sql_queries)
+            _counter(lines, 'fyyur_template_seconds_total', 'Time spent rendering templates.',
+                     self.template_seconds)
+            _counter(lines, 'fyyur_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.',
+                     self.slow_queries)
+        for name, help, collect in self.collectors:
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s gauge' % name)
+            lines.append('%s %s' % (name, _number(collect())))
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _counter(lines, name, help, values):
+    lines.append('# HELP %s %s' % (name, help))
+    lines.append('# TYPE %s counter' % name)
+    for endpoint, value in sorted(values.items()):
+        lines.append('%s{endpoint="%s"} %s' % (name, endpoint, _number(value)))
+
+
+#  SQL events
+#  ----------------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if not has_request_context():
+        return
+    timing = g.get('timing')
+    if timing is not None:
+        timing['sql'] += elapsed
+        timing['queries'] += 1
+    metrics = current_app.extensions.get('fyyur_metrics')
+    if metrics is not None and elapsed * 1000 >= metrics.slow_query_ms:
+        metrics.record_slow_query(statement, elapsed)
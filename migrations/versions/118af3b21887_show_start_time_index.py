@@ -0,0 +1,24 @@
+"""show start time index
+
+Revision ID: 118af3b21887
+Revises: 28167f729e03
+Create Date: 2026-10-18 09:53:48.160349
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '118af3b21887'
+down_revision = '28167f729e03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_start_time_id', table_name='Show')
@@ -0,0 +1,40 @@
+"""match tables
+
+Revision ID: 28167f729e03
+Revises: b3046a9e4240
+Create Date: 2026-10-18 09:45:57.083939
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '28167f729e03'
+down_revision = 'b3046a9e4240'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, owner, owner_table, counterpart, counterpart_table in (
+        ('venue_matches', 'venue_id', 'Venue', 'artist_id', 'Artist'),
+        ('artist_matches', 'artist_id', 'Artist', 'venue_id', 'Venue'),
+    ):
+        op.create_table(table,
+            sa.Column(owner, sa.Integer(), nullable=False),
+            sa.Column('rank', sa.Integer(), nullable=False),
+            sa.Column(counterpart, sa.Integer(), nullable=False),
+            sa.Column('score', sa.Float(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint([owner], ['%s.id' % owner_table], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint([counterpart], ['%s.id' % counterpart_table], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint(owner, 'rank'),
+        )
+        op.create_index('ix_%s_%s' % (table, counterpart), table, [counterpart], unique=False)
+
+
+def downgrade():
+    for table, counterpart in (('artist_matches', 'venue_id'), ('venue_matches', 'artist_id')):
+        op.drop_index('ix_%s_%s' % (table, counterpart), table_name=table)
+        op.drop_table(table)
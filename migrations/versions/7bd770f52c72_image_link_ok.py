@@ -0,0 +1,28 @@
+"""image link ok
+
+Revision ID: 7bd770f52c72
+Revises: c938415bc330
+Create Date: 2026-10-18 09:23:27.829690
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7bd770f52c72'
+down_revision = 'c938415bc330'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('image_link_ok', sa.Boolean(), nullable=True))
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('image_link_ok')
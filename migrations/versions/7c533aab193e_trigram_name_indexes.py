@@ -0,0 +1,30 @@
+"""trigram name indexes
+
+Revision ID: 7c533aab193e
+Revises: 3411950e89ed
+Create Date: 2026-10-18 08:50:08.477405
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c533aab193e'
+down_revision = '3411950e89ed'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_artist_name_trgm', 'Artist', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_venue_name_trgm', 'Venue', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_venue_name_trgm', table_name='Venue')
+    op.drop_index('ix_artist_name_trgm', table_name='Artist')
@@ -0,0 +1,36 @@
+"""show end time
+
+Revision ID: a70faa809ed0
+Revises: d9cba83fedfd
+Create Date: 2026-10-18 09:11:20.784060
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a70faa809ed0'
+down_revision = 'd9cba83fedfd'
+branch_labels = None
+depends_on = None
+
+
+# Shows booked before durations existed are taken to last two hours.
+DEFAULT_DURATION = 120
+
+
+def upgrade():
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.add_column(sa.Column('end_time', sa.DateTime(), nullable=True))
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("UPDATE \"Show\" SET end_time = datetime(start_time, '+%d minutes')" % DEFAULT_DURATION)
+    else:
+        op.execute("UPDATE \"Show\" SET end_time = start_time + interval '%d minutes'" % DEFAULT_DURATION)
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('end_time')
@@ -0,0 +1,33 @@
+"""venue location
+
+Revision ID: b3046a9e4240
+Revises: 7bd770f52c72
+Create Date: 2026-10-18 09:36:36.960618
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3046a9e4240'
+down_revision = '7bd770f52c72'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing venues are placed by `flask fyyur geocode` after the upgrade.
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('geocell', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_venue_geocell', ['geocell', 'latitude', 'longitude'])
+
+
+def downgrade():
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.drop_index('ix_venue_geocell')
+        batch_op.drop_column('geocell')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
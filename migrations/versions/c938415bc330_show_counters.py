@@ -0,0 +1,56 @@
+"""show counters
+
+Revision ID: c938415bc330
+Revises: a70faa809ed0
+Create Date: 2026-10-18 09:13:19.825018
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c938415bc330'
+down_revision = 'a70faa809ed0'
+branch_labels = None
+depends_on = None
+
+
+OWNERS = (
+    ('Venue', 'venue_id'),
+    ('Artist', 'artist_id'),
+)
+
+
+def upgrade():
+    watermark = op.create_table('counter_watermark',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_over_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    now = datetime.now()
+    op.bulk_insert(watermark, [{'id': 1, 'rolled_over_at': now}])
+
+    show = sa.table('Show', sa.column('venue_id'), sa.column('artist_id'), sa.column('start_time', sa.DateTime))
+    for table, column in OWNERS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+        # Start the counters off from the current shows, split at the watermark.
+        owner = sa.table(table, sa.column('id'), sa.column('upcoming_shows_count'), sa.column('past_shows_count'))
+        shows = sa.select(sa.func.count()).select_from(show).where(show.c[column] == owner.c.id)
+        op.execute(owner.update().values(
+            upcoming_shows_count=shows.where(show.c.start_time > now).scalar_subquery(),
+            past_shows_count=shows.where(show.c.start_time <= now).scalar_subquery(),
+        ))
+
+
+def downgrade():
+    for table, column in reversed(OWNERS):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
+    op.drop_table('counter_watermark')
@@ -0,0 +1,41 @@
+"""updated at columns
+
+Revision ID: d9cba83fedfd
+Revises: 2ae795059e93
+Create Date: 2026-10-18 09:08:33.757318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9cba83fedfd'
+down_revision = '2ae795059e93'
+branch_labels = None
+depends_on = None
+
+TABLES = (
+    ('Venue', 'ix_venue_updated_at'),
+    ('Artist', 'ix_artist_updated_at'),
+    ('Show', 'ix_show_updated_at'),
+)
+
+
+def upgrade():
+    # Existing rows start out as updated at migration time. The server default
+    # only exists to fill them in; the application sets the column itself.
+    for table, index in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                          server_default=sa.func.current_timestamp()))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('updated_at', server_default=None)
+        op.create_index(index, table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table, index in reversed(TABLES):
+        op.drop_index(index, table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
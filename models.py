@@ -0,0 +1,149 @@
+#----------------------------------------------------------------------------#
+# Models.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+
+from counters import watch_shows
+from extensions import db
+from search import NameSearch
+
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+
+# Genre filters look rows up by genre_id first, so the association tables
+# carry a (genre_id, owner id) index besides their primary key.
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+class Venue(db.Model):
+    __tablename__ = 'Venue'
+    # GIN trigram index behind ILIKE '%term%' search on PostgreSQL (pg_trgm).
+    __table_args__ = (
+        db.Index('ix_venue_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_venue_updated_at', 'updated_at'),
+        # Radius search reads whole grid cells; see geo.py.
+        db.Index('ix_venue_geocell', 'geocell', 'latitude', 'longitude'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    address = db.Column(db.String(120))
+    # The centroid of the city and its grid cell (geo.py); None for cities
+    # missing from data/city_centroids.csv.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geocell = db.Column(db.Integer)
+    phone = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    # Whether image_link served an image when last checked; None until the
+    # images.check job has run (see tasks.py).
+    image_link_ok = db.Column(db.Boolean)
+    facebook_link = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name')
+    website = db.Column(db.String(120))
+    seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    shows = db.relationship('Show', back_populates='venue', lazy=True, cascade='all, delete-orphan')
+
+class Artist(db.Model):
+    __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_artist_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_artist_updated_at', 'updated_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name')
+    image_link = db.Column(db.String(500))
+    # Whether image_link served an image when last checked; None until the
+    # images.check job has run (see tasks.py).
+    image_link_ok = db.Column(db.Boolean)
+    facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    shows = db.relationship('Show', back_populates='artist', lazy=True, cascade='all, delete-orphan')
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+    # Listing and detail pages always filter shows by venue or artist and then
+    # split on start_time, so both lookups get a composite index. The
+    # updated_at indexes keep the conditional GET validators to index lookups.
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_updated_at', 'updated_at'),
+        # /shows pages and date ranges in (start_time, id) order.
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    # Shows occupy [start_time, end_time); see scheduling.py.
+    end_time = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    venue = db.relationship('Venue', back_populates='shows')
+    artist = db.relationship('Artist', back_populates='shows')
+
+# The best matches of each venue seeking talent and each artist seeking a
+# venue, ranked from 1; see matches.py. The counterpart indexes find the lists
+# a venue or artist appears in.
+venue_matches = db.Table('venue_matches',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('rank', db.Integer, primary_key=True),
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False),
+    db.Column('score', db.Float, nullable=False),
+    db.Column('updated_at', db.DateTime, nullable=False),
+    db.Index('ix_venue_matches_artist_id', 'artist_id'),
+)
+
+artist_matches = db.Table('artist_matches',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('rank', db.Integer, primary_key=True),
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False),
+    db.Column('score', db.Float, nullable=False),
+    db.Column('updated_at', db.DateTime, nullable=False),
+    db.Index('ix_artist_matches_venue_id', 'venue_id'),
+)
+
+# Single row holding the moment the show counters were last rolled over;
+# see counters.py.
+counter_watermark = db.Table('counter_watermark',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('rolled_over_at', db.DateTime, nullable=False),
+)
+
+watch_shows(Show, counter_watermark)
+
+venue_search = NameSearch(db, Venue)
+artist_search = NameSearch(db, Artist)
@@ -0,0 +1,98 @@
+#----------------------------------------------------------------------------#
+# Outbound HTTP to links entered by users.
+#
+# Image links are fetched by the thumbnail proxy and checked by the
+# images.check job, so anyone who can edit a venue or artist could point the
+# server at itself, the database or a cloud metadata endpoint. open_public()
+# is urlopen restricted to the public internet: every connection, including
+# each redirect hop, resolves the host itself and refuses to connect unless
+# all of its addresses are global, then connects to the address it checked,
+# so a second lookup cannot answer differently. Proxies from the environment
+# are ignored and redirects may only lead to http(s) URLs. A refused URL
+# raises UnsafeURL, a ValueError, which callers treat like a malformed link.
+#----------------------------------------------------------------------------#
+
+import http.client
+import ipaddress
+import socket
+import urllib.parse
+import urllib.request
+
+
+class UnsafeURL(ValueError):
+    pass
+
+
+def public_addresses(host, port):
+    # The addresses `host` resolves to, or UnsafeURL if any is loopback,
+    # private, link-local or otherwise not on the public internet.
+    addresses = []
+    for _, _, _, _, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        address = ipaddress.ip_address(sockaddr[0])
+        if not address.is_global:
+            raise UnsafeURL('%s resolves to the non-public address %s' % (host, address))
+        if sockaddr[0] not in addresses:
+            addresses.append(sockaddr[0])
+    return addresses
+
+
+def connect(host, port, timeout, source_address=None):
+    error = None
+    for address in public_addresses(host, port):
+        try:
+            return socket.create_connection((address, port), timeout, source_address)
+        except OSError as e:
+            error = e
+    raise error or OSError('%s did not resolve' % host)
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+
+    def connect(self):
+        self.sock = connect(self.host, self.port, self.timeout, self.source_address)
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+
+    def connect(self):
+        sock = connect(self.host, self.port, self.timeout, self.source_address)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+class RedirectHandler(urllib.request.HTTPRedirectHandler):
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if urllib.parse.urlsplit(newurl).scheme not in ('http', 'https'):
+            raise UnsafeURL('redirect to %s' % newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def opener():
+    # Built by hand rather than with build_opener(), which would add the
+    # environment's proxies and the ftp, file and data handlers.
+    director = urllib.request.OpenerDirector()
+    for handler in (PublicHTTPHandler(), PublicHTTPSHandler(), RedirectHandler(),
+                    urllib.request.HTTPDefaultErrorHandler(), urllib.request.HTTPErrorProcessor(),
+                    urllib.request.UnknownHandler()):
+        director.add_handler(handler)
+    return director
+
+
+def open_public(request, timeout):
+    # urlopen(request, timeout=timeout) for public http(s) URLs only.
+    url = request.full_url if isinstance(request, urllib.request.Request) else request
+    if urllib.parse.urlsplit(url).scheme not in ('http', 'https'):
+        raise UnsafeURL('not an http(s) URL')
+    return opener().open(request, timeout=timeout)
@@ -0,0 +1,58 @@
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#
+# Listings page with `WHERE (sort columns) > (last row seen)` rather than
+# OFFSET, so every page costs the same index range scan however deep it is.
+# The last row's sort key travels between requests as an opaque `after`
+# cursor in the query string.
+#----------------------------------------------------------------------------#
+
+import base64
+import json
+from datetime import datetime
+
+from flask import abort, current_app, request
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, columns):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(token)
+        return [
+            datetime.fromisoformat(value) if column.type.python_type is datetime else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        abort(400)
+
+
+def page_size():
+    per_page = request.args.get('per_page', current_app.config['LISTING_PAGE_SIZE'], type=int)
+    return max(1, min(per_page, current_app.config['LISTING_MAX_PAGE_SIZE']))
+
+
+def keyset_page(query, columns, key):
+    # Returns (rows, next_cursor) for the page after the request's `after`
+    # cursor; `key` maps a row back to its values for `columns`.
+    per_page = page_size()
+    token = request.args.get('after')
+    if token:
+        values = decode_cursor(token, columns)
+        if len(columns) == 1:
+            query = query.filter(columns[0] > values[0])
+        else:
+            query = query.filter(tuple_(*columns) > tuple_(*values))
+    rows = query.order_by(*columns).limit(per_page + 1).all()
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    return rows, encode_cursor(key(rows[-1]))
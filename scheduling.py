@@ -0,0 +1,78 @@
+#----------------------------------------------------------------------------#
+# Booking conflicts.
+#
+# A show occupies [start_time, end_time); back-to-back shows do not clash.
+# Shows last at most MAX_DURATION, so anything overlapping [start, end) must
+# start inside (start - MAX_DURATION, end). That bound turns the overlap test
+# into a range scan on the (venue_id, start_time) and (artist_id, start_time)
+# indexes instead of a scan over every show of the venue or artist.
+#----------------------------------------------------------------------------#
+
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.sql.expression import Grouping
+
+MAX_DURATION = timedelta(hours=24)
+DEFAULT_DURATION = 120  # minutes
+
+
+def slot_conditions(show, venue_id, artist_id, start, end):
+    window = (show.start_time > start - MAX_DURATION, show.start_time < end, show.end_time > start)
+    return [and_(show.venue_id == venue_id, *window), and_(show.artist_id == artist_id, *window)]
+
+
+def any_of(conditions):
+    # or_() as a balanced tree of parenthesized groups: SQLite parses a flat
+    # chain of ORs into an expression as deep as it is long and refuses any
+    # deeper than 1000, i.e. a batch of 500 slots.
+    if len(conditions) <= 64:
+        return or_(*conditions)
+    middle = len(conditions) // 2
+    return or_(Grouping(any_of(conditions[:middle])), Grouping(any_of(conditions[middle:])))
+
+
+def find_conflicts(session, show, slots):
+    # `slots` is a list of (venue_id, artist_id, start, end). Returns, per
+    # slot, the booked shows and the other slots of the same batch it clashes
+    # with, all from a single query.
+    conflicts = [[] for _ in slots]
+    if not slots:
+        return conflicts
+    conditions = [condition for slot in slots for condition in slot_conditions(show, *slot)]
+    rows = session.query(show.id, show.venue_id, show.artist_id, show.start_time, show.end_time).filter(
+        any_of(conditions)
+    ).all()
+
+    by_venue, by_artist = defaultdict(list), defaultdict(list)
+    for row in rows:
+        by_venue[row.venue_id].append(row)
+        by_artist[row.artist_id].append(row)
+    for index, (venue_id, artist_id, start, end) in enumerate(slots):
+        for reason, booked in (('venue', by_venue[venue_id]), ('artist', by_artist[artist_id])):
+            for row in booked:
+                if row.start_time < end and row.end_time > start:
+                    conflicts[index].append({'show_id': row.id, 'conflict': reason})
+
+    _batch_conflicts(slots, 0, 'venue', conflicts)
+    _batch_conflicts(slots, 1, 'artist', conflicts)
+    return conflicts
+
+
+def _batch_conflicts(slots, key, reason, conflicts):
+    # Sweep over each venue's (or artist's) proposed slots in start order,
+    # keeping the slots still running.
+    groups = defaultdict(list)
+    for index, slot in enumerate(slots):
+        groups[slot[key]].append(index)
+    for indexes in groups.values():
+        indexes.sort(key=lambda index: slots[index][2])
+        running = []
+        for index in indexes:
+            start = slots[index][2]
+            running = [other for other in running if slots[other][3] > start]
+            for other in running:
+                conflicts[index].append({'slot': other, 'conflict': reason})
+                conflicts[other].append({'slot': index, 'conflict': reason})
+            running.append(index)
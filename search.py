@@ -0,0 +1,241 @@
+#----------------------------------------------------------------------------#
+# Name search.
+#
+# Case-insensitive partial matching over Venue.name and Artist.name without a
+# full table scan per keystroke. On PostgreSQL with pg_trgm the GIN trigram
+# index created by the migrations answers `ILIKE '%term%'` directly; every
+# other backend gets an in-process trigram inverted index that is built on the
+# first search and then kept current from committed session changes.
+#
+# The in-process index only sees writes made through the ORM by its own
+# process, so multi worker deployments should run against PostgreSQL; `flask
+# fyyur serve` and `flask fyyur import` warn when they would not.
+#----------------------------------------------------------------------------#
+
+import heapq
+import threading
+from bisect import bisect_left, insort
+
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+# A search ranks at most this many matches...
+CANDIDATES = 1000
+# ...found among at most this many names that share its rarest trigram.
+SCAN_LIMIT = 20000
+
+
+def grams(value):
+    # The empty string, whose posting holds every name, and every substring
+    # of two or three characters, so that terms that short are looked up
+    # directly instead of being matched against names.
+    found = {value[i:i + 2] for i in range(len(value) - 1)}
+    found.update([value[i:i + 3] for i in range(len(value) - 2)])
+    found.add('')
+    return found
+
+
+def rank(lowered, term):
+    # Exact matches first, then prefixes, then matches at a word boundary, then
+    # anything else; ties go to the earlier match and the shorter name.
+    position = lowered.find(term)
+    if lowered == term:
+        tier = 0
+    elif position == 0:
+        tier = 1
+    elif not lowered[position - 1].isalnum():
+        tier = 2
+    else:
+        tier = 3
+    return (tier, position, len(lowered), lowered)
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class TrigramIndex(object):
+    # Postings are lists of name keys, (length, lowered, id, name), kept in
+    # key order: shortest names first, which is how rank() breaks most ties.
+    # A term of two or three characters reads the first CANDIDATES keys of
+    # its own posting. Any other walks the shortest posting of its trigrams,
+    # or every name for a single character, in that order and stops after
+    # CANDIDATES matches or SCAN_LIMIT names, when the count becomes an
+    # estimate. Either way the work does not grow with the table, and only
+    # the shortest matching names are ranked for the page.
+
+    def __init__(self):
+        self._keys = {}
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def load(self, rows):
+        # Bulk (id, name) rows into an empty index: appending in key order
+        # keeps every posting sorted without sorting each one.
+        keys = sorted((len(name), name.lower(), id, name) for id, name in rows if name is not None)
+        postings = {}
+        for key in keys:
+            for gram in grams(key[1]):
+                postings.setdefault(gram, []).append(key)
+        with self._lock:
+            self._keys = {key[2]: key for key in keys}
+            self._postings = postings
+
+    def add(self, id, name):
+        with self._lock:
+            self._discard(id)
+            if name is None:
+                return
+            lowered = name.lower()
+            key = self._keys[id] = (len(lowered), lowered, id, name)
+            for gram in grams(lowered):
+                insort(self._postings.setdefault(gram, []), key)
+
+    def remove(self, id):
+        with self._lock:
+            self._discard(id)
+
+    def update(self, changes):
+        # {id: name, or None for a removed row}.
+        for id, name in changes.items():
+            self.add(id, name)
+
+    def _discard(self, id):
+        key = self._keys.pop(id, None)
+        if key is None:
+            return
+        for gram in grams(key[1]):
+            posting = self._postings[gram]
+            del posting[bisect_left(posting, key)]
+            if not posting:
+                del self._postings[gram]
+
+    def search(self, term, offset=0, limit=20):
+        # Returns (total matches, [(id, name), ...]) for one ranked page.
+        term = term.strip().lower()
+        wanted = max(CANDIDATES, offset + limit)
+        if len(term) in (0, 2, 3):
+            # Every name in the term's own posting matches.
+            with self._lock:
+                posting = self._postings.get(term, ())
+                total = len(posting)
+                matches = posting[:wanted]
+        else:
+            budget = max(SCAN_LIMIT, 20 * wanted)
+            walked = [term[i:i + 3] for i in range(len(term) - 2)] or ['']
+            with self._lock:
+                posting = min((self._postings.get(gram, ()) for gram in walked), key=len)
+                size = len(posting)
+                scanned = posting[:budget]
+            matches = []
+            for position, key in enumerate(scanned, 1):
+                if term in key[1]:
+                    matches.append(key)
+                    if len(matches) == wanted:
+                        break
+            else:
+                position = len(scanned)
+            total = len(matches) if position == size else len(matches) * size // max(position, 1)
+        page = heapq.nsmallest(offset + limit, matches, key=lambda key: rank(key[1], term))[offset:]
+        return total, [(key[2], key[3]) for key in page]
+
+
+class NameSearch(object):
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+        self._index = None
+        self._use_database = None
+        self._build_lock = threading.Lock()
+        # Guards _index and _backlog, which holds the changes committed while
+        # the index is being built, to replay on top of its snapshot.
+        self._lock = threading.Lock()
+        self._backlog = None
+        self._pending_key = 'search.pending.' + model.__tablename__
+        event.listen(Session, 'after_flush', self._collect)
+        event.listen(Session, 'after_commit', self._apply)
+        event.listen(Session, 'after_rollback', self._discard)
+
+    def search(self, term, page=1, per_page=20):
+        page = max(page, 1)
+        if self.uses_database():
+            return self._search_database(term, (page - 1) * per_page, per_page)
+        return self._memory_index().search(term, (page - 1) * per_page, per_page)
+
+    def uses_database(self):
+        # True when searches go to the database, so every process sees every
+        # write; False for the in-process index.
+        if self._use_database is None:
+            backend = current_app.config.get('SEARCH_BACKEND', 'auto')
+            if backend == 'auto':
+                self._use_database = (
+                    self.db.engine.dialect.name == 'postgresql' and
+                    self.db.session.execute(
+                        text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                    ).scalar() is not None
+                )
+            else:
+                self._use_database = backend == 'database'
+        return self._use_database
+
+    def _search_database(self, term, offset, limit):
+        term = term.strip()
+        name = self.model.name
+        query = self.db.session.query(self.model.id, name).filter(
+            name.ilike('%' + escape_like(term) + '%', escape='\\')
+        )
+        count = query.count()
+        if self.db.engine.dialect.name == 'postgresql':
+            query = query.order_by(self.db.func.similarity(name, term).desc(), self.model.id)
+        else:
+            query = query.order_by(self.db.func.length(name), self.model.id)
+        return count, [tuple(row) for row in query.offset(offset).limit(limit)]
+
+    def _memory_index(self):
+        if self._index is None:
+            with self._build_lock:
+                if self._index is None:
+                    with self._lock:
+                        self._backlog = []
+                    index = TrigramIndex()
+                    index.load(self.db.session.query(self.model.id, self.model.name).yield_per(10000))
+                    # A change may be both in the snapshot and the backlog;
+                    # add and remove are idempotent.
+                    with self._lock:
+                        for pending in self._backlog:
+                            index.update(pending)
+                        self._index, self._backlog = index, None
+        return self._index
+
+    #  Incremental updates
+    #  ----------------------------------------------------------------
+
+    def _collect(self, session, flush_context):
+        # Collected even before the index exists: it may be building.
+        if self._use_database:
+            return
+        pending = session.info.setdefault(self._pending_key, {})
+        for obj in session.new.union(session.dirty):
+            if isinstance(obj, self.model):
+                pending[obj.id] = obj.name
+        for obj in session.deleted:
+            if isinstance(obj, self.model):
+                pending[obj.id] = None
+
+    def _apply(self, session):
+        pending = session.info.pop(self._pending_key, None)
+        if not pending:
+            return
+        with self._lock:
+            if self._index is not None:
+                self._index.update(pending)
+            elif self._backlog is not None:
+                self._backlog.append(pending)
+
+    def _discard(self, session):
+        session.info.pop(self._pending_key, None)
@@ -0,0 +1,551 @@
+#----------------------------------------------------------------------------#
+# Production server.
+#
+#   flask fyyur serve [--bind 0.0.0.0:8000] [--workers 4] [--max-requests 1000]
+#   kill -HUP <pid>     reload the code without dropping a connection
+#   kill -TERM <pid>    finish the requests in flight and exit (also Ctrl-C)
+#   kill -QUIT <pid>    exit at once
+#   flask fyyur memory [--workers 2] [--requests 6000]
+#
+# A prefork server: the master process builds the app once, warms what the
+# workers would otherwise each load on their first requests (every template,
+# the forms and their option markup, the mappers and engines, the lazily
+# imported packages and the job handlers) and then forks SERVER_WORKERS
+# workers, which share it all copy-on-write. Each worker serves one request at
+# a time with werkzeug's WSGI handler, accepting from the listening socket
+# the master opened, and exits after about SERVER_MAX_REQUESTS requests to
+# be replaced by a fresh fork. Building the app once also gives every worker
+# the same config, SECRET_KEY included. The server does not start in debug
+# mode, nor with several workers and a view cache each (VIEW_CACHE_BACKEND
+# 'lru'), which writes in one worker could not invalidate in the others.
+#
+# With the 'sqlite' job queue the master also forks a job process, which
+# runs JOB_WORKER_THREADS job threads and queues the JOB_SCHEDULE as `flask
+# fyyur worker` does, and keeps it running; the workers only enqueue. Jobs
+# then share the queue file and the 'filesystem' view cache with the workers
+# that serve the pages they invalidate, which a worker on another host (or
+# Heroku dyno) would not.
+#
+# Metrics stay per process: /metrics reports the histograms of whichever
+# worker answered the scrape, a sample of the traffic rather than its total.
+#
+# Pages only stay shared while nothing writes to them, and the cyclic garbage
+# collector writes to every object it examines. As the gc docs advise, the
+# master turns the collector off before warming up, so no collection leaves
+# holes for the workers to fill, and calls gc.freeze() before each fork, so
+# the workers' collections skip everything the master made. Workers turn the
+# collector back on.
+#
+# On SIGHUP the master first checks, in a separate interpreter, that the app
+# still builds, and then re-executes itself with the listening socket left
+# open: the new master builds and warms the new code while the old workers
+# go on serving, forks new workers and only then retires the old ones. The
+# pid stays the same.
+#
+# `flask fyyur memory` starts the server on a free port, sends it some
+# requests and reports what its processes use, with and without gc.freeze(),
+# from /proc/<pid>/smaps_rollup (Linux only): RSS counts every page a process
+# maps, PSS splits shared pages between the processes that share them, and
+# USS counts the pages only the process has, which is what another worker
+# adds.
+#----------------------------------------------------------------------------#
+
+import gc
+import math
+import os
+import random
+import select
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import render_template
+from flask.cli import pass_script_info
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import configure_mappers
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from commands import fyyur_cli
+from startup import SCRIPT
+
+BACKLOG = 2048
+# Set by a master for the master that replaces it on SIGHUP.
+LISTEN_FD = 'FYYUR_SERVE_FD'
+RETIRING = 'FYYUR_SERVE_RETIRING'
+
+# Packages the views import on first use; the master imports them for all
+# workers.
+PRELOAD = ('babel.dates', 'dateutil.parser', 'PIL.Image', 'PIL.ImageOps')
+FORM_TEMPLATES = (('forms/new_venue.html', 'VenueForm'), ('forms/new_artist.html', 'ArtistForm'),
+                  ('forms/new_show.html', 'ShowForm'))
+
+
+def say(message):
+    click.echo('[%d] %s' % (os.getpid(), message), err=True)
+
+
+def cpu_count():
+    # The CPUs this process may run on, capped by a cgroup CPU quota, as a
+    # container started with --cpus has.
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        return count
+    if quota != 'max':
+        count = min(count, max(1, math.ceil(int(quota) / int(period))))
+    return count
+
+
+def parse_bind(bind):
+    # 'host:port', '[::1]:port' or ':port'.
+    host, _, port = bind.rpartition(':')
+    try:
+        return host.strip('[]') or '0.0.0.0', int(port)
+    except ValueError:
+        raise click.BadParameter('expected HOST:PORT, got %r' % bind, param_hint='--bind')
+
+
+def listen(bind):
+    # The socket a replaced master left open, or a new one.
+    if os.environ.get(LISTEN_FD):
+        sock = socket.socket(fileno=int(os.environ.pop(LISTEN_FD)))
+    else:
+        host, port = parse_bind(bind)
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        sock = socket.create_server((host, port), family=family, backlog=BACKLOG)
+    # Every worker waits on it; the ones that lose the race to accept a
+    # connection must not block.
+    sock.setblocking(False)
+    return sock
+
+
+#  Preloading
+#  ----------------------------------------------------------------
+
+def warm(app):
+    import importlib
+    from formatting import format_datetime
+    from geo import centroids, load_numpy
+    from models import db
+
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+    for name in PRELOAD:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    load_numpy()
+    centroids()
+    with app.app_context():
+        import forms
+        configure_mappers()
+        engines = [db.get_engine()] + [db.get_engine(bind=bind) for bind in app.config.get('SQLALCHEMY_BINDS') or {}]
+        app.extensions['fyyur_jobs'].load_tasks()
+        with app.test_request_context():
+            format_datetime('2020-01-01T00:00:00')
+            for template, form in FORM_TEMPLATES:
+                render_template(template, form=getattr(forms, form)())
+        # A first connection sets up the dialect (server version, default
+        # schema, ...) once for all workers; the connection itself must not
+        # be shared, so the pool is emptied.
+        for engine in engines:
+            try:
+                engine.connect().close()
+            except DBAPIError as error:
+                say('Could not connect to %r: %s' % (engine.url, error))
+            engine.dispose()
+
+
+#  Workers
+#  ----------------------------------------------------------------
+
+class RequestHandler(WSGIRequestHandler):
+
+    def log_request(self, *args, **kwargs):
+        if self.server.access_log:
+            super(RequestHandler, self).log_request(*args, **kwargs)
+
+
+class WorkerServer(BaseWSGIServer):
+    # Serves requests from the master's listening socket, one at a time,
+    # until stopped or `max_requests` have been handled.
+
+    multiprocess = True
+
+    def __init__(self, app, sock, max_requests, timeout, access_log):
+        host, port = sock.getsockname()[:2]
+        super(WorkerServer, self).__init__(host, port, app, handler=RequestHandler, fd=sock.fileno())
+        self.socket.setblocking(False)
+        self.max_requests = max_requests
+        self.client_timeout = timeout
+        self.access_log = access_log
+        self.handled = 0
+        self.alive = True
+
+    def server_bind(self):
+        # werkzeug swaps in the listening socket for the one made here.
+        pass
+
+    def server_activate(self):
+        pass
+
+    def get_request(self):
+        connection, address = super(WorkerServer, self).get_request()
+        connection.settimeout(self.client_timeout)
+        return connection, address
+
+    def process_request(self, request, client_address):
+        self.handled += 1
+        super(WorkerServer, self).process_request(request, client_address)
+
+    def run(self):
+        parent = os.getppid()
+        # Waits of at most a second, to notice a stop or an orphaning.
+        self.timeout = 1.0
+        while self.alive and not (self.max_requests and self.handled >= self.max_requests):
+            self.handle_request()
+            if os.getppid() != parent:
+                break
+        self.server_close()
+
+
+#  Master
+#  ----------------------------------------------------------------
+
+class Master(object):
+
+    def __init__(self, app, sock, workers, max_requests, jitter, timeout, graceful_timeout, access_log, freeze,
+                 job_threads=0):
+        self.app = app
+        self.sock = sock
+        self.count = workers
+        self.max_requests = max_requests
+        self.jitter = jitter
+        self.timeout = timeout
+        self.graceful_timeout = graceful_timeout
+        self.access_log = access_log
+        self.freeze = freeze
+        self.job_threads = job_threads
+        self.workers = set()
+        # The process running background jobs, when job_threads is set.
+        self.job_process = None
+        # Old workers told to finish, with when they get killed.
+        self.retiring = {}
+        self.signals = []
+
+    def run(self):
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_write, False)
+        signal.set_wakeup_fd(self.wakeup_write)
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGQUIT, signal.SIGCHLD):
+            signal.signal(signum, lambda signum, frame: self.signals.append(signum))
+
+        self.spawn_missing()
+        # Left by the master this one replaced; new workers now serve.
+        retiring = [int(pid) for pid in os.environ.pop(RETIRING, '').split(',') if pid]
+        self.retire(retiring)
+        while True:
+            self.reap()
+            self.kill_overdue()
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    return self.stop(self.graceful_timeout)
+                if signum == signal.SIGQUIT:
+                    return self.stop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+            self.spawn_missing()
+            if select.select([self.wakeup_read], [], [], 1.0)[0]:
+                os.read(self.wakeup_read, 512)
+
+    def spawn_missing(self):
+        missing = self.count - len(self.workers)
+        if missing > 0 and self.freeze:
+            gc.freeze()
+        for _ in range(missing):
+            self.spawn()
+        if self.job_threads and self.job_process is None:
+            self.spawn_jobs()
+
+    def spawn(self):
+        max_requests = self.max_requests and self.max_requests + random.randint(0, self.jitter)
+        pid = os.fork()
+        if pid:
+            self.workers.add(pid)
+            return
+        # The worker. It never returns into the master's loop.
+        self.become_child()
+        server = WorkerServer(self.app, self.sock, max_requests, self.timeout, self.access_log)
+
+        def stop(signum, frame):
+            server.alive = False
+
+        signal.signal(signal.SIGTERM, stop)
+        server.run()
+        sys.exit(0)
+
+    def spawn_jobs(self):
+        # What `flask fyyur worker` runs, in a child of its own.
+        from jobs import Worker, run_schedule
+        pid = os.fork()
+        if pid:
+            self.job_process = pid
+            return
+        self.become_child()
+        jobs = self.app.extensions['fyyur_jobs']
+        worker = Worker(self.app, jobs, self.job_threads)
+        run_schedule(jobs, worker)
+        worker.stop()
+        sys.exit(0)
+
+    def become_child(self):
+        signal.set_wakeup_fd(-1)
+        os.close(self.wakeup_read)
+        os.close(self.wakeup_write)
+        if self.freeze:
+            gc.enable()
+        signal.signal(signal.SIGQUIT, lambda signum, frame: os._exit(1))
+        for signum in (signal.SIGINT, signal.SIGHUP):
+            # Ctrl-C reaches the whole process group; the master decides.
+            signal.signal(signum, signal.SIG_IGN)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            if pid in self.workers or pid == self.job_process:
+                code = os.waitstatus_to_exitcode(status)
+                if code:
+                    say('%s %d exited with %s.' % ('Worker' if pid in self.workers else 'Job process', pid,
+                                                   code if code > 0 else signal.Signals(-code).name))
+                self.workers.discard(pid)
+                if pid == self.job_process:
+                    self.job_process = None
+            self.retiring.pop(pid, None)
+
+    def retire(self, pids, grace=None):
+        deadline = time.monotonic() + (self.graceful_timeout if grace is None else grace)
+        for pid in pids:
+            self.workers.discard(pid)
+            if pid == self.job_process:
+                self.job_process = None
+            self.retiring[pid] = deadline
+            self.kill(pid, signal.SIGTERM)
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if deadline <= now:
+                self.kill(pid, signal.SIGKILL)
+
+    def kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            self.workers.discard(pid)
+            if pid == self.job_process:
+                self.job_process = None
+            self.retiring.pop(pid, None)
+
+    def stop(self, grace):
+        say('Shutting down.')
+        self.retire(list(self.workers) + ([self.job_process] if self.job_process else []), grace)
+        while self.retiring:
+            self.reap()
+            self.kill_overdue()
+            time.sleep(0.1)
+        self.sock.close()
+
+    def reload(self):
+        result = subprocess.run([sys.executable, '-c', SCRIPT], cwd=self.app.root_path,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        if result.returncode:
+            say('Not reloading, the app does not build:\n' + result.stderr[-2000:])
+            return
+        say('Reloading.')
+        os.set_inheritable(self.sock.fileno(), True)
+        os.environ[LISTEN_FD] = str(self.sock.fileno())
+        os.environ[RETIRING] = ','.join(str(pid) for pid in self.workers | set(self.retiring) | {self.job_process} if pid)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        argv = getattr(sys, 'orig_argv', None) or [sys.executable] + sys.argv
+        os.execv(sys.executable, argv)
+
+
+def search_is_shared(app):
+    # Also settles the search backend once for all workers. Like warm(), it
+    # leaves no connection behind for them to share.
+    from models import db, artist_search, venue_search
+    with app.app_context():
+        try:
+            return venue_search.uses_database() and artist_search.uses_database()
+        except DBAPIError:
+            # Already reported by warm().
+            return True
+        finally:
+            db.engine.dispose()
+
+
+@fyyur_cli.command('serve', with_appcontext=False)
+@click.option('--bind', help='HOST:PORT to listen on; defaults to SERVER_BIND.')
+@click.option('--workers', type=int, help='Defaults to SERVER_WORKERS, or two per CPU plus one.')
+@click.option('--max-requests', type=int, help='Requests before a worker is replaced, 0 for never; '
+                                                'defaults to SERVER_MAX_REQUESTS.')
+@click.option('--freeze/--no-freeze', default=True, show_default=True, help='Keep the collector off the shared objects.')
+@pass_script_info
+def serve_command(info, bind, workers, max_requests, freeze):
+    """Run the app in a prefork multi-process server."""
+    # The app is built here rather than pushed by the command: a worker must
+    # not inherit an application context, as each request needs its own.
+    app = info.load_app()
+    config = app.config
+    workers = workers or config['SERVER_WORKERS'] or 2 * cpu_count() + 1
+    max_requests = config['SERVER_MAX_REQUESTS'] if max_requests is None else max_requests
+    if app.debug:
+        raise click.ClickException('Debug mode is on; unset FLASK_ENV and FLASK_DEBUG to serve.')
+    if workers > 1 and config['VIEW_CACHE_BACKEND'] == 'lru':
+        # Each worker would keep serving pages that a write in another one
+        # invalidated.
+        raise click.ClickException("VIEW_CACHE_BACKEND 'lru' is per process; with several workers set it "
+                                   "to 'filesystem' or 'null', or run --workers 1.")
+
+    jobs = app.extensions['fyyur_jobs']
+    # A queue in the process could not reach a job process; workers then run
+    # their own job threads as the development server does.
+    job_threads = jobs.threads if config['JOB_QUEUE_BACKEND'] == 'sqlite' else 0
+    if job_threads:
+        jobs.threads = 0
+
+    sock = listen(bind or config['SERVER_BIND'])
+    if freeze:
+        gc.disable()
+    warm(app)
+    if workers > 1 and not search_is_shared(app):
+        say('Warning: name search uses the in-process index, which misses what other workers write after it '
+            'is built; use PostgreSQL with pg_trgm or run --workers 1.')
+    say('Listening on %s:%d with %d workers and %d job threads.' % (sock.getsockname()[:2] + (workers, job_threads)))
+    Master(app, sock, workers, max_requests, config['SERVER_MAX_REQUESTS_JITTER'], config['SERVER_TIMEOUT'],
+           config['SERVER_GRACEFUL_TIMEOUT'], config['SERVER_ACCESS_LOG'], freeze, job_threads).run()
+
+
+#  Memory
+#  ----------------------------------------------------------------
+
+PAGES = ('/', '/venues', '/artists', '/shows', '/venues/1', '/artists/1', '/venues/create', '/artists/create',
+         '/shows/create')
+
+
+def smaps(pid):
+    # (RSS, PSS, USS) in bytes.
+    fields = {}
+    with open('/proc/%d/smaps_rollup' % pid) as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            parts = rest.split()
+            if len(parts) == 2 and parts[1] == 'kB':
+                fields[name] = int(parts[0]) * 1024
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def children(pid):
+    found = []
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open('/proc/%s/stat' % name) as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            # The command name, in parentheses, may hold spaces.
+            if int(stat[stat.rindex(')') + 2:].split()[1]) == pid:
+                found.append(int(name))
+    return sorted(found)
+
+
+def measure_server(workers, requests, paths, freeze):
+    # [(role, pid, (RSS, PSS, USS))] of a server that has served about
+    # `requests` per worker.
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    command = [sys.executable, '-m', 'flask', 'fyyur', 'serve', '--bind', '127.0.0.1:%d' % port,
+               '--workers', str(workers), '--max-requests', '0', '--freeze' if freeze else '--no-freeze']
+    # A file rather than a pipe, which a chatty server could fill up.
+    errors = tempfile.TemporaryFile('w+')
+    # The server refuses the per-process view cache with several workers.
+    env = dict(os.environ)
+    env.setdefault('VIEW_CACHE_BACKEND', 'filesystem')
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=errors, env=env, universal_newlines=True)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if process.poll() is not None:
+                errors.seek(0)
+                raise click.ClickException('The server did not start:\n' + errors.read()[-2000:])
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise click.ClickException('The server did not start listening within a minute.')
+                time.sleep(0.2)
+
+        def fetch(number):
+            try:
+                urllib.request.urlopen('http://127.0.0.1:%d%s' % (port, paths[number % len(paths)]), timeout=30).read()
+            except urllib.error.HTTPError:
+                pass
+
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(fetch, range(requests * workers)))
+        return [('master', process.pid, smaps(process.pid))] + [
+            ('worker', pid, smaps(pid)) for pid in children(process.pid)]
+    finally:
+        process.terminate()
+        process.wait()
+        errors.close()
+
+
+@fyyur_cli.command('memory', with_appcontext=False)
+@click.option('--workers', default=2, show_default=True, help='Workers to start.')
+@click.option('--requests', default=6000, show_default=True,
+              help='Requests per worker before measuring; a worker runs its first full collection after a few '
+                   'thousand.')
+@click.option('--path', 'paths', multiple=True, help='Page to request; repeatable. Defaults to the main pages.')
+def memory_command(workers, requests, paths):
+    """Measure the memory used by the processes of `flask fyyur serve`."""
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        raise click.ClickException('Needs /proc/<pid>/smaps_rollup, which Linux 4.14 and later have.')
+    mib = 1024.0 * 1024
+    for freeze in (True, False):
+        processes = measure_server(workers, requests, paths or PAGES, freeze)
+        click.echo('%s gc.freeze(), after %d requests per worker:' % ('With' if freeze else 'Without', requests))
+        click.echo('  %-7s %7s %9s %9s %9s' % ('', 'pid', 'RSS MiB', 'PSS MiB', 'USS MiB'))
+        for role, pid, sizes in processes:
+            click.echo('  %-7s %7d %9.1f %9.1f %9.1f' % ((role, pid) + tuple(size / mib for size in sizes)))
+        worker_sizes = [sizes for role, _, sizes in processes if role == 'worker']
+        if worker_sizes:
+            click.echo('  Each worker: %.1f MiB RSS, of which %.1f MiB its own (mean USS). '
+                       'Whole server: %.1f MiB (total PSS).' % (
+                           sum(sizes[0] for sizes in worker_sizes) / len(worker_sizes) / mib,
+                           sum(sizes[2] for sizes in worker_sizes) / len(worker_sizes) / mib,
+                           sum(sizes[1] for _, _, sizes in processes) / mib))
@@ -0,0 +1,130 @@
+#----------------------------------------------------------------------------#
+# Show pages.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, abort, current_app, flash, render_template, request, stream_with_context
+
+from conditional import conditional
+from database import read_only
+from extensions import view_cache
+from formatting import to_datetime
+from helpers import queue_match_refresh, stream_template, table_validators
+from models import db, Artist, Show, Venue
+from pagination import keyset_page
+from scheduling import find_conflicts
+
+show_pages = Blueprint('shows', __name__)
+
+
+def date_range():
+    # The [from, to) window of ?from=&to=, either end optional, in the naive
+    # local time shows are stored in. A bare date as `to` includes that day.
+    bounds = []
+    for name in ('from', 'to'):
+        text = request.args.get(name, '').strip()
+        if not text:
+            bounds.append(None)
+            continue
+        try:
+            value = to_datetime(text)
+        except (ValueError, OverflowError):
+            abort(400)
+        if value.tzinfo is not None:
+            value = value.astimezone().replace(tzinfo=None)
+        if name == 'to' and len(text) == 10:
+            value += timedelta(days=1)
+        bounds.append(value)
+    return bounds
+
+
+@show_pages.route('/shows')
+@read_only
+@conditional(lambda: table_validators(Show, Venue, Artist))
+@view_cache.cached
+def shows():
+    # displays list of shows at /shows, a page at a time; ?stream=1 renders the
+    # whole table through a server-side cursor instead, and ?from=&to= limit
+    # either to a range of start times, read from the start_time index
+    query = db.session.query(
+        Show.id, Show.start_time, Show.venue_id, Venue.name, Show.artist_id, Artist.name, Artist.image_link
+    ).select_from(Show).join(Show.venue).join(Show.artist)
+    start, end = date_range()
+    if start is not None:
+        query = query.filter(Show.start_time >= start)
+    if end is not None:
+        query = query.filter(Show.start_time < end)
+
+    def show_tile(row):
+        id, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link = row
+        return {
+            "venue_id": venue_id,
+            "venue_name": venue_name,
+            "artist_id": artist_id,
+            "artist_name": artist_name,
+            "artist_image_link": artist_image_link,
+            "start_time": start_time,
+        }
+
+    if request.args.get('stream'):
+        rows = query.order_by(Show.start_time, Show.id).yield_per(current_app.config['STREAM_YIELD_PER'])
+        return Response(stream_with_context(
+            stream_template('pages/shows.html', shows=(show_tile(row) for row in rows), next_cursor=None)
+        ))
+    rows, next_cursor = keyset_page(query, (Show.start_time, Show.id), key=lambda row: (row[1], row[0]))
+    view_cache.tag('shows', *('venue:%d' % row[2] for row in rows))
+    view_cache.tag(*('artist:%d' % row[4] for row in rows))
+    return render_template('pages/shows.html', shows=[show_tile(row) for row in rows], next_cursor=next_cursor)
+
+
+@show_pages.route('/shows/create')
+def create_shows():
+    # renders form. do not touch.
+    from forms import ShowForm
+    form = ShowForm()
+    return render_template('forms/new_show.html', form=form)
+
+
+@show_pages.route('/shows/create', methods=['POST'])
+def create_show_submission():
+    # called to create new shows in the db, upon submitting new show listing form
+    from forms import ShowForm
+    form = ShowForm(request.form)
+    if not form.validate():
+        flash('An error occurred. Show could not be listed.')
+        return render_template('forms/new_show.html', form=form)
+    # Locking both rows (on PostgreSQL) serializes concurrent bookings of the
+    # same venue or artist between the conflict check and the insert.
+    venue = Venue.query.filter_by(id=form.venue_id.data).with_for_update().first()
+    artist = Artist.query.filter_by(id=form.artist_id.data).with_for_update().first()
+    if venue is None or artist is None:
+        db.session.rollback()
+        flash('An error occurred. Show could not be listed: unknown ' + ('venue.' if venue is None else 'artist.'))
+        return render_template('forms/new_show.html', form=form)
+    start_time = form.start_time.data
+    end_time = start_time + timedelta(minutes=form.duration.data)
+    conflicts = find_conflicts(db.session, Show, [(venue.id, artist.id, start_time, end_time)])[0]
+    if conflicts:
+        db.session.rollback()
+        flash('An error occurred. Show could not be listed: the %s is already booked at that time.'
+              % conflicts[0]['conflict'])
+        return render_template('forms/new_show.html', form=form)
+    try:
+        show = Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time, end_time=end_time)
+        db.session.add(show)
+        db.session.commit()
+        view_cache.invalidate('shows', 'venue:%d' % venue.id, 'artist:%d' % artist.id)
+        # A show already played adds to the pair's match history, which only
+        # counts between a venue and an artist both open to matches; upcoming
+        # ones count once they have passed, at the nightly rebuild.
+        if start_time <= datetime.now() and venue.seeking_talent and artist.seeking_venue:
+            queue_match_refresh('venue', venue.id, 'show:%d' % show.id)
+        flash('Show was successfully listed!')
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Could not create show')
+        flash('An error occurred. Show could not be listed.')
+    finally:
+        db.session.close()
+    return render_template('pages/home.html')
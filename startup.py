@@ -0,0 +1,80 @@
+#----------------------------------------------------------------------------#
+# Startup time budget.
+#
+#   flask fyyur startup [--runs 5] [--budget MS]
+#
+# Builds the app in fresh interpreters under `python -X importtime`, the way
+# a new web worker does, and reports the median total import time with the
+# packages it goes to. The command fails when the median is over
+# STARTUP_BUDGET_MS, or when a module of LAZY_MODULES was loaded: those are
+# meant to be imported on first use only.
+#----------------------------------------------------------------------------#
+
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+import click
+from flask import current_app
+
+from commands import fyyur_cli
+
+LAZY_MODULES = ('alembic', 'babel', 'dateutil', 'flask_migrate', 'flask_wtf', 'numpy', 'PIL', 'wtforms')
+
+SCRIPT = 'from app import create_app; create_app()'
+
+
+def parse_importtime(output):
+    # [(self microseconds, module)] from the stderr of `python -X importtime`.
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        entries.append((int(fields[0]), fields[2].strip()))
+    return entries
+
+
+def measure(root_path):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', SCRIPT], cwd=root_path,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode:
+        raise click.ClickException('Could not build the app:\n' + result.stderr[-2000:])
+    return parse_importtime(result.stderr)
+
+
+def by_package(entries):
+    totals = defaultdict(int)
+    for microseconds, module in entries:
+        totals[module.split('.', 1)[0]] += microseconds
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+@fyyur_cli.command('startup')
+@click.option('--runs', default=5, show_default=True, help='Fresh interpreters to measure.')
+@click.option('--budget', type=float, help='Milliseconds; defaults to STARTUP_BUDGET_MS.')
+@click.option('--top', default=10, show_default=True, help='Packages to list.')
+def startup_command(runs, budget, top):
+    """Measure the cold import time of the app against a budget."""
+    budget = current_app.config['STARTUP_BUDGET_MS'] if budget is None else budget
+    measured = []
+    for _ in range(max(runs, 1)):
+        entries = measure(current_app.root_path)
+        measured.append((sum(microseconds for microseconds, _ in entries) / 1000.0, entries))
+    measured.sort(key=lambda run: run[0])
+    median = statistics.median(total for total, _ in measured)
+    total, entries = measured[len(measured) // 2]
+
+    click.echo('Import time: median %.0fms over %d runs (min %.0fms, max %.0fms), budget %.0fms'
+               % (median, len(measured), measured[0][0], measured[-1][0], budget))
+    for package, microseconds in by_package(entries)[:top]:
+        click.echo('  %8.1fms  %s' % (microseconds / 1000.0, package))
+
+    eager = sorted({module.split('.', 1)[0] for _, module in entries} & set(LAZY_MODULES))
+    if eager:
+        raise click.ClickException('Imported at startup, meant to load lazily: %s' % ', '.join(eager))
+    if median > budget:
+        raise click.ClickException('Startup is %.0fms over budget.' % (median - budget))
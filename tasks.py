@@ -0,0 +1,77 @@
+#----------------------------------------------------------------------------#
+# Background job handlers; see jobs.py.
+#----------------------------------------------------------------------------#
+
+import urllib.error
+import urllib.request
+
+from flask import current_app
+
+from extensions import jobs
+from outbound import open_public
+
+
+class TransientError(Exception):
+    # Raised to have a job retried later.
+    pass
+
+
+def link_is_reachable(url, timeout):
+    # True or False for a definite answer; TransientError when the server or
+    # the network could not give one. Some servers refuse HEAD, so a refusal
+    # is retried as a GET of the first byte. Links to anything but public
+    # http(s) addresses are never requested; see outbound.py.
+    for method, headers in (('HEAD', {}), ('GET', {'Range': 'bytes=0-0'})):
+        headers['User-Agent'] = 'fyyur'
+        try:
+            request = urllib.request.Request(url, method=method, headers=headers)
+            with open_public(request, timeout) as response:
+                return response.headers.get_content_maintype() == 'image'
+        except urllib.error.HTTPError as error:
+            if error.code in (405, 501) and method == 'HEAD':
+                continue
+            if error.code >= 500 or error.code == 429:
+                raise TransientError('%s answered %d' % (url, error.code))
+            return False
+        except ValueError:
+            # Not a URL at all, or one refused by open_public().
+            return False
+        except OSError as error:
+            raise TransientError('%s: %s' % (url, error))
+    return False
+
+
+@jobs.task('images.check')
+def check_image_link(kind, id, link):
+    # Records on the venue or artist whether its image link serves an image.
+    # A link edited again since the job was queued is left to its own job.
+    from models import db, Artist, Venue
+    model = {'venue': Venue, 'artist': Artist}[kind]
+    table = model.__table__
+    if db.session.query(model.image_link).filter(model.id == id).scalar() != link:
+        return
+    ok = link_is_reachable(link, current_app.config['IMAGE_CHECK_TIMEOUT'])
+    # Not an edit of the row, so updated_at stays.
+    db.session.execute(table.update().where((table.c.id == id) & (table.c.image_link == link)).values(
+        image_link_ok=ok, updated_at=table.c.updated_at
+    ))
+    db.session.commit()
+
+
+@jobs.task('matches.rebuild')
+def rebuild_matches():
+    from matches import rebuild
+    rebuild()
+
+
+@jobs.task('matches.refresh')
+def refresh_matches(kind, id):
+    from matches import refresh
+    refresh(kind, id)
+
+
+@jobs.task('counters.rollover')
+def rollover_counters():
+    from counters import roll_over
+    from models import db, Show, counter_watermark
+    roll_over(db, Show, counter_watermark)
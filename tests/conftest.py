@@ -0,0 +1,132 @@
+#----------------------------------------------------------------------------#
+# Test fixtures.
+#
+# One app for the whole run, on an in-memory SQLite database that is emptied
+# and recreated for every test. config.py reads the environment when it is
+# imported, so the overrides below come first. The view cache is off, so a
+# test sees every query a view makes; jobs stay in memory and are run by the
+# test, not by worker threads.
+#
+#   python -m pytest -q            # from the repository root
+#   python -m pytest -q -m 'not slow'
+#----------------------------------------------------------------------------#
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCRATCH = tempfile.mkdtemp(prefix='fyyur-tests-')
+os.environ.update({
+    'DATABASE_URL': 'sqlite://',
+    'VIEW_CACHE_BACKEND': 'null',
+    'JOB_QUEUE_BACKEND': 'memory',
+    'JOB_WORKER_THREADS': '0',
+    'LOG_FILE': os.path.join(SCRATCH, 'error.log'),
+    'IMAGE_CACHE_DIR': os.path.join(SCRATCH, 'images'),
+})
+for name in ('DATABASE_REPLICA_URL', 'FLASK_ENV', 'FLASK_DEBUG'):
+    os.environ.pop(name, None)
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: seeds a large database; deselect with -m "not slow"')
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+@pytest.fixture(autouse=True)
+def database(app):
+    from extensions import db, view_cache
+    from models import counter_watermark
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        # The row the migrations insert; see counters.py.
+        db.session.execute(counter_watermark.insert().values(id=1, rolled_over_at=datetime.now()))
+        db.session.commit()
+        view_cache.clear()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def count_queries(database):
+    # with count_queries() as statements: ... ; len(statements) afterwards.
+    from sqlalchemy import event
+
+    @contextmanager
+    def counting():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engine = database.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+    return counting
+
+
+@pytest.fixture
+def make_venue(database):
+    from models import Venue
+
+    def make(**fields):
+        fields.setdefault('name', 'The Musical Hop')
+        fields.setdefault('city', 'San Francisco')
+        fields.setdefault('state', 'CA')
+        fields.setdefault('address', '1015 Folsom Street')
+        venue = Venue(**fields)
+        database.session.add(venue)
+        database.session.commit()
+        return venue
+    return make
+
+
+@pytest.fixture
+def make_artist(database):
+    from models import Artist
+
+    def make(**fields):
+        fields.setdefault('name', 'Guns N Petals')
+        fields.setdefault('city', 'San Francisco')
+        fields.setdefault('state', 'CA')
+        artist = Artist(**fields)
+        database.session.add(artist)
+        database.session.commit()
+        return artist
+    return make
+
+
+@pytest.fixture
+def make_show(database):
+    from models import Show
+    from scheduling import DEFAULT_DURATION
+
+    def make(venue, artist, start_time, duration=timedelta(minutes=DEFAULT_DURATION)):
+        show = Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time, end_time=start_time + duration)
+        database.session.add(show)
+        database.session.commit()
+        return show
+    return make
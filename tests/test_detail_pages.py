@@ -0,0 +1,67 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# The venue or artist with its genres, and its shows with the counterpart
+# joined in; then the conditional GET validators and the stored matches.
+DETAIL_STATEMENTS = 2 + 2
+
+
+def book(make_venue, make_artist, make_show, shows):
+    venue = make_venue()
+    artist = make_artist()
+    now = datetime.now()
+    for i in range(shows):
+        # Half past, half upcoming, each with its own counterpart so that a
+        # lazy load per show would show up as extra statements.
+        other_venue = make_venue(name='Venue %d' % i)
+        other_artist = make_artist(name='Artist %d' % i)
+        start = now + timedelta(days=i + 1) * (1 if i % 2 else -1)
+        make_show(venue, other_artist, start)
+        make_show(other_venue, artist, start)
+    return venue, artist
+
+
+@pytest.mark.parametrize('shows', [0, 1, 30])
+def test_venue_page_statements(client, count_queries, make_venue, make_artist, make_show, shows):
+    path = '/venues/%d' % book(make_venue, make_artist, make_show, shows)[0].id
+    with count_queries() as statements:
+        response = client.get(path)
+    assert response.status_code == 200
+    assert len(statements) == DETAIL_STATEMENTS
+
+
+@pytest.mark.parametrize('shows', [0, 1, 30])
+def test_artist_page_statements(client, count_queries, make_venue, make_artist, make_show, shows):
+    path = '/artists/%d' % book(make_venue, make_artist, make_show, shows)[1].id
+    with count_queries() as statements:
+        response = client.get(path)
+    assert response.status_code == 200
+    assert len(statements) == DETAIL_STATEMENTS
+
+
+def test_detail_pages_split_past_and_upcoming(client, make_venue, make_artist, make_show):
+    venue, artist = book(make_venue, make_artist, make_show, 5)
+    for path in ('/venues/%d' % venue.id, '/artists/%d' % artist.id):
+        page = client.get(path).get_data(as_text=True)
+        assert '3 Past Shows' in page
+        assert '2 Upcoming Shows' in page
+
+
+@pytest.mark.parametrize('path', ['/venues/999', '/artists/999'])
+def test_missing_detail_page(client, path):
+    assert client.get(path).status_code == 404
+
+
+def test_last_modified_takes_start_times_as_local(client, monkeypatch, make_venue, make_artist, make_show):
+    # Start times are local; ahead of UTC, a show that just ended must not
+    # date the page in the future.
+    with monkeypatch.context() as patch:
+        patch.setenv('TZ', 'Asia/Kolkata')
+        time.tzset()
+        venue = make_venue()
+        make_show(venue, make_artist(), datetime.now() - timedelta(minutes=1))
+        response = client.get('/venues/%d' % venue.id)
+    time.tzset()
+    assert response.last_modified <= datetime.now(timezone.utc)
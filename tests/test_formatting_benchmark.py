@@ -0,0 +1,70 @@
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+import babel.dates
+import dateutil.parser
+import pytest
+
+from formatting import format_datetime, format_datetimes
+
+# A venue page's worth of show tiles: a few hundred start times, most of them
+# repeated, as ISO strings the way the filter used to receive them.
+SHOWS = 400
+DISTINCT = 40
+ROUNDS = 15
+EVENING = datetime(2031, 5, 1, 20, 0)
+STARTS = [(EVENING + timedelta(days=i % DISTINCT)).isoformat() for i in range(SHOWS)]
+
+
+def babel_filter(value, format='medium'):
+    # The filter as it was in app.py.
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def median_ms(render):
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        render()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+@pytest.mark.parametrize('value', [
+    '2031-05-01T20:30:00', '2031-05-01 20:30:00', '2031-05-01T20:30:00Z',
+    '2031-05-01T20:30:00+02:00', 'May 1 2031 8:30pm', EVENING,
+])
+@pytest.mark.parametrize('format', ['full', 'medium', 'long', 'short'])
+def test_same_text_as_babel(value, format):
+    text = value if isinstance(value, str) else value.isoformat()
+    assert format_datetime(value, format) == babel_filter(text, format)
+
+
+def test_memo_keeps_offsets_apart():
+    noon = datetime(2031, 5, 1, 12, 0, tzinfo=timezone.utc)
+    same_instant = noon.astimezone(timezone(timedelta(hours=1)))
+    assert noon == same_instant
+    assert format_datetime(noon, 'full').endswith('12:00PM')
+    assert format_datetime(same_instant, 'full').endswith('1:00PM')
+    assert format_datetimes([noon, same_instant], 'full') == [
+        format_datetime(noon, 'full'), format_datetime(same_instant, 'full')]
+
+
+def test_batch_is_faster_than_the_babel_filter():
+    assert format_datetimes(STARTS, 'full') == [babel_filter(value, 'full') for value in STARTS]
+
+    before = median_ms(lambda: [babel_filter(value, 'full') for value in STARTS])
+    single = median_ms(lambda: [format_datetime(value, 'full') for value in STARTS])
+    batch = median_ms(lambda: format_datetimes(STARTS, 'full'))
+    print('%d show times, %d distinct: babel filter %.2f ms, format_datetime %.2f ms, format_datetimes %.2f ms'
+          % (SHOWS, DISTINCT, before, single, batch))
+    # The memo is warm after the first round; being 10x faster leaves room
+    # for a slow machine.
+    assert single * 10 < before
+    assert batch * 10 < before
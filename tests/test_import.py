@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+
+def run_import(app, tmp_path, kind, rows, *args):
+    path = tmp_path / ('%s.jsonl' % kind)
+    path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+    result = app.test_cli_runner().invoke(args=['fyyur', 'import', kind, str(path), '--chunk-size', '2'] + list(args))
+    return result, path
+
+
+def artist(id, name):
+    return {'id': id, 'name': name, 'city': 'Austin', 'state': 'TX', 'genres': ['Jazz'],
+            'facebook_link': 'https://www.facebook.com/fyyur'}
+
+
+@pytest.mark.parametrize('dry_run', [False, True])
+def test_bad_and_duplicate_ids_are_rejected_by_row(app, tmp_path, make_artist, dry_run):
+    from models import Artist
+    make_artist(name='Taken')
+    taken = Artist.query.one().id
+    rows = [artist(100, 'One'), artist('x1', 'Bad'), artist(taken, 'Clash'), artist(101, 'Two'),
+            artist(100, 'Again')]
+    result, path = run_import(app, tmp_path, 'artists', rows, *(['--dry-run'] if dry_run else []))
+    assert result.exit_code == 1
+    assert "Row 2: {'id': [\"Not a whole number: 'x1'.\"]}" in result.output
+    assert "Row 3: {'id': ['Duplicate id %d.']}" % taken in result.output
+    assert "Row 5: {'id': ['Duplicate id 100.']}" in result.output
+    assert '3 rows were rejected.' in result.output
+    names = sorted(name for name, in Artist.query.with_entities(Artist.name))
+    assert names == (['Taken'] if dry_run else ['One', 'Taken', 'Two'])
+
+
+def test_failed_insert_keeps_the_checkpoint(app, tmp_path, monkeypatch):
+    from sqlalchemy.exc import IntegrityError
+    import commands
+    from models import Artist
+    insert = commands.ProfileImporter.insert
+    calls = []
+
+    def fail_second_chunk(self, mappings):
+        calls.append(mappings)
+        if len(calls) == 2:
+            raise IntegrityError('INSERT', {}, Exception('boom'))
+        insert(self, mappings)
+
+    monkeypatch.setattr(commands.ProfileImporter, 'insert', fail_second_chunk)
+    rows = [artist(None, 'Artist %d' % i) for i in range(5)]
+    result, path = run_import(app, tmp_path, 'artists', rows)
+    assert result.exit_code == 1
+    assert 'Rows 3 to 4 were not imported: boom' in result.output
+    assert Artist.query.count() == 2
+    assert json.loads((tmp_path / 'artists.jsonl.checkpoint').read_text())['rows'] == 2
+
+    monkeypatch.setattr(commands.ProfileImporter, 'insert', insert)
+    result, path = run_import(app, tmp_path, 'artists', rows, '--resume')
+    assert result.exit_code == 0, result.output
+    assert Artist.query.count() == 5
+    assert not (tmp_path / 'artists.jsonl.checkpoint').exists()
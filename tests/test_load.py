@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+THREADS = 16
+REQUESTS = 96
+# Stands in for the network round trip of a database server, which is what
+# a request thread waits on with the connection checked out; SQLite itself
+# answers from memory.
+ROUND_TRIP = 0.01
+
+
+def seed(db):
+    from models import Artist, Show, Venue
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA', address='1015 Folsom Street')
+    artists = [Artist(name='Artist %d' % i, city='San Francisco', state='CA') for i in range(10)]
+    db.session.add_all([venue] + artists)
+    db.session.flush()
+    now = datetime.now()
+    db.session.add_all([Show(venue_id=venue.id, artist_id=artist.id, start_time=now + timedelta(days=i),
+                             end_time=now + timedelta(days=i, hours=2)) for i, artist in enumerate(artists)])
+    db.session.commit()
+    return venue.id
+
+
+def throughput(app, client, path):
+    def get(_):
+        assert client.get(path).status_code == 200
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(get, range(THREADS)))  # warm-up
+        started = time.perf_counter()
+        list(pool.map(get, range(REQUESTS)))
+    return REQUESTS / (time.perf_counter() - started)
+
+
+@pytest.mark.slow
+def test_throughput_scales_with_pool_size(app, client, database, monkeypatch, tmp_path):
+    from models import counter_watermark
+    results = {}
+    for size in (1, 2, 4, 8):
+        # A database file per size: Flask-SQLAlchemy builds a new engine when
+        # the URI changes. The options are config.py's for a server database.
+        monkeypatch.setitem(app.config, 'SQLALCHEMY_DATABASE_URI', 'sqlite:///%s' % (tmp_path / ('pool%d.db' % size)))
+        monkeypatch.setitem(app.config, 'SQLALCHEMY_ENGINE_OPTIONS', {
+            'poolclass': QueuePool,
+            'pool_size': size,
+            'max_overflow': 0,
+            'pool_timeout': 30,
+            'connect_args': {'check_same_thread': False, 'timeout': 30},
+        })
+        database.session.remove()
+        engine = database.get_engine()
+        assert engine.pool.size() == size
+        database.create_all()
+        database.session.execute(counter_watermark.insert().values(id=1, rolled_over_at=datetime.now()))
+        venue_id = seed(database)
+        database.session.remove()
+        event.listen(engine, 'before_cursor_execute', lambda *args: time.sleep(ROUND_TRIP))
+        # A JSON endpoint, so that template rendering under the GIL does not
+        # cap the throughput first.
+        results[size] = throughput(app, client, '/api/v1/venues/%d' % venue_id)
+        engine.dispose()
+    database.session.remove()
+
+    print('GET /api/v1/venues/<id> with %d threads: %s' % (
+        THREADS, ', '.join('pool %d: %.0f req/s' % item for item in sorted(results.items()))))
+    assert results[2] > 1.5 * results[1]
+    assert results[4] > 2.5 * results[1]
@@ -0,0 +1,108 @@
+import logging
+import statistics
+import time
+
+import pytest
+from flask import Flask
+
+import applog
+
+# Every record takes this long to write, like a saturated disk.
+WRITE_DELAY = 0.002
+RECORDS_PER_REQUEST = 20
+REQUESTS = 30
+
+
+class SlowDisk(logging.Handler):
+
+    def __init__(self):
+        super(SlowDisk, self).__init__()
+        self.written = 0
+
+    def emit(self, record):
+        time.sleep(WRITE_DELAY)
+        self.format(record)
+        self.written += 1
+
+
+def logging_app(name):
+    app = Flask(__name__)
+    log = logging.getLogger(name)
+
+    @app.route('/work')
+    def work():
+        for i in range(RECORDS_PER_REQUEST):
+            log.warning('record %d of this request', i)
+        return 'ok'
+    return app, log
+
+
+def median_ms(app):
+    client = app.test_client()
+    timings = []
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        assert client.get('/work').status_code == 200
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+@pytest.fixture
+def slow_disk(monkeypatch):
+    disk = SlowDisk()
+    monkeypatch.setattr(applog, 'file_handler', lambda app: disk)
+    return disk
+
+
+def test_request_latency_stays_flat_under_heavy_logging(slow_disk):
+    quiet, log = logging_app('fyyur.tests.quiet')
+    log.addHandler(logging.NullHandler())
+    log.propagate = False
+    baseline = median_ms(quiet)
+
+    # What the app did before: a file handler writing on the request thread.
+    blocking, log = logging_app('fyyur.tests.blocking')
+    log.addHandler(SlowDisk())
+    log.propagate = False
+    blocked = median_ms(blocking)
+
+    queued, log = logging_app('fyyur.tests.queued')
+    handler = applog.init_logging(queued, loggers=(log.name,))
+    log.propagate = False
+    flat = median_ms(queued)
+    handler.queue.join()
+
+    print('p50 per request with %d records: none %.2f ms, blocking %.2f ms, queued %.2f ms'
+          % (RECORDS_PER_REQUEST, baseline, blocked, flat))
+    assert blocked >= RECORDS_PER_REQUEST * WRITE_DELAY * 1000
+    # Within two writes of not logging at all, where blocking costs twenty.
+    assert flat < baseline + 2 * WRITE_DELAY * 1000
+    assert slow_disk.written + handler.dropped == REQUESTS * RECORDS_PER_REQUEST
+
+
+def test_full_queue_drops_instead_of_blocking(slow_disk):
+    app, log = logging_app('fyyur.tests.flood')
+    app.config['LOG_QUEUE_SIZE'] = 10
+    handler = applog.init_logging(app, loggers=(log.name,))
+    log.propagate = False
+    started = time.perf_counter()
+    for i in range(1000):
+        log.warning('flood %d', i)
+    elapsed = time.perf_counter() - started
+    handler.queue.join()
+    assert handler.dropped > 0
+    assert slow_disk.written + handler.dropped == 1000
+    # Writing the 1000 records would take 2 s.
+    assert elapsed < 1000 * WRITE_DELAY / 10
+
+
+def test_records_carry_the_request_id(slow_disk):
+    app, log = logging_app('fyyur.tests.request_id')
+    handler = applog.init_logging(app, loggers=(log.name,))
+    log.propagate = False
+    seen = []
+    slow_disk.format = lambda record: seen.append(record.request_id)
+    response = app.test_client().get('/work', headers={'X-Request-ID': 'abc123'})
+    handler.queue.join()
+    assert response.headers['X-Request-ID'] == 'abc123'
+    assert seen == ['abc123'] * RECORDS_PER_REQUEST
@@ -0,0 +1,103 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import matches
+from matches import rebuild, refresh
+
+GENRES = ['Jazz', 'Blues', 'Folk', 'Rock n Roll', 'Hip-Hop', 'Classical', 'Funk', 'Soul']
+PLACES = [('San Francisco', 'CA'), ('San Jose', 'CA'), ('New York', 'NY'), ('Saint Louis', 'MO'),
+          ('st. louis', 'mo'), ('Austin', 'TX'), (None, None)]
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def scoring(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(matches, 'load_numpy', lambda: None)
+    return request.param
+
+
+def profile(rng, genres, **fields):
+    city, state = rng.choice(PLACES)
+    return dict(fields, city=city, state=state, genres=rng.sample(genres, rng.randint(0, 3)))
+
+
+@pytest.fixture
+def profiles(database):
+    from models import Artist, Genre, Show, Venue
+    rng = random.Random(7)
+    genres = [Genre(name=name) for name in GENRES]
+    venues = [Venue(**profile(rng, genres, name='Venue %d' % i, address='1 Main St',
+                              seeking_talent=rng.random() < 0.7)) for i in range(40)]
+    artists = [Artist(**profile(rng, genres, name='Artist %d' % i, seeking_venue=rng.random() < 0.7))
+               for i in range(50)]
+    database.session.add_all(venues + artists)
+    database.session.flush()
+    past = datetime.now() - timedelta(days=30)
+    for i in range(60):
+        start = past - timedelta(days=i)
+        database.session.add(Show(venue_id=rng.choice(venues).id, artist_id=rng.choice(artists).id,
+                                  start_time=start, end_time=start + timedelta(hours=2)))
+    database.session.commit()
+    return rng, genres, venues, artists
+
+
+def test_refresh_keeps_every_list_as_a_rebuild_would(app, database, scoring, profiles):
+    from models import Show
+    rng, genres, venues, artists = profiles
+    assert rebuild() > 0
+    assert rebuild() == 0
+    for _ in range(25):
+        kind = rng.choice(['venue', 'artist'])
+        owner = rng.choice(venues if kind == 'venue' else artists)
+        change = rng.choice(['genres', 'place', 'seeking', 'show'])
+        if change == 'genres':
+            owner.genres = rng.sample(genres, rng.randint(0, 3))
+        elif change == 'place':
+            owner.city, owner.state = rng.choice(PLACES)
+        elif change == 'seeking':
+            setattr(owner, 'seeking_talent' if kind == 'venue' else 'seeking_venue', rng.random() < 0.5)
+        else:
+            start = datetime.now() - timedelta(days=rng.randint(1, 100))
+            venue = owner if kind == 'venue' else rng.choice(venues)
+            artist = owner if kind == 'artist' else rng.choice(artists)
+            database.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                                      start_time=start, end_time=start + timedelta(hours=2)))
+        database.session.commit()
+        refresh(kind, owner.id)
+        # Nothing a refresh left behind is for a rebuild to fix.
+        assert rebuild() == 0, (kind, change)
+    assert Show.query.count() > 60
+
+
+def test_refresh_loads_only_related_profiles(app, database, profiles, monkeypatch):
+    from models import Artist, Genre, Venue
+    loaded = []
+    side = matches.Side.__init__
+
+    def recording(self, kind, places, ids=None):
+        side(self, kind, places, ids)
+        loaded.append((kind, self.ids))
+    monkeypatch.setattr(matches.Side, '__init__', recording)
+    rebuild()
+    loaded.clear()
+
+    # Nobody else is in Hawaii or plays polka.
+    venue = Venue(name='Polka Hall', city='Honolulu', state='HI', address='1 Main St',
+                  seeking_talent=True, genres=[Genre(name='Polka')])
+    database.session.add(venue)
+    database.session.commit()
+    refresh('venue', venue.id)
+    assert loaded[0] == ('venue', [venue.id])
+    assert all(ids in ([], [venue.id]) if kind == 'venue' else ids == [] for kind, ids in loaded)
+
+    loaded.clear()
+    venue.state = 'TX'
+    database.session.commit()
+    refresh('venue', venue.id)
+    texans = {id for id, in Artist.query.filter_by(state='TX', seeking_venue=True).with_entities(Artist.id)}
+    assert texans
+    assert set(loaded[1][1]) == texans
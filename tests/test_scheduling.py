@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from scheduling import MAX_DURATION, find_conflicts
+
+EVENING = datetime(2031, 5, 1, 20, 0)
+TWO_HOURS = timedelta(hours=2)
+
+
+@pytest.fixture
+def booked(make_venue, make_artist, make_show):
+    # The Musical Hop has Guns N Petals booked for [20:00, 22:00).
+    venue, artist = make_venue(), make_artist()
+    show = make_show(venue, artist, EVENING, TWO_HOURS)
+    return venue.id, artist.id, show.id
+
+
+def conflicts_of(database, *slots):
+    from models import Show
+    return find_conflicts(database.session, Show, list(slots))
+
+
+@pytest.mark.parametrize('start, end', [
+    (EVENING + TWO_HOURS, EVENING + 2 * TWO_HOURS),  # starts as the show ends
+    (EVENING - TWO_HOURS, EVENING),                   # ends as the show starts
+    (EVENING - MAX_DURATION, EVENING - TWO_HOURS),
+    (EVENING + timedelta(days=1), EVENING + timedelta(days=1) + TWO_HOURS),
+])
+def test_adjacent_slots_are_free(database, booked, start, end):
+    venue_id, artist_id, _ = booked
+    assert conflicts_of(database, (venue_id, artist_id, start, end)) == [[]]
+
+
+@pytest.mark.parametrize('start, end', [
+    (EVENING + TWO_HOURS - timedelta(minutes=1), EVENING + 2 * TWO_HOURS),  # one minute into its end
+    (EVENING - TWO_HOURS, EVENING + timedelta(minutes=1)),                  # one minute into its start
+    (EVENING + timedelta(minutes=30), EVENING + timedelta(minutes=90)),     # inside it
+    (EVENING - TWO_HOURS, EVENING + 2 * TWO_HOURS),                         # around it
+    (EVENING, EVENING + TWO_HOURS),                                         # the same slot
+])
+def test_overlapping_slots_clash_on_both_sides(database, booked, start, end):
+    venue_id, artist_id, show_id = booked
+    assert conflicts_of(database, (venue_id, artist_id, start, end)) == [[
+        {'show_id': show_id, 'conflict': 'venue'},
+        {'show_id': show_id, 'conflict': 'artist'},
+    ]]
+
+
+def test_clash_is_reported_for_the_side_that_is_booked(database, booked, make_venue, make_artist):
+    venue_id, artist_id, show_id = booked
+    other_venue, other_artist = make_venue(name='Park Square Live'), make_artist(name='Matt Quevedo')
+    slot = (EVENING + timedelta(hours=1), EVENING + timedelta(hours=3))
+    assert conflicts_of(database, (other_venue.id, artist_id) + slot, (venue_id, other_artist.id) + slot) == [
+        [{'show_id': show_id, 'conflict': 'artist'}],
+        [{'show_id': show_id, 'conflict': 'venue'}],
+    ]
+
+
+def test_longest_show_is_found_from_the_index_window(database, make_venue, make_artist, make_show):
+    # Only shows starting after start - MAX_DURATION are read; a show of the
+    # maximum length that starts exactly then ends as the slot starts.
+    venue, artist = make_venue(), make_artist()
+    make_show(venue, artist, EVENING - MAX_DURATION, MAX_DURATION)
+    overlapping = make_show(venue, artist, EVENING - MAX_DURATION + timedelta(minutes=1), MAX_DURATION)
+    clashes = conflicts_of(database, (venue.id, artist.id, EVENING, EVENING + TWO_HOURS))[0]
+    assert {clash['show_id'] for clash in clashes} == {overlapping.id}
+
+
+def test_batch_slots_clash_with_each_other(database, make_venue, make_artist):
+    venue, artist, other_artist = make_venue(), make_artist(), make_artist(name='The Wild Sax Band')
+    slots = [
+        (venue.id, artist.id, EVENING, EVENING + TWO_HOURS),
+        (venue.id, other_artist.id, EVENING + TWO_HOURS, EVENING + 2 * TWO_HOURS),  # back to back
+        (venue.id, other_artist.id, EVENING + timedelta(hours=3), EVENING + timedelta(hours=5)),
+    ]
+    assert conflicts_of(database, *slots) == [
+        [],
+        [{'slot': 2, 'conflict': 'venue'}, {'slot': 2, 'conflict': 'artist'}],
+        [{'slot': 1, 'conflict': 'venue'}, {'slot': 1, 'conflict': 'artist'}],
+    ]
+
+
+def test_no_slots(database):
+    assert conflicts_of(database) == []
+
+
+#  Show creation
+#  ----------------------------------------------------------------
+
+def create_show(client, venue_id, artist_id, start, minutes=120):
+    return client.post('/shows/create', data={
+        'venue_id': venue_id,
+        'artist_id': artist_id,
+        'start_time': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'duration': minutes,
+    }).get_data(as_text=True)
+
+
+def test_create_show_rejects_double_booking(client, booked):
+    from models import Show
+    venue_id, artist_id, _ = booked
+    page = create_show(client, venue_id, artist_id, EVENING + timedelta(hours=1))
+    assert 'the venue is already booked at that time' in page
+    assert Show.query.count() == 1
+
+
+def test_create_show_accepts_back_to_back(client, booked):
+    from models import Show
+    venue_id, artist_id, _ = booked
+    page = create_show(client, venue_id, artist_id, EVENING + TWO_HOURS)
+    assert 'Show was successfully listed!' in page
+    assert Show.query.count() == 2
+
+
+@pytest.mark.parametrize('minutes', [0, int(MAX_DURATION.total_seconds() // 60) + 1])
+def test_create_show_rejects_bad_durations(client, booked, minutes):
+    venue_id, artist_id, _ = booked
+    page = create_show(client, venue_id, artist_id, EVENING + timedelta(days=1), minutes)
+    assert 'Show could not be listed' in page
+
+
+@pytest.mark.parametrize('venue_id', ['', 'abc', '1.5', '0', str(2 ** 31)])
+def test_create_show_rejects_bad_ids(client, count_queries, booked, venue_id):
+    _, artist_id, _ = booked
+    with count_queries() as statements:
+        page = create_show(client, venue_id, artist_id, EVENING + timedelta(days=1))
+    assert 'Show could not be listed' in page
+    assert statements == []
+
+
+#  Availability API
+#  ----------------------------------------------------------------
+
+def slot(venue_id, artist_id, start, **extra):
+    return dict(venue_id=venue_id, artist_id=artist_id, start_time=start.isoformat(), **extra)
+
+
+def test_availability_answers_in_one_query(client, count_queries, booked):
+    venue_id, artist_id, _ = booked
+    # Back-to-back two-hour slots from 16:00 to midnight.
+    slots = [slot(venue_id, artist_id, EVENING + timedelta(hours=hour)) for hour in (-4, -2, 0, 2)]
+    with count_queries() as statements:
+        response = client.post('/api/v1/shows/availability', json={'slots': slots})
+    assert response.status_code == 200
+    assert len(statements) == 1
+    assert [item['available'] for item in response.get_json()['data']] == [True, True, False, True]
+
+
+def test_availability_takes_offsets_as_local_time(client, booked):
+    venue_id, artist_id, _ = booked
+    # Shows are stored in local time, whatever zone the tests run in.
+    inside = (EVENING + timedelta(minutes=30)).astimezone()
+    after = (EVENING + TWO_HOURS).astimezone(timezone.utc)
+    slots = [slot(venue_id, artist_id, inside, duration=60), slot(venue_id, artist_id, after)]
+    response = client.post('/api/v1/shows/availability', json={'slots': slots})
+    assert response.status_code == 200
+    assert [item['available'] for item in response.get_json()['data']] == [False, True]
+
+
+@pytest.mark.parametrize('body', [
+    None,
+    {'slots': 'none'},
+    {'slots': [{'venue_id': 1, 'artist_id': 1}]},
+    {'slots': [slot(1, 1, EVENING, duration=0)]},
+    {'slots': [slot(1, 1, EVENING, duration=int(MAX_DURATION.total_seconds() // 60) + 1)]},
+])
+def test_availability_rejects_bad_slots(client, body):
+    assert client.post('/api/v1/shows/availability', json=body).status_code == 400
+
+
+def test_availability_caps_the_batch(app, client):
+    limit = app.config['AVAILABILITY_MAX_SLOTS']
+    slots = [slot(1, 1, EVENING + timedelta(days=day)) for day in range(limit + 1)]
+    assert client.post('/api/v1/shows/availability', json={'slots': slots}).status_code == 400
+    assert client.post('/api/v1/shows/availability', json={'slots': slots[:limit]}).status_code == 200
@@ -0,0 +1,60 @@
+import pytest
+
+import search
+from search import TrigramIndex
+
+NAMES = ['The Musical Hop', 'Park Square Live Music & Coffee', 'The Dueling Pianos Bar',
+         'Hop', 'Hopscotch', 'Bar Hop Lounge', 'Shopfront']
+
+
+@pytest.fixture
+def index():
+    index = TrigramIndex()
+    index.load(enumerate(NAMES))
+    return index
+
+
+def names(result):
+    return [name for _, name in result[1]]
+
+
+@pytest.mark.parametrize('term, expected', [
+    # Exact, prefix, word start, then anywhere.
+    ('hop', ['Hop', 'Hopscotch', 'Bar Hop Lounge', 'The Musical Hop', 'Shopfront']),
+    ('HOP ', ['Hop', 'Hopscotch', 'Bar Hop Lounge', 'The Musical Hop', 'Shopfront']),
+    ('music', ['The Musical Hop', 'Park Square Live Music & Coffee']),
+    ('ho', ['Hop', 'Hopscotch', 'Bar Hop Lounge', 'The Musical Hop', 'Shopfront']),
+    ('q', ['Park Square Live Music & Coffee']),
+    ('nothing', []),
+])
+def test_ranked_matches(index, term, expected):
+    assert index.search(term) == (len(expected), [(NAMES.index(name), name) for name in expected])
+
+
+def test_pages(index):
+    assert names(index.search('hop', offset=1, limit=2)) == ['Hopscotch', 'Bar Hop Lounge']
+    assert index.search('', limit=3)[0] == len(NAMES)
+
+
+def test_writes_are_searchable(index):
+    index.add(3, 'Hip')
+    index.add(10, 'Hop House')
+    index.remove(4)
+    assert names(index.search('hop')) == ['Hop House', 'Bar Hop Lounge', 'The Musical Hop', 'Shopfront']
+    assert names(index.search('hi')) == ['Hip']
+    assert len(index) == len(NAMES)
+
+
+def test_broad_terms_stop_early(monkeypatch):
+    monkeypatch.setattr(search, 'CANDIDATES', 10)
+    monkeypatch.setattr(search, 'SCAN_LIMIT', 100)
+    index = TrigramIndex()
+    index.load((id, 'Venue %d' % id) for id in range(1000))
+    # Short terms count their own posting.
+    assert index.search('ue', limit=5)[0] == 1000
+    # Longer ones stop after CANDIDATES matches and estimate the rest.
+    total, page = index.search('venue', limit=5)
+    assert total == 1000
+    assert names((total, page)) == ['Venue 0', 'Venue 1', 'Venue 2', 'Venue 3', 'Venue 4']
+    # The page is ranked from the shortest names, not the whole table.
+    assert names(index.search('venue 99', limit=3)) == ['Venue 99', 'Venue 990', 'Venue 991']
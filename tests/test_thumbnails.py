@@ -0,0 +1,68 @@
+import io
+import sys
+
+import pytest
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(document.cookie)</script></svg>'
+
+
+class Stub(object):
+
+    def __init__(self, content_type, body):
+        self.content_type = content_type
+        self.body = body
+
+    def get(self, url, timeout, max_bytes):
+        return self.content_type, self.body
+
+
+def png():
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new('RGBA', (1600, 1200), (200, 30, 30, 255)).save(out, 'PNG')
+    return out.getvalue()
+
+
+@pytest.fixture
+def proxy(monkeypatch):
+    from extensions import thumbnails
+
+    def serving(content_type, body):
+        monkeypatch.setattr(thumbnails, 'client', Stub(content_type, body))
+        return thumbnails
+    yield serving
+    thumbnails.cache.clear()
+    thumbnails._failed.clear()
+
+
+def hero(client, make_venue):
+    venue = make_venue(image_link='https://images.example.com/hall')
+    return client.get('/img/venue/%d/hero' % venue.id)
+
+
+def test_raster_images_are_reencoded(client, make_venue, proxy):
+    from PIL import Image
+    proxy('image/png', png())
+    response = hero(client, make_venue)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert Image.open(io.BytesIO(response.data)).size == (667, 500)
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+    assert response.headers['Content-Security-Policy'] == "default-src 'none'; sandbox"
+
+
+@pytest.mark.parametrize('content_type, body', [
+    ('image/svg+xml', SVG),
+    ('text/html', SVG),
+    # Claims to be a PNG; Pillow is only asked for PNG.
+    ('image/png', SVG),
+])
+def test_other_content_is_never_served(client, make_venue, proxy, content_type, body):
+    proxy(content_type, body)
+    assert hero(client, make_venue).status_code == 404
+
+
+def test_without_pillow_nothing_is_served(client, make_venue, proxy, monkeypatch):
+    proxy('image/png', png())
+    monkeypatch.setitem(sys.modules, 'PIL', None)
+    assert hero(client, make_venue).status_code == 404
@@ -0,0 +1,56 @@
+import re
+import statistics
+import time
+
+import pytest
+
+VENUES = 50000
+SHOWS = 500000
+REQUESTS = 20
+# Generous, so a slow CI machine passes; a listing that counted shows per
+# venue at this size takes seconds.
+BUDGET_MS = 250
+
+
+@pytest.mark.slow
+def test_venues_listing_at_scale(app, client, count_queries):
+    # CLI-only; see init_cli() in app.py.
+    import datagen  # noqa: F401
+    from models import db, Show, Venue, counter_watermark
+
+    result = app.test_cli_runner().invoke(args=[
+        'fyyur', 'generate', '--venues', str(VENUES), '--artists', str(VENUES // 10), '--shows', str(SHOWS),
+    ])
+    assert result.exit_code == 0, result.output
+    assert db.session.query(db.func.count(Show.id)).scalar() == SHOWS
+
+    # The conditional GET validators, the page of venues and the genre facet,
+    # however many venues and shows there are.
+    with count_queries() as statements:
+        response = client.get('/venues')
+    assert response.status_code == 200
+    assert len(statements) == 3
+
+    cursor = re.search(r'after=([\w-]+)', response.get_data(as_text=True)).group(1)
+    with count_queries() as statements:
+        assert client.get('/venues?after=' + cursor).status_code == 200
+    assert len(statements) == 3
+
+    timings = []
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        client.get('/venues')
+        timings.append((time.perf_counter() - started) * 1000)
+    median = statistics.median(timings)
+    print('GET /venues over %d venues and %d shows: p50 %.1f ms' % (VENUES, SHOWS, median))
+    assert median < BUDGET_MS
+
+    # The counters the page shows agree with counting its venues' shows.
+    ids = [int(id) for id in re.findall(r'href="/venues/(\d+)"', response.get_data(as_text=True))]
+    assert ids
+    rolled_over_at = db.session.query(counter_watermark.c.rolled_over_at).scalar()
+    counted = dict(db.session.query(Show.venue_id, db.func.count(Show.id)).filter(
+        Show.venue_id.in_(ids), Show.start_time > rolled_over_at
+    ).group_by(Show.venue_id).all())
+    stored = dict(db.session.query(Venue.id, Venue.upcoming_shows_count).filter(Venue.id.in_(ids)).all())
+    assert stored == {id: counted.get(id, 0) for id in ids}
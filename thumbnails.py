@@ -0,0 +1,300 @@
+#----------------------------------------------------------------------------#
+# Image proxy.
+#
+#   /img/<kind>/<id>/<size>?v=<version>
+#
+# Serves the image link of a venue or artist resized to one of IMAGE_SIZES,
+# so a page of show tiles no longer pulls every full-size original from the
+# image host. A miss fetches the source once and stores every size of it.
+# Images are kept in a content-addressed cache on disk: blobs/ holds one file
+# per distinct image, named by its SHA-256; refs/ maps a (link, size) key to
+# a blob. The cache is capped at IMAGE_CACHE_MAX_BYTES; reads bump a blob's
+# mtime, and pruning removes the least recently used blobs first. Templates
+# ask for image_url(kind, id, link, size), whose version is a hash of the
+# link: a changed link gets a new URL, so responses for the current version
+# can be cached by browsers for a year.
+#
+# Fetching goes through `client`, anything with the HTTPClient interface;
+# pass one to Thumbnails() or set IMAGE_HTTP_CLIENT to fetch from elsewhere,
+# e.g. a local stub server; the default one only reaches public addresses
+# (see outbound.py). A link that cannot be fetched answers 404.
+#
+# Only raster images are proxied, and every one is decoded and re-encoded as
+# JPEG by Pillow before it is stored; nothing from the image host reaches a
+# browser as fetched. An SVG would run its scripts on this origin. Without
+# Pillow every image answers 404.
+#----------------------------------------------------------------------------#
+
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import urllib.request
+
+from flask import abort, current_app, request, send_file, url_for
+
+from cache import LRUCache
+from database import read_only
+from outbound import open_public
+
+log = logging.getLogger('fyyur.thumbnails')
+
+ONE_YEAR = 365 * 24 * 3600
+RASTER_TYPES = {'image/jpeg': 'JPEG', 'image/png': 'PNG', 'image/gif': 'GIF', 'image/webp': 'WEBP'}
+# Proxied images are never documents.
+SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'Content-Security-Policy': "default-src 'none'; sandbox",
+}
+
+
+class FetchError(Exception):
+    pass
+
+
+class HTTPClient(object):
+
+    def __init__(self, user_agent='fyyur'):
+        self.user_agent = user_agent
+
+    def get(self, url, timeout, max_bytes):
+        # (content type, body) of `url`, or FetchError.
+        try:
+            request = urllib.request.Request(url, headers={'User-Agent': self.user_agent})
+            with open_public(request, timeout) as response:
+                body = response.read(max_bytes + 1)
+                content_type = response.headers.get_content_type()
+        except (OSError, ValueError) as error:
+            raise FetchError(str(error))
+        if len(body) > max_bytes:
+            raise FetchError('larger than %d bytes' % max_bytes)
+        return content_type, body
+
+
+def resize(body, content_type, box):
+    # The image scaled down to fit in `box`, as JPEG. Pillow's draft mode lets
+    # large JPEGs decode at a fraction of their size.
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise FetchError('Pillow is not installed')
+    image = Image.open(io.BytesIO(body), formats=[RASTER_TYPES[content_type]])
+    image.draft('RGB', box)
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(box, Image.LANCZOS)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=85, optimize=True, progressive=True)
+    return out.getvalue(), 'image/jpeg'
+
+
+class ImageCache(object):
+
+    def __init__(self, directory, max_bytes, prune_to=0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.prune_to = prune_to
+        self.evictions = 0
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'refs'), exist_ok=True)
+
+    def _ref_path(self, key):
+        return os.path.join(self.directory, 'refs', hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, 'blobs', digest)
+
+    def get(self, key):
+        # (digest, content type, open file) stored under `key`, or None. The
+        # file is opened here so a prune in the meantime cannot take it away.
+        try:
+            with open(self._ref_path(key)) as f:
+                digest, content_type = f.read().split()
+        except (OSError, ValueError):
+            return None
+        path = self._blob_path(digest)
+        try:
+            blob = open(path, 'rb')
+        except OSError:
+            # Evicted; the ref goes with the next prune.
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return digest, content_type, blob
+
+    def put(self, key, body, content_type):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            self._write(path, body)
+            with self._lock:
+                if self._size is not None:
+                    self._size += len(body)
+        self._write(self._ref_path(key), ('%s %s' % (digest, content_type)).encode('ascii'))
+        if self._size is None or self._size > self.max_bytes:
+            self.prune()
+        return digest, content_type, io.BytesIO(body)
+
+    def _write(self, path, data):
+        # Written aside and renamed, so readers never see half a file.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            self._remove(tmp)
+            raise
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def prune(self):
+        # Drops least recently used blobs until the cache is under prune_to of
+        # its cap, then the refs left pointing at nothing. Other processes
+        # share the directory, so the size is recounted from disk each time.
+        blobs = []
+        for entry in os.scandir(os.path.join(self.directory, 'blobs')):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(blob_size for _, blob_size, _ in blobs)
+        evicted = 0
+        if size > self.max_bytes:
+            blobs.sort()
+            for _, blob_size, path in blobs:
+                if size <= self.max_bytes * self.prune_to:
+                    break
+                self._remove(path)
+                size -= blob_size
+                evicted += 1
+        if evicted:
+            for entry in os.scandir(os.path.join(self.directory, 'refs')):
+                try:
+                    with open(entry.path) as f:
+                        digest = f.read().split()[0]
+                except (OSError, IndexError):
+                    continue
+                if not os.path.exists(self._blob_path(digest)):
+                    self._remove(entry.path)
+        with self._lock:
+            self._size = size
+            self.evictions += evicted
+
+    def clear(self):
+        for folder in ('refs', 'blobs'):
+            for entry in os.scandir(os.path.join(self.directory, folder)):
+                self._remove(entry.path)
+        with self._lock:
+            self._size = 0
+
+
+class Thumbnails(object):
+
+    def __init__(self, app=None, client=None):
+        self.client = client
+        self.cache = None
+        self.hits = 0
+        self.misses = 0
+        # Links whose fetch failed lately are not tried again on every request.
+        self._failed = LRUCache(1024)
+        # One fetch per link at a time in this process.
+        self._locks = [threading.Lock() for _ in range(64)]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sizes = app.config.get('IMAGE_SIZES', {'tile': (360, 240), 'hero': (720, 500)})
+        self.timeout = app.config.get('IMAGE_FETCH_TIMEOUT', 10)
+        self.max_bytes = app.config.get('IMAGE_FETCH_MAX_BYTES', 10 * 1024 * 1024)
+        self.retry_after = app.config.get('IMAGE_RETRY_AFTER', 300)
+        self.client = self.client or app.config.get('IMAGE_HTTP_CLIENT') or HTTPClient()
+        self.cache = ImageCache(app.config['IMAGE_CACHE_DIR'], app.config.get('IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+        app.add_url_rule('/img/<kind>/<int:id>/<size>', 'thumbnail', self.serve)
+        app.jinja_env.globals.update(image_url=self.url)
+
+    def url(self, kind, id, link, size):
+        if not link:
+            return link
+        return url_for('thumbnail', kind=kind, id=id, size=size, v=self.version(link))
+
+    @staticmethod
+    def version(link):
+        return hashlib.sha1(link.encode('utf-8')).hexdigest()[:10]
+
+    def key(self, link, size):
+        # The box is part of the key, so resized sizes are fetched again.
+        width, height = self.sizes[size]
+        return '%s\n%s\n%dx%d' % (link, size, width, height)
+
+    def thumbnail(self, link, size):
+        # (digest, content type, file) of `link` at `size`, fetching and
+        # resizing it on a miss; None when it could not be fetched.
+        entry = self.cache.get(self.key(link, size))
+        if entry is not None:
+            self.hits += 1
+            return entry
+        with self._locks[hash(link) % len(self._locks)]:
+            entry = self.cache.get(self.key(link, size))
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            if self._failed.get(link):
+                return None
+            try:
+                content_type, body = self.client.get(link, self.timeout, self.max_bytes)
+                if content_type not in RASTER_TYPES:
+                    raise FetchError('%s is not a raster image' % content_type)
+                for name, box in self.sizes.items():
+                    thumbnail, thumbnail_type = resize(body, content_type, box)
+                    stored = self.cache.put(self.key(link, name), thumbnail, thumbnail_type)
+                    if name == size:
+                        entry = stored
+            except Exception as error:
+                # Pillow raises all sorts on a broken image.
+                log.warning('Could not make thumbnails of %s: %s', link, error)
+                self._failed.set(link, True, self.retry_after)
+                return None
+            return entry
+
+    @read_only
+    def serve(self, kind, id, size):
+        from models import db, Artist, Venue
+        model = {'venue': Venue, 'artist': Artist}.get(kind)
+        if model is None or size not in self.sizes:
+            abort(404)
+        link = db.session.query(model.image_link).filter(model.id == id).scalar()
+        if not link:
+            abort(404)
+        entry = self.thumbnail(link, size)
+        if entry is None:
+            # Not a redirect to the link, which would make this an open one.
+            abort(404)
+        digest, content_type, image = entry
+        if content_type != 'image/jpeg':
+            # Stored before every image was re-encoded.
+            image.close()
+            abort(404)
+        current = request.args.get('v') == self.version(link)
+        response = send_file(image, mimetype=content_type, etag=digest, conditional=True,
+                             max_age=ONE_YEAR if current else current_app.config.get('IMAGE_MAX_AGE', 300))
+        response.cache_control.public = True
+        if current:
+            response.cache_control.immutable = True
+        response.headers.update(SECURITY_HEADERS)
+        return response
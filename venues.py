@@ -0,0 +1,311 @@
+#----------------------------------------------------------------------------#
+# Venue pages.
+#
+# The form classes are imported inside the views that use them, so workers
+# that only serve listings never load WTForms.
+#----------------------------------------------------------------------------#
+
+import itertools
+from datetime import datetime
+
+from flask import Blueprint, abort, current_app, flash, jsonify, redirect, render_template, request, url_for
+
+from conditional import conditional
+from database import read_only
+from extensions import view_cache
+from geo import locate, nearest
+from helpers import (detail_validators, filter_by_genre, genre_facet, genre_names, genres_named,
+                     listing_validators, match_profile, partition_shows, queue_image_check, queue_match_refresh,
+                     ranked_matches, search_response, show_calendar, upcoming_show_counts)
+from models import db, Artist, Show, Venue, venue_genres, venue_matches, venue_search
+from pagination import decode_cursor, keyset_page
+
+venue_pages = Blueprint('venues', __name__)
+
+
+def fill_venue(venue, form):
+    venue.name = form.name.data
+    venue.city = form.city.data
+    venue.state = form.state.data
+    venue.address = form.address.data
+    venue.latitude, venue.longitude, venue.geocell = locate(venue.city, venue.state)
+    venue.phone = form.phone.data
+    if venue.image_link != form.image_link.data:
+        venue.image_link_ok = None
+    venue.image_link = form.image_link.data
+    venue.facebook_link = form.facebook_link.data
+    venue.genres = genres_named(form.genres.data)
+    venue.website = form.website_link.data
+    venue.seeking_talent = form.seeking_talent.data
+    venue.seeking_description = form.seeking_description.data
+    # Genres live in the association table; bump the row so validators see them.
+    venue.updated_at = datetime.utcnow()
+
+
+def area_tag(state, city):
+    return 'area:%s:%s' % (state, city)
+
+
+def invalidate_area(state, city):
+    # A venue joined this area. If it is the area's first venue, no cached page
+    # is tagged with it yet, so every venues listing page is invalidated.
+    if Venue.query.filter_by(state=state, city=city).limit(2).count() == 1:
+        view_cache.invalidate('venues')
+    else:
+        view_cache.invalidate(area_tag(state, city))
+
+
+#  Listing
+#  ----------------------------------------------------------------
+
+@venue_pages.route('/venues')
+@read_only
+@conditional(lambda: listing_validators(Venue))
+@view_cache.cached
+def venues():
+    # Upcoming shows come from the materialized counter; see counters.py.
+    query = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name, Venue.upcoming_shows_count)
+    genre = request.args.get('genre')
+    if genre:
+        query = filter_by_genre(query, Venue.id, venue_genres.c.venue_id, genre)
+    columns = (Venue.state, Venue.city, Venue.id)
+    rows, next_cursor = keyset_page(query, columns, key=lambda row: (row[1], row[0], row[2]))
+
+    # A page changes when a venue is added to an area it shows, including the
+    # area its cursor points into (the new venue may land at the top).
+    view_cache.tag('venues', 'genres:venues', *(area_tag(row[1], row[0]) for row in rows))
+    view_cache.tag(*('venue:%d' % row[2] for row in rows))
+    if request.args.get('after'):
+        state, city, _ = decode_cursor(request.args['after'], columns)
+        view_cache.tag(area_tag(state, city))
+
+    data = []
+    for (city, state), group in itertools.groupby(rows, key=lambda row: (row[0], row[1])):
+        data.append({
+            "city": city,
+            "state": state,
+            "venues": [{
+                "id": venue_id,
+                "name": name,
+                "num_upcoming_shows": num_upcoming_shows,
+            } for _, _, venue_id, name, num_upcoming_shows in group]
+        })
+    genres = genre_facet(venue_genres, venue_genres.c.venue_id)
+    return render_template('pages/venues.html', areas=data, genres=genres, next_cursor=next_cursor)
+
+
+@venue_pages.route('/venues/search', methods=['POST'])
+@read_only
+def search_venues():
+    # case-insensitive partial match, ranked and paginated; see search.py
+    response = search_response(venue_search, Venue)
+    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+
+
+@venue_pages.route('/venues/nearby')
+@read_only
+def nearby_venues():
+    # venues within ?radius= miles of ?lat=&lng=, or of the centre of
+    # ?city=&state=, nearest first; see geo.py
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lng', type=float)
+    if latitude is None or longitude is None:
+        latitude, longitude, _ = locate(request.args.get('city'), request.args.get('state'))
+        if latitude is None:
+            abort(400)
+    radius = request.args.get('radius', current_app.config['NEARBY_DEFAULT_RADIUS'], type=float)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and
+            0 < radius <= current_app.config['NEARBY_MAX_RADIUS']):
+        abort(400)
+    count, matches = nearest(db, Venue, latitude, longitude, radius, current_app.config['NEARBY_RESULTS'])
+    ids = [id for id, _ in matches]
+    venues = {row.id: row for row in db.session.query(
+        Venue.id, Venue.name, Venue.city, Venue.state
+    ).filter(Venue.id.in_(ids))} if ids else {}
+    upcoming = upcoming_show_counts(Venue, ids)
+    results = {
+        "count": count,
+        "radius": radius,
+        "data": [{
+            "id": id,
+            "name": venues[id].name,
+            "city": venues[id].city,
+            "state": venues[id].state,
+            "distance": distance,
+            "num_upcoming_shows": upcoming.get(id, 0),
+        } for id, distance in matches]
+    }
+    return render_template('pages/nearby_venues.html', results=results)
+
+
+@venue_pages.route('/venues/<int:venue_id>')
+@read_only
+@conditional(lambda venue_id: detail_validators(Venue, venue_id, Show.venue_id, Artist, Show.artist_id,
+                                                (venue_matches.c.venue_id, venue_matches.c.artist_id)))
+@view_cache.cached
+def show_venue(venue_id):
+    # shows the venue page with the given venue_id
+    now = datetime.now()
+    venue = Venue.query.options(db.joinedload(Venue.genres)).filter(Venue.id == venue_id).first()
+    if venue is None:
+        abort(404)
+    # The page lists every show, so its counts are exact as of now rather than
+    # as of the counters' last roll-over.
+    past_shows, upcoming_shows = partition_shows(Show.venue_id, venue_id, Show.artist, now)
+    view_cache.tag('venue:%d' % venue_id, *('artist:%d' % show.artist_id for show in past_shows + upcoming_shows))
+    matches = ranked_matches(venue_matches, venue_matches.c.venue_id, Artist, venue_matches.c.artist_id, venue_id)
+    view_cache.tag(*('artist:%d' % id for id, _, _ in matches))
+
+    def artist_show(show):
+        return {
+            "artist_id": show.artist_id,
+            "artist_name": show.artist.name,
+            "artist_image_link": show.artist.image_link,
+            "start_time": show.start_time,
+        }
+
+    data = {
+        "id": venue.id,
+        "name": venue.name,
+        "genres": genre_names(venue.genres),
+        "address": venue.address,
+        "city": venue.city,
+        "state": venue.state,
+        "phone": venue.phone,
+        "website": venue.website,
+        "facebook_link": venue.facebook_link,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
+        "image_link": venue.image_link,
+        "past_shows": [artist_show(show) for show in past_shows],
+        "upcoming_shows": [artist_show(show) for show in upcoming_shows],
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
+        "matches": [{
+            "artist_id": id,
+            "artist_name": name,
+            "artist_image_link": image_link,
+        } for id, name, image_link in matches],
+    }
+    return render_template('pages/show_venue.html', venue=data)
+
+
+@venue_pages.route('/venues/<int:venue_id>/calendar.ics')
+@read_only
+@conditional(lambda venue_id: detail_validators(Venue, venue_id, Show.venue_id, Artist, Show.artist_id))
+def venue_calendar(venue_id):
+    # upcoming shows as an iCalendar feed for calendar apps to subscribe to;
+    # their polls mostly end in a 304 from the validators
+    name = db.session.query(Venue.name).filter(Venue.id == venue_id).scalar()
+    if name is None:
+        abort(404)
+    return show_calendar('Upcoming shows at %s' % name, Show.venue_id, venue_id)
+
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+@venue_pages.route('/venues/create', methods=['GET'])
+def create_venue_form():
+    from forms import VenueForm
+    form = VenueForm()
+    return render_template('forms/new_venue.html', form=form)
+
+
+@venue_pages.route('/venues/create', methods=['POST'])
+def create_venue_submission():
+    from forms import VenueForm
+    form = VenueForm(request.form)
+    if not form.validate():
+        flash('An error occurred. Venue ' + request.form.get('name', '') + ' could not be listed.')
+        return render_template('forms/new_venue.html', form=form)
+    error = False
+    try:
+        venue = Venue()
+        fill_venue(venue, form)
+        db.session.add(venue)
+        db.session.commit()
+        invalidate_area(venue.state, venue.city)
+        view_cache.invalidate('genres:venues')
+        queue_image_check('venue', venue)
+        if venue.seeking_talent:
+            queue_match_refresh('venue', venue.id, venue.updated_at.isoformat())
+    except Exception:
+        error = True
+        db.session.rollback()
+        current_app.logger.exception('Could not create venue')
+    finally:
+        db.session.close()
+    if error:
+        flash('An error occurred. Venue ' + form.name.data + ' could not be listed.')
+    else:
+        flash('Venue ' + form.name.data + ' was successfully listed!')
+    return render_template('pages/home.html')
+
+
+@venue_pages.route('/venues/<venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+    venue = Venue.query.get_or_404(venue_id)
+    # Only venues seeking talent are on anyone's match list.
+    seeking_talent = venue.seeking_talent
+    error = False
+    try:
+        db.session.delete(venue)
+        db.session.commit()
+        view_cache.invalidate('venue:%s' % venue_id, 'genres:venues')
+        if seeking_talent:
+            queue_match_refresh('venue', int(venue_id), 'deleted')
+    except Exception:
+        error = True
+        db.session.rollback()
+        current_app.logger.exception('Could not delete venue %s', venue_id)
+    finally:
+        db.session.close()
+    return jsonify({'success': not error}), 500 if error else 200
+
+
+#  Update
+#  ----------------------------------------------------------------
+
+@venue_pages.route('/venues/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+    from forms import VenueForm
+    venue = Venue.query.get_or_404(venue_id)
+    form = VenueForm(obj=venue)
+    form.genres.data = genre_names(venue.genres)
+    form.website_link.data = venue.website
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+
+@venue_pages.route('/venues/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+    from forms import VenueForm
+    venue = Venue.query.get_or_404(venue_id)
+    form = VenueForm(request.form)
+    if not form.validate():
+        flash('An error occurred. Venue ' + venue.name + ' could not be updated.')
+        return render_template('forms/edit_venue.html', form=form, venue=venue)
+    area = (venue.state, venue.city)
+    genres = genre_names(venue.genres)
+    image_link = venue.image_link
+    profile = match_profile(venue, venue.seeking_talent)
+    try:
+        fill_venue(venue, form)
+        db.session.commit()
+        view_cache.invalidate('venue:%d' % venue_id)
+        if genre_names(venue.genres) != genres:
+            view_cache.invalidate('genres:venues')
+        if (venue.state, venue.city) != area:
+            invalidate_area(venue.state, venue.city)
+        if venue.image_link != image_link:
+            queue_image_check('venue', venue)
+        if match_profile(venue, venue.seeking_talent) != profile:
+            queue_match_refresh('venue', venue_id, venue.updated_at.isoformat())
+        flash('Venue ' + form.name.data + ' was successfully updated!')
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Could not update venue %s', venue_id)
+        flash('An error occurred. Venue ' + form.name.data + ' could not be updated.')
+    finally:
+        db.session.close()
+    return redirect(url_for('.show_venue', venue_id=venue_id))